@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Times the Kubernetes manifest checker on a large generated manifest set
+
+The set mixes Deployments, CronJobs, Ingresses, Services and ConfigMaps, a
+tenth of which violate a rule; loading the YAML and running the rules are
+timed separately.
+"""
+import argparse
+import time
+
+import yaml
+
+from compose_flow.kube.checks import ManifestChecker, YAML_LOADER
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--count', type=int, default=5000, help='the number of documents to check')
+
+args = parser.parse_args()
+
+
+def get_container(idx: int) -> dict:
+    container = {'name': f'app-{idx}', 'image': 'app:1.0'}
+
+    # every tenth workload is missing its resources
+    if idx % 10:
+        container['resources'] = {
+            'limits': {'cpu': '1', 'memory': '1Gi'},
+            'requests': {'cpu': '100m', 'memory': '512Mi'},
+        }
+
+    return container
+
+
+def get_document(idx: int) -> dict:
+    kind = ('Deployment', 'CronJob', 'Ingress', 'Service', 'ConfigMap')[idx % 5]
+    metadata = {'name': f'{kind.lower()}-{idx}', 'namespace': 'default'}
+
+    pod_template = {'spec': {'containers': [get_container(idx)]}}
+
+    if kind == 'Deployment':
+        spec = {'replicas': 2, 'template': pod_template}
+    elif kind == 'CronJob':
+        spec = {'schedule': '* * * * *', 'jobTemplate': {'spec': {'template': pod_template}}}
+    elif kind == 'Ingress':
+        scheme = 'internal' if idx % 10 else 'unknown'
+        metadata['annotations'] = {'zalando.org/aws-load-balancer-scheme': scheme}
+        spec = {'rules': [{'host': f'app-{idx}.example.com'}]}
+    elif kind == 'Service':
+        spec = {'ports': [{'port': 80}]}
+    else:
+        return {'kind': kind, 'metadata': metadata, 'data': {'key': 'value'}}
+
+    return {'kind': kind, 'metadata': metadata, 'spec': spec}
+
+
+rendered = yaml.dump_all([get_document(x) for x in range(args.count)])
+
+checker = ManifestChecker()
+
+start = time.perf_counter()
+documents = checker._load_rendered_yaml(rendered)
+load_duration = time.perf_counter() - start
+
+# run the rules without loading the YAML again
+checker._load_rendered_yaml = lambda x: documents
+
+start = time.perf_counter()
+errors = checker.check(rendered)
+check_duration = time.perf_counter() - start
+
+print(f'documents: {len(documents)}, violations: {len(errors)}, loader: {YAML_LOADER.__name__}')
+print(f'load:  {load_duration * 1000:8.1f} ms')
+print(f'check: {check_duration * 1000:8.1f} ms')
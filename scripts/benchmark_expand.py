@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Times expanding a service into many replicas
+
+Compares the copy-on-write expansion in Profile.cf_config_expand against
+deep copying the service for every replica, and times dumping the
+expanded services to YAML.
+"""
+import argparse
+import copy
+import time
+import tracemalloc
+
+from unittest import mock
+
+from compose_flow.commands.subcommands.profile import INCREMENT_HANDLERS, Profile
+from compose_flow.utils import yaml_dump
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--replicas', type=int, default=500, help='the number of replicas to expand to')
+
+args = parser.parse_args()
+
+
+def get_data() -> dict:
+    service = {
+        'image': 'worker:1.0',
+        'command': ['worker', '--concurrency', '4'],
+        'environment': [f'SETTING_{x}=value-{x}' for x in range(50)] + ['WORKER_PORT=8000'],
+        'ports': ['8000:8000'],
+        'labels': {'worker.id': '0'},
+        'volumes': ['data:/data'],
+        'hostname': 'worker',
+        'deploy': {
+            'replicas': args.replicas,
+            'placement': {'constraints': ['node.role == worker']},
+            'resources': {'limits': {'cpus': '1', 'memory': '1G'}},
+        },
+    }
+
+    return {
+        'services': {'worker': service},
+        'volumes': {'data': {'driver': 'local'}},
+        'compose_flow': {
+            'expand': {
+                'worker': {
+                    'increment': {
+                        'env': ['WORKER_PORT'],
+                        'ports': {'source_port': True},
+                        'labels': ['worker.id'],
+                        'volumes': ['data'],
+                        'hostname': True,
+                    }
+                }
+            }
+        },
+    }
+
+
+def expand_deepcopy(data: dict) -> None:
+    """
+    The expansion as it was done before, with a deep copy of the service for every replica
+    """
+    for service_name, config in data['compose_flow']['expand'].items():
+        base_service = data['services'].pop(service_name)
+
+        for idx in range(base_service['deploy']['replicas']):
+            service = copy.deepcopy(base_service)
+            service['deploy'].pop('replicas')
+
+            for name, increment_config in config['increment'].items():
+                service = INCREMENT_HANDLERS[name](increment_config, idx, service)
+
+            data['services'][f'{service_name}{idx + 1}'] = service
+
+
+def report(name: str, fn) -> None:
+    data = get_data()
+
+    start = time.perf_counter()
+    fn(data)
+    duration = time.perf_counter() - start
+
+    # measure the memory in a separate run, tracing allocations slows it down
+    data = get_data()
+
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{name:<10} {duration * 1000:8.1f} ms {peak / 1024 / 1024:8.1f} MiB peak')
+
+
+profile = Profile(mock.Mock())
+
+report('deepcopy', expand_deepcopy)
+report('shared', profile.cf_config_expand)
+
+data = get_data()
+profile.cf_config_expand(data)
+
+start = time.perf_counter()
+yaml_dump(data)
+print(f'{"dump":<10} {(time.perf_counter() - start) * 1000:8.1f} ms')
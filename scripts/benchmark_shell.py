@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Compares the per-command overhead of compose_flow.shell against `sh`
+
+Runs a trivial command repeatedly with each runner and prints the average
+wall and CPU time per command; `sh` is skipped when it's not installed.
+"""
+import argparse
+import os
+import shlex
+import time
+
+from compose_flow import shell
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--count', type=int, default=200, help='the number of commands to run')
+parser.add_argument('-j', '--jobs', type=int, default=shell.DEFAULT_JOBS)
+parser.add_argument('--command', default='true', help='the command to run')
+
+args = parser.parse_args()
+
+argv = shlex.split(args.command)
+
+
+def report(name: str, fn) -> None:
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    fn()
+
+    wall = (time.perf_counter() - wall_start) / args.count * 1000
+    cpu = (time.process_time() - cpu_start) / args.count * 1000
+
+    print(f'{name:<24} {wall:8.2f} ms wall {cpu:8.2f} ms cpu per command')
+
+
+def run_sh():
+    command = getattr(sh, argv[0])
+    for _ in range(args.count):
+        command(*argv[1:], _env=os.environ.copy())
+
+
+def run_shell():
+    for _ in range(args.count):
+        shell.execute(argv, os.environ)
+
+
+def run_shell_iter():
+    for _ in range(args.count):
+        list(shell.execute(argv, os.environ, _iter=True))
+
+
+def run_shell_many():
+    shell.execute_many([argv] * args.count, os.environ, jobs=args.jobs)
+
+
+try:
+    import sh
+except ImportError:
+    print('sh is not installed, skipping')
+else:
+    report('sh', run_sh)
+
+report('shell.execute', run_shell)
+report('shell.execute _iter', run_shell_iter)
+report(f'shell.execute_many -j{args.jobs}', run_shell_many)
@@ -0,0 +1,6 @@
+"""
+Allows running compose-flow with `python -m compose_flow`
+"""
+from .entrypoints import compose_flow
+
+compose_flow()
@@ -0,0 +1,369 @@
+"""
+Build cache module
+
+Computes a content hash for the build context of each service so that images
+whose context has not changed since they were last built can be reused
+instead of rebuilt.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+
+from . import cache, docker
+
+DEFAULT_DOCKERFILE = 'Dockerfile'
+
+DOCKERIGNORE_FILENAME = '.dockerignore'
+
+# build options other than the context, dockerfile and args that change the built image
+HASHED_BUILD_OPTIONS = ('target', 'cache_from', 'labels')
+
+FROM_RE = re.compile(r'^\s*FROM\s+(?:--\S+\s+)*(\S+)', re.I | re.M)
+
+VAR_RE = re.compile(r'\$(?:\{(\w+)\}|(\w+))')
+
+# size of the chunks that files are read in when hashing
+READ_SIZE = 1024 * 1024
+
+
+def get_base_images(build: dict) -> list:
+    """
+    Returns the images named in the `FROM` lines of a service's Dockerfile
+
+    Variables in the image names are substituted with the service's build args.
+    """
+    context = os.path.abspath(build.get('context', '.'))
+    dockerfile = build.get('dockerfile', DEFAULT_DOCKERFILE)
+
+    try:
+        with open(os.path.join(context, dockerfile), 'r') as fh:
+            content = fh.read()
+    except FileNotFoundError:
+        return []
+
+    build_args = dict(x.split('=', 1) for x in get_build_args(build) if '=' in x)
+
+    def substitute(match):
+        name = match.group(1) or match.group(2)
+
+        return build_args.get(name, match.group(0))
+
+    return [VAR_RE.sub(substitute, x) for x in FROM_RE.findall(content)]
+
+
+def get_build_args(build: dict, env: dict = None) -> list:
+    """
+    Returns the build args of a service's build config as sorted `KEY=value` strings
+
+    As with docker-compose, args given without a value take their value from
+    the environment; those not found in it are returned as just the name.
+    """
+    env = env or {}
+
+    args = build.get('args') or {}
+    if isinstance(args, dict):
+        args = [x if y is None else f'{x}={y}' for x, y in args.items()]
+
+    resolved = []
+    for arg in args:
+        if '=' not in arg and arg in env:
+            arg = f'{arg}={env[arg]}'
+
+        resolved.append(arg)
+
+    return sorted(resolved)
+
+
+def get_build_dependencies(services: dict) -> dict:
+    """
+    Returns the services that each service's image is built from
+
+    A service depends on another when its Dockerfile's `FROM` names the
+    other service's `image:`.
+
+    Returns:
+        dict mapping each service name to the set of service names it depends on
+    """
+    images = {}
+    for service_name, service_data in services.items():
+        image = service_data.get('image')
+        if image:
+            images[image] = service_name
+
+            # an untagged `FROM` refers to the `latest` tag
+            if image.endswith(':latest'):
+                images[image[:-len(':latest')]] = service_name
+
+    dependencies = {}
+    for service_name, service_data in services.items():
+        base_images = get_base_images(get_build_config(service_data))
+
+        dependencies[service_name] = set(
+            images[x] for x in base_images if images.get(x, service_name) != service_name
+        )
+
+    return dependencies
+
+
+def get_build_config(service_data: dict) -> dict:
+    """
+    Returns the build config of a service in its long form
+    """
+    build = service_data.get('build')
+    if isinstance(build, str):
+        build = {'context': build}
+
+    return build or {}
+
+
+def get_context_hash(build: dict, env: dict = None) -> str:
+    """
+    Returns a hash of everything that goes into building an image
+
+    This covers the Dockerfile, every file in the context that is not excluded
+    by the `.dockerignore` file, the build args, with the ones that have no
+    value resolved from the given environment, and the other build options
+    that change the image, such as the target stage.
+    """
+    context = os.path.abspath(build.get('context', '.'))
+    dockerfile = build.get('dockerfile', DEFAULT_DOCKERFILE)
+
+    hasher = hashlib.sha256()
+
+    for build_arg in get_build_args(build, env):
+        hasher.update(f'arg:{build_arg}\0'.encode('utf8'))
+
+    for option in HASHED_BUILD_OPTIONS:
+        value = json.dumps(build.get(option), sort_keys=True)
+
+        hasher.update(f'{option}:{value}\0'.encode('utf8'))
+
+    # the dockerfile is hashed even when it's excluded from the context
+    hasher.update(f'dockerfile:{dockerfile}\0'.encode('utf8'))
+    hash_file(hasher, os.path.join(context, dockerfile))
+
+    for path in get_context_files(context):
+        hasher.update(f'file:{path}\0'.encode('utf8'))
+        hash_file(hasher, os.path.join(context, path))
+
+    return hasher.hexdigest()
+
+
+def get_context_files(context: str) -> list:
+    """
+    Returns the paths, relative to the context, of the files sent to docker
+    """
+    patterns = load_dockerignore(context)
+
+    # when a pattern re-includes files, ignored directories cannot be skipped outright
+    has_exceptions = any(negated for _, negated in patterns)
+
+    paths = []
+
+    for root, dirs, files in os.walk(context):
+        relative_root = os.path.relpath(root, context)
+        if relative_root == '.':
+            relative_root = ''
+
+        dirs.sort()
+        if not has_exceptions:
+            dirs[:] = [
+                x for x in dirs if not is_ignored(os.path.join(relative_root, x), patterns)
+            ]
+
+        for filename in sorted(files):
+            path = os.path.join(relative_root, filename)
+            if not is_ignored(path, patterns):
+                paths.append(path)
+
+    return paths
+
+
+def get_changed_services(services: dict, hashes: dict, record_name: str, dry_run: bool = False) -> list:
+    """
+    Returns the services whose build context changed since they were last built
+
+    Services whose context is unchanged and whose last-built image is still
+    available locally are not rebuilt; instead the last-built image is tagged
+    with the service's current image name.
+
+    Args:
+        services: dict mapping service names to their compose data
+        hashes: dict mapping service names to their context hashes
+        record_name: the name of the cache entry that holds the build records
+        dry_run: log the tags instead of applying them
+    """
+    logger = logging.getLogger(__name__)
+
+    records = cache.read(record_name) or {}
+    local_images = None
+
+    changed = []
+
+    for service_name, service_data in sorted(services.items()):
+        record = records.get(service_name) or {}
+        if record.get('hash') != hashes[service_name]:
+            changed.append(service_name)
+
+            continue
+
+        # list the local images at most once, and only when needed
+        if local_images is None:
+            local_images = docker.get_local_images()
+
+        built_image = record.get('image')
+        if built_image not in local_images:
+            changed.append(service_name)
+
+            continue
+
+        image = service_data.get('image')
+        if image and image != built_image:
+            if dry_run:
+                logger.info(f'docker tag {built_image} {image}')
+            else:
+                docker.tag_image(built_image, image)
+
+        logger.info(f'{service_name} is unchanged, reusing {built_image}')
+
+    return changed
+
+
+def get_context_hashes(services: dict, env: dict = None) -> dict:
+    """
+    Returns a dict mapping the given services to their context hashes
+    """
+    return {
+        service_name: get_context_hash(get_build_config(service_data), env)
+        for service_name, service_data in services.items()
+    }
+
+
+def hash_file(hasher, path: str) -> None:
+    """
+    Updates the hasher with the content of the file at the given path
+    """
+    if os.path.islink(path):
+        hasher.update(f'link:{os.readlink(path)}\0'.encode('utf8'))
+
+        return
+
+    try:
+        hasher.update(f'mode:{os.stat(path).st_mode & 0o111}\0'.encode('utf8'))
+
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(READ_SIZE), b''):
+                hasher.update(chunk)
+    except FileNotFoundError:
+        hasher.update(b'missing\0')
+
+
+def is_ignored(path: str, patterns: list) -> bool:
+    """
+    Returns whether the path is excluded by the given `.dockerignore` patterns
+
+    As with docker, the last matching pattern wins.
+    """
+    ignored = False
+
+    for regex, negated in patterns:
+        if regex.match(path):
+            ignored = not negated
+
+    return ignored
+
+
+def load_dockerignore(context: str) -> list:
+    """
+    Returns the compiled patterns of the context's `.dockerignore` file
+
+    Returns:
+        list of tuples of the compiled pattern and whether it's an exception
+    """
+    patterns = []
+
+    try:
+        with open(os.path.join(context, DOCKERIGNORE_FILENAME), 'r') as fh:
+            lines = fh.read().splitlines()
+    except FileNotFoundError:
+        return patterns
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:].strip()
+
+        pattern = os.path.normpath(line).lstrip('/')
+        if pattern == '.':
+            continue
+
+        patterns.append((translate_pattern(pattern), negated))
+
+    return patterns
+
+
+def record_builds(record_name: str, services: dict, hashes: dict) -> None:
+    """
+    Records the hash and image of the given services after they are built
+    """
+    records = cache.read(record_name) or {}
+
+    for service_name, service_data in services.items():
+        records[service_name] = {
+            'hash': hashes[service_name],
+            'image': service_data.get('image'),
+        }
+
+    cache.write(record_name, records)
+
+
+def translate_pattern(pattern: str):
+    """
+    Compiles a `.dockerignore` pattern into a regular expression
+
+    A pattern that matches a directory also matches everything within it.
+    """
+    regex = ''
+    idx = 0
+
+    while idx < len(pattern):
+        char = pattern[idx]
+
+        if pattern.startswith('**/', idx):
+            # also matches no directory at all
+            regex += '(.*/)?'
+            idx += 3
+
+            continue
+        elif pattern.startswith('**', idx):
+            regex += '.*'
+            idx += 2
+
+            continue
+        elif char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = pattern.find(']', idx + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                char_class = pattern[idx + 1:end]
+                if char_class.startswith('^'):
+                    char_class = f'^{char_class[1:]}'
+
+                regex += f'[{char_class}]'
+                idx = end
+        else:
+            regex += re.escape(char)
+
+        idx += 1
+
+    return re.compile(f'^{regex}(/.*)?$', re.S)
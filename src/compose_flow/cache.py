@@ -0,0 +1,74 @@
+"""
+Cache module
+
+Stores JSON documents on disk under the compose-flow config root so that
+data that is expensive to look up can be reused across runs.
+"""
+import json
+import os
+import re
+import time
+
+from . import settings
+
+UNSAFE_CHARS_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def get_path(name: str) -> str:
+    """
+    Returns the path of the cache file for the given name
+    """
+    filename = UNSAFE_CHARS_RE.sub('-', name)
+
+    return os.path.join(settings.APP_CACHE_ROOT, f'{filename}.json')
+
+
+def read(name: str, ttl: float = None) -> [dict, list, None]:
+    """
+    Returns the cached data
+
+    Args:
+        name: the name of the cache entry
+        ttl: the number of seconds the entry is valid for; no expiration when None
+
+    Returns:
+        the cached data or None when it's not found or expired
+    """
+    try:
+        with open(get_path(name), 'r') as fh:
+            entry = json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+    if ttl is not None and time.time() - entry.get('timestamp', 0) > ttl:
+        return None
+
+    return entry.get('data')
+
+
+def remove(name: str) -> None:
+    """
+    Removes the cache entry if it exists
+    """
+    try:
+        os.remove(get_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def write(name: str, data: [dict, list]) -> None:
+    """
+    Writes the given data into the cache
+
+    The entry is written to a temporary file first and moved into place so
+    that concurrent compose-flow processes never see a partially written file.
+    """
+    path = get_path(name)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump({'timestamp': time.time(), 'data': data}, fh)
+
+    os.replace(tmp_path, path)
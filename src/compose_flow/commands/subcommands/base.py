@@ -3,7 +3,7 @@ import os
 
 from abc import ABC, abstractclassmethod
 
-from compose_flow import errors, shell
+from compose_flow import errors, fanout, shell
 from compose_flow.config import get_config
 from compose_flow.errors import (
     CommandError,
@@ -26,6 +26,9 @@ class BaseSubcommand(ABC):
     # profile checks only check environment by default
     profile_checks = ['check_env']
 
+    # whether this subcommand can run against multiple targets, e.g. `-e dev,prod`
+    multi_target_okay = False
+
     # whether this subcommand should connect to the remote host
     remote_action = True
 
@@ -38,6 +41,10 @@ class BaseSubcommand(ABC):
     # by default commands setup render a profile compose file
     setup_profile = True
 
+    # whether the rendered profile compose file is written into the working
+    # directory; commands that feed it to docker over stdin do not need it
+    write_profile = True
+
     # when creating a workflow environment, whether variables that reference
     # the project version should be updated (i.e. DOCKER_IMAGE)
     update_version_env_vars = False
@@ -52,7 +59,7 @@ class BaseSubcommand(ABC):
     def do_validate_profile(self):
         return True
 
-    def execute(self, command: str, **kwargs):
+    def execute(self, command: [str, list], **kwargs):
         """
         Executes the given command
         """
@@ -93,6 +100,26 @@ class BaseSubcommand(ABC):
         else:
             self.print_subcommand_help(self.__doc__, error=f'unknown action={action}')
 
+    def handle_targets(self, targets: list) -> [None, str]:
+        """
+        Runs this subcommand against each of the given targets concurrently
+        """
+        workflow = self.workflow
+        command = workflow.args.command
+
+        if not self.is_multi_target_okay():
+            raise errors.ErrorMessage(f'{command} cannot be run against multiple targets')
+
+        argv = fanout.strip_target_args(workflow.argv, command)
+
+        results = fanout.run_targets(
+            targets, argv, cwd=workflow.working_dir, jobs=workflow.args.jobs
+        )
+
+        failed = [x.target for x in results if x.returncode != 0]
+        if failed:
+            return f'\nError: failed targets: {", ".join(failed)}'
+
     def is_dirty_working_copy_okay(self, exc: Exception) -> bool:
         """
         Checks to see if the project's compose-flow.yml allows for the env to use a dirty working copy
@@ -131,6 +158,9 @@ class BaseSubcommand(ABC):
     def is_missing_profile_okay(self, exc):
         return False
 
+    def is_multi_target_okay(self) -> bool:
+        return self.multi_target_okay
+
     def is_not_connected_okay(self, exc):
         return False
 
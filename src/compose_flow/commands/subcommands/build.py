@@ -1,6 +1,11 @@
+import logging
 
 from functools import lru_cache
 
+from tabulate import tabulate
+
+from compose_flow import build_cache, errors, scheduler, shell
+
 from .base import BaseSubcommand
 
 
@@ -14,10 +19,94 @@ class Build(BaseSubcommand):
     remote_action = True
     update_version_env_vars = True
 
-    def build(self):
-        compose = self.compose
+    def build(self, services: list = None, pull: bool = True):
+        """
+        Builds the images of the given services, or all of them
+
+        Services whose build context is unchanged since their last build are
+        skipped, unless `--force` is given.  Images are built concurrently,
+        each one after the images it is built `FROM`.
+        """
+        args = self.workflow.args
+
+        build_services = self.get_build_services()
+        if services is not None:
+            build_services = {x: build_services[x] for x in services}
+
+        if not build_services:
+            self.compose.handle(extra_args=['build', '--pull'] if pull else ['build'])
+
+            return
+
+        hashes = build_cache.get_context_hashes(build_services, self.workflow.environment.data)
+        dependencies = build_cache.get_build_dependencies(build_services)
+
+        if args.force:
+            changed = sorted(build_services)
+        else:
+            changed = build_cache.get_changed_services(
+                build_services, hashes, self.build_record_name, dry_run=args.dry_run
+            )
+
+        # an image has to be rebuilt when an image it is built from is rebuilt
+        changed = scheduler.get_dependents(dependencies, changed)
+        if not changed:
+            self.logger.info('all images are up to date')
+
+            return
+
+        capture_output = len(changed) > 1
+
+        def build_service(service_name):
+            # images built from another service's image cannot pull their base
+            service_pull = pull and not dependencies[service_name]
+
+            return self.build_service(service_name, pull=service_pull, capture_output=capture_output)
+
+        results = scheduler.run(
+            {x: dependencies[x] for x in changed},
+            build_service,
+            jobs=args.build_jobs,
+            callback=self.print_build_result,
+        )
+
+        self.print_build_summary(results)
+
+        succeeded = [x for x, y in results.items() if y.status == scheduler.SUCCEEDED]
+        if succeeded and not args.dry_run:
+            build_cache.record_builds(
+                self.build_record_name,
+                {x: build_services[x] for x in succeeded},
+                hashes,
+            )
+
+        failed = sorted(x for x, y in results.items() if y.status != scheduler.SUCCEEDED)
+        if failed:
+            raise errors.BuildError(f'Error: unable to build {", ".join(failed)}')
+
+    @property
+    def build_record_name(self) -> str:
+        return f'builds-{self.workflow.config_name}'
+
+    def build_service(self, service_name: str, pull: bool = True, capture_output: bool = False) -> tuple:
+        """
+        Builds the image of a single service
+
+        Returns:
+            tuple of whether the build succeeded and its output
+        """
+        extra_args = ['build']
+        if pull:
+            extra_args.append('--pull')
 
-        compose.handle(extra_args=['build', '--pull'])
+        extra_args.append(service_name)
+
+        try:
+            output = self.compose.handle(extra_args=extra_args, capture_output=capture_output)
+        except shell.ErrorReturnCode as exc:
+            return False, exc.stdout.decode('utf8', 'replace')
+
+        return True, output or ''
 
     @property
     @lru_cache()
@@ -29,6 +118,19 @@ class Build(BaseSubcommand):
 
         return Compose(self.workflow)
 
+    def get_build_services(self) -> dict:
+        """
+        Returns a dict mapping the services built in the compose file to their data
+        """
+        services = {}
+
+        profile_data = self.workflow.profile.data or {}
+        for service_name, service_data in profile_data.get('services', {}).items():
+            if service_data.get('build'):
+                services[service_name] = service_data
+
+        return services
+
     def handle(self):
         self.build()
 
@@ -37,7 +139,39 @@ class Build(BaseSubcommand):
 
     @classmethod
     def fill_subparser(cls, parser, subparser) -> None:
-        pass
+        subparser.add_argument(
+            '--build-jobs',
+            type=int,
+            default=4,
+            help='number of images to build at once, default=4',
+        )
+        subparser.add_argument(
+            '--force',
+            action='store_true',
+            help='build images even when their build context is unchanged',
+        )
 
     def is_missing_env_arg_okay(self):
         return True
+
+    @property
+    def logger(self):
+        return logging.getLogger(f'{__name__}.{self.__class__.__name__}')
+
+    def print_build_result(self, result: scheduler.TaskResult) -> None:
+        """
+        Prints the output of a build as a single block once it's done
+        """
+        self.logger.info(f'{result.name} {result.status} in {result.duration:.1f}s')
+
+        if result.output:
+            print(result.output.rstrip(), flush=True)
+
+    @staticmethod
+    def print_build_summary(results: dict) -> None:
+        rows = [
+            (x.name, x.status, f'{x.duration:.1f}s')
+            for x in sorted(results.values(), key=lambda x: x.name)
+        ]
+
+        print(tabulate(rows, headers=('service', 'status', 'time')))
@@ -1,11 +1,15 @@
 import logging
 
-from compose_flow.kube.mixins import KubeMixIn
+from collections import OrderedDict
+
+from compose_flow import errors, fanout, rollout, tracing
+from compose_flow.kube.mixins import ApplyCommand, KubeMixIn
 
 from .base import BaseSubcommand
 from .profile import Profile
 
 ACTIONS = ['rancher', 'docker', 'rke', 'helm', 'kubectl']
+KUBE_ACTIONS = ['rancher', 'helm', 'kubectl']
 PROFILE_ACTIONS = ['docker']
 
 
@@ -22,6 +26,51 @@ class Deploy(BaseSubcommand, KubeMixIn):
     @classmethod
     def fill_subparser(cls, parser, subparser):
         subparser.add_argument('action', nargs='?', default='docker', choices=ACTIONS)
+        subparser.add_argument(
+            '--single-apply',
+            action='store_true',
+            help=(
+                'render manifests in memory and apply them with one command per '
+                'namespace, prune label and action (kubectl and rancher only)'
+            ),
+        )
+        subparser.add_argument(
+            '--full',
+            action='store_true',
+            help='with --single-apply, apply every manifest even when unchanged in the cluster',
+        )
+        subparser.add_argument(
+            '--fingerprint-annotations',
+            action='store_true',
+            help='with --single-apply --full, still add each document\'s fingerprint as an annotation',
+        )
+        subparser.add_argument(
+            '--canary',
+            action='store_true',
+            help=(
+                'with multiple targets, deploy to the first one on its own and '
+                'only deploy to the rest when it succeeds'
+            ),
+        )
+        subparser.add_argument(
+            '--stdin',
+            action='store_true',
+            help=(
+                'pass the compiled compose file to docker stack deploy on stdin '
+                'rather than writing it into the working directory (docker only)'
+            ),
+        )
+        subparser.add_argument(
+            '--wait',
+            action='store_true',
+            help='wait for the services in the stack to converge (docker only)',
+        )
+        subparser.add_argument(
+            '--wait-timeout',
+            type=float,
+            default=300.0,
+            help='seconds to wait for the services to converge, default=300',
+        )
 
     @property
     def logger(self):
@@ -34,22 +83,34 @@ class Deploy(BaseSubcommand, KubeMixIn):
         else:
             return False
 
+    @property
+    def write_profile(self) -> bool:
+        return not self.workflow.args.stdin
+
     def build_docker_command(self) -> str:
+        compose_file = self.workflow.profile.filename
+        if self.workflow.args.stdin:
+            compose_file = '-'
+
         return f"""docker stack deploy
             --prune
             --with-registry-auth
-            --compose-file {self.workflow.profile.filename}
+            --compose-file {compose_file}
             {self.workflow.args.config_name}"""
 
     def build_kubectl_command(self) -> list:
-        self.switch_kube_context()
-
         command = []
 
-        for manifest in self.get_kubectl_manifests():
+        manifests = self.get_kubectl_manifests()
+        if self.workflow.args.single_apply:
+            command.extend(self.get_apply_commands(manifests, kubectl_prefix=self.kubectl_command))
+
+            return command
+
+        for manifest in manifests:
             if isinstance(manifest, str):
                 manifest = {'path': manifest}
-            command.append(self.get_kubectl_command(manifest))
+            command.append(self.get_kubectl_command(manifest, kubectl_prefix=self.kubectl_command))
 
         return command
 
@@ -62,10 +123,16 @@ class Deploy(BaseSubcommand, KubeMixIn):
             # check if app is already installed - if so upgrade, if not install
             command.append(self.get_app_deploy_command(app))
 
-        for manifest in self.get_rancher_manifests():
+        manifests = self.get_rancher_manifests()
+        if self.workflow.args.single_apply:
+            command.extend(self.get_apply_commands(manifests, kubectl_prefix=f'{self.rancher_command} kubectl'))
+
+            return command
+
+        for manifest in manifests:
             if isinstance(manifest, str):
                 manifest = {'path': manifest}
-            command.append(self.get_kubectl_command(manifest, kubectl_prefix='rancher kubectl'))
+            command.append(self.get_kubectl_command(manifest, kubectl_prefix=f'{self.rancher_command} kubectl'))
 
         return command
 
@@ -73,14 +140,75 @@ class Deploy(BaseSubcommand, KubeMixIn):
         return self.get_rke_deploy_command()
 
     def build_helm_command(self) -> str:
-        self.switch_kube_context()
-
         command = []
 
         for app in self.get_helm_apps():
             command.append(self.get_app_deploy_command(app, target='helm'))
         return command
 
+    def is_multi_target_okay(self) -> bool:
+        return self.workflow.args.action in KUBE_ACTIONS
+
+    def get_apply_commands(self, manifests: list, kubectl_prefix: str = 'kubectl') -> list:
+        args = self.workflow.args
+
+        return self.get_kubectl_apply_commands(
+            manifests,
+            kubectl_prefix=kubectl_prefix,
+            full=args.full,
+            annotate=args.fingerprint_annotations,
+        )
+
+    def handle_targets(self, targets: list) -> [None, str]:
+        """
+        Deploys to each of the given targets
+
+        The deploy is first run with `--dry-run` against every target, which
+        renders and checks the answers and manifests, so that nothing is
+        deployed unless all the targets are ready.  The canary, when given, is
+        then deployed on its own, followed by the rest of the targets
+        concurrently.
+        """
+        workflow = self.workflow
+        args = workflow.args
+
+        if not self.is_multi_target_okay():
+            raise errors.ErrorMessage(f'deploy {args.action} cannot be run against multiple targets')
+
+        argv = fanout.strip_target_args(workflow.argv, args.command)
+
+        def run_phase(name, phase_targets, phase_argv):
+            with tracing.span(name, targets=phase_targets):
+                phases[name] = fanout.run_targets(
+                    phase_targets, phase_argv, cwd=workflow.working_dir, jobs=args.jobs
+                )
+
+            return [x.target for x in phases[name] if x.returncode != 0]
+
+        phases = OrderedDict()
+        message = None
+
+        failed = run_phase('prepare', targets, ['--dry-run'] + argv)
+        if failed:
+            message = f'\nError: nothing deployed, failed to prepare targets: {", ".join(failed)}'
+        elif not args.dry_run:
+            remaining = list(targets)
+
+            if args.canary:
+                failed = run_phase('canary', remaining[:1], argv)
+                remaining = remaining[1:]
+
+            if failed:
+                message = f'\nError: canary {failed[0]} failed, the remaining targets were not deployed'
+            elif remaining:
+                failed = run_phase('deploy', remaining, argv)
+                if failed:
+                    message = f'\nError: failed targets: {", ".join(failed)}'
+
+        fanout.print_report(targets, phases)
+
+        return message
+
     def handle(self):
         args = self.workflow.args
         env = self.workflow.environment
@@ -94,15 +222,34 @@ class Deploy(BaseSubcommand, KubeMixIn):
         command = action_method()
         command_is_list = isinstance(command, list)
 
-        logged_command = '\n'.join(command) if command_is_list else command
+        if command_is_list:
+            logged_command = '\n'.join(
+                x if isinstance(x, str) else f'{x.command} < rendered manifests' for x in command
+            )
+        else:
+            logged_command = command
         self.logger.info(logged_command)
 
         if not args.dry_run:
+            watcher = None
+            if args.wait and action == 'docker':
+                watcher = rollout.StackWatcher(args.config_name, args.wait_timeout)
+                watcher.snapshot()
+
             if command_is_list:
                 # If multiple commands are returned, run them one by one
                 for c in command:
-                    self.execute(c)
+                    if isinstance(c, ApplyCommand):
+                        self.execute(c.command, _in=c.content)
+                    else:
+                        self.execute(c)
+            elif action == 'docker' and args.stdin:
+                # the compiled profile is held in memory rather than read from the working directory
+                self.execute(command, _in=self.workflow.profile.dump())
             else:
                 self.execute(command)
 
             env.write()
+
+            if watcher:
+                watcher.wait()
@@ -8,7 +8,7 @@ import tempfile
 
 from functools import lru_cache
 
-from compose_flow import docker, errors, utils
+from compose_flow import docker, errors, tracing, utils
 from compose_flow.commands.subcommands import BaseSubcommand
 from compose_flow.environment.backends import get_backend
 
@@ -34,6 +34,9 @@ class Env(BaseSubcommand):
         # when data is modified, set this to True
         self._data_modified = False
 
+        # whether the version was computed from a clean working copy
+        self._is_release_version = False
+
         # keys that will be persisted to the docker config
         self._persistable_keys = []
 
@@ -251,6 +254,9 @@ class Env(BaseSubcommand):
 
         return action in ('edit',) and force
 
+    def is_multi_target_okay(self) -> bool:
+        return self.workflow.args.action in ('cat',)
+
     def is_env_modification_action(self):
         return self.workflow.args.action in ('cat', 'edit', 'push')
 
@@ -269,7 +275,8 @@ class Env(BaseSubcommand):
             return data
 
         try:
-            content = self.backend.read(self.workflow.config_name)
+            with tracing.span('load_env'):
+                content = self.backend.read(self.workflow.config_name)
         except errors.NoSuchConfig as exc:
             if not self.is_missing_config_okay(exc):
                 raise
@@ -365,6 +372,8 @@ class Env(BaseSubcommand):
         tag_version = self.workflow.args.environment
         try:
             tag_version = utils.get_tag_version(default=self.workflow.args.environment)
+
+            self._is_release_version = True
         except Exception as exc:
             subcommand = self.workflow.subcommand
 
@@ -378,6 +387,16 @@ class Env(BaseSubcommand):
 
         return tag_version
 
+    @property
+    def is_release_version(self) -> bool:
+        """
+        Returns whether the version was computed from a clean working copy
+
+        Only such a version always names the same code; versions given with
+        `--tag-version` and the fallbacks used for dirty working copies do not.
+        """
+        return bool(self.version) and self._is_release_version
+
     def write(self) -> None:
         """
         Writes the environment into the docker config
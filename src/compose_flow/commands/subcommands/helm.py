@@ -16,7 +16,8 @@ class Helm(PassthroughBaseSubcommand, KubeMixIn):
 
     setup_profile = False
 
-    def handle(self, extra_args: list = None) -> [None, str]:
-        self.switch_kube_context()
+    def get_command(self) -> list:
+        return super().get_command() + ['--kube-context', self.kube_context]
 
+    def handle(self, extra_args: list = None) -> [None, str]:
         return super().handle(log_output=True)
@@ -1,12 +1,13 @@
 import argparse
 import logging
 import os
+import shlex
 
 from distutils.spawn import find_executable
 
 from .base import BaseSubcommand
 
-from compose_flow import errors
+from compose_flow import errors, settings, shell
 
 
 class PassthroughBaseSubcommand(BaseSubcommand):
@@ -17,6 +18,12 @@ class PassthroughBaseSubcommand(BaseSubcommand):
 
     @classmethod
     def fill_subparser(cls, parser, subparser) -> None:
+        subparser.add_argument(
+            '--exec',
+            action='store_true',
+            default=settings.PASSTHROUGH_EXEC,
+            help='replace compose-flow with the command instead of running it as a child process',
+        )
         subparser.add_argument('extra_args', nargs=argparse.REMAINDER)
 
     def get_command(self):
@@ -29,7 +36,9 @@ class PassthroughBaseSubcommand(BaseSubcommand):
 
         return [command_path]
 
-    def handle(self, extra_args: list = None, log_output: bool = False) -> [None, str]:
+    def handle(
+        self, extra_args: list = None, log_output: bool = False, capture_output: bool = False
+    ) -> [None, str]:
         command = self.get_command()
 
         args = self.workflow.args
@@ -37,17 +46,55 @@ class PassthroughBaseSubcommand(BaseSubcommand):
         extra_args = extra_args or args.extra_args
         command.extend(extra_args)
 
-        # if there is a space in one of the command arguments, use repr() to
-        # quote it properly when it contains a space
-        command_s = ' '.join([x if ' ' not in x else repr(x) for x in command])
+        command_s = ' '.join([shlex.quote(x) for x in command])
 
         self.logger.info(command_s)
 
         if not args.dry_run:
-            res = self.execute(command_s, _fg=True)
+            if self.use_exec:
+                return self.exec_command(command)
+
+            # return the output rather than streaming it to the terminal
+            if capture_output:
+                res = self.execute(command, _err_to_out=True)
+
+                return res.stdout.decode('utf8', 'replace')
+
+            res = self.execute(command, _fg=True)
             if log_output:
                 self.logger.info(res.stdout.decode('utf-8').strip())
 
+    def exec_command(self, command: list) -> None:
+        """
+        Replaces the current process with the given command
+
+        The command's output goes straight to the terminal rather than
+        through compose-flow, and the arguments are passed as-is without
+        being quoted and split again.
+        """
+        env = shell.get_env(self.workflow.environment.data)
+
+        # anything else the workflow does after handle() would not run
+        self.workflow._write_environment()
+        self.workflow._write_spawn_report()
+        self.workflow._write_trace()
+
+        os.execvpe(command[0], command, env)
+
     @property
     def logger(self) -> logging.Logger:
         return logging.getLogger(f'{__name__}.{self.__class__.__name__}')
+
+    @property
+    def use_exec(self) -> bool:
+        """
+        Returns whether the command should replace the compose-flow process
+
+        Only the subcommand given on the command line is exec'ed; passthroughs
+        run on behalf of other subcommands, e.g. `compose build` when
+        publishing, have to return control to their caller.
+        """
+        if not getattr(self.workflow.args, 'exec', False):
+            return False
+
+        return self.workflow.subcommand is self
@@ -2,15 +2,28 @@
 Profile subcommand
 """
 import copy
+import io
+import json
 import logging
-import tempfile
+import time
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from functools import lru_cache
 from typing import Callable, List
 
+from tabulate import tabulate
+
 from .base import BaseSubcommand
 
-from compose_flow.compose import merge_profile
+from compose_flow import tracing
+from compose_flow.compose import (
+    dump_compose,
+    get_overlay_filenames,
+    load_compose,
+    load_overlay,
+    merge_overlays,
+    merge_profile,
+)
 from compose_flow.config import get_config
 from compose_flow.errors import EnvError, NoSuchProfile, ProfileError
 from compose_flow.utils import render, yaml_dump, yaml_load
@@ -42,6 +55,160 @@ def listify_kv(d: dict) -> list:
     return [f'{k}={v}' if v else k for k, v in d.items()]
 
 
+# functions that increment a part of each expanded service, by their name in the `increment` config
+INCREMENT_HANDLERS = {}
+
+
+def increment_handler(name: str) -> Callable:
+    """
+    Registers the decorated function as the handler for the named increment
+
+    The function is called with the increment's config, the replica's index
+    and the replica's service, and returns the service.  The service is a
+    shallow copy whose values are shared with the other replicas, so the
+    handler must replace the values it changes rather than modify them.
+    """
+    def decorator(fn):
+        INCREMENT_HANDLERS[name] = fn
+
+        return fn
+
+    return decorator
+
+
+def increment_kv(items: [list, dict], keys: list, item_index: int) -> [list, dict]:
+    """
+    Returns a copy of the `key=value` list or dict with the values of the given keys incremented
+    """
+    if isinstance(items, dict):
+        return {k: str(int(v) + item_index) if k in keys else v for k, v in items.items()}
+
+    new_items = []
+    for item in items:
+        k, v = get_kv(item)
+        if v is None or k not in keys:
+            new_items.append(item)
+
+            continue
+
+        new_items.append(f'{k}={int(v) + item_index}')
+
+    return new_items
+
+
+@increment_handler('env')
+def increment_env(increment_config: list, item_index: int, service: dict) -> dict:
+    if not isinstance(service['environment'], list):
+        raise NotImplementedError(
+            'environment dictionary is not supported, use list format'
+        )
+
+    service['environment'] = increment_kv(service['environment'], increment_config, item_index)
+
+    return service
+
+
+@increment_handler('hostname')
+def increment_hostname(increment_config: bool, item_index: int, service: dict) -> dict:
+    """
+    Appends the replica number to the service's hostname
+    """
+    if increment_config and service.get('hostname'):
+        service['hostname'] = f'{service["hostname"]}{item_index + 1}'
+
+    return service
+
+
+@increment_handler('labels')
+def increment_labels(increment_config: list, item_index: int, service: dict) -> dict:
+    """
+    Increments the values of the given labels, both container and deploy labels
+    """
+    if service.get('labels'):
+        service['labels'] = increment_kv(service['labels'], increment_config, item_index)
+
+    deploy = service.get('deploy') or {}
+    if deploy.get('labels'):
+        service['deploy'] = dict(
+            deploy, labels=increment_kv(deploy['labels'], increment_config, item_index)
+        )
+
+    return service
+
+
+@increment_handler('ports')
+def increment_ports(increment_config: dict, item_index: int, service: dict) -> dict:
+    new_ports = []
+
+    for item in service['ports']:
+        source, dest = item.split(':')
+        source_i = int(source)
+        dest_i = int(dest)
+
+        if increment_config.get('source_port', False):
+            source_i += item_index
+
+        if increment_config.get('destination_port', False):
+            dest_i += item_index
+
+        new_ports.append(f'{source_i}:{dest_i}')
+
+    service['ports'] = new_ports
+
+    return service
+
+
+@increment_handler('volumes')
+def increment_volumes(increment_config: list, item_index: int, service: dict) -> dict:
+    """
+    Appends the replica number to the given volume sources, e.g. `data:/data` becomes `data1:/data`
+    """
+    new_volumes = []
+
+    for item in service.get('volumes', []):
+        if isinstance(item, dict):
+            if item.get('source') in increment_config:
+                item = dict(item, source=f'{item["source"]}{item_index + 1}')
+        else:
+            source, sep, rest = item.partition(':')
+            if sep and source in increment_config:
+                item = f'{source}{item_index + 1}:{rest}'
+
+        new_volumes.append(item)
+
+    service['volumes'] = new_volumes
+
+    return service
+
+
+def compile_profile(name: str, overlays: list, config_name: str, compose_format: str) -> tuple:
+    """
+    Compiles the named profile from its parsed overlays and writes it out
+
+    This is run in a worker process by `profile compile --all-profiles`.
+
+    Returns:
+        tuple of the number of services in the compiled profile and the seconds it took
+    """
+    start = time.perf_counter()
+
+    data = merge_overlays(overlays)
+
+    # merging builds new containers, but a single overlay is used as-is and compiling modifies it
+    if len(overlays) == 1:
+        data = copy.deepcopy(data)
+
+    content = ''
+    if data:
+        content = Profile(None).compile_data(data, config_name, compose_format)
+
+    # the rendered files that deploy and compose use are left alone
+    with open(Profile.get_unrendered_filename(name, compose_format), 'w') as fh:
+        fh.write(content)
+
+    return len((data or {}).get('services') or {}), time.perf_counter() - start
+
+
 class Profile(BaseSubcommand):
     """
     Subcommand for managing profiles
@@ -59,13 +226,50 @@ class Profile(BaseSubcommand):
         """
         Returns the filename for this profile
         """
-        args = self.workflow.args
+        return self.get_filename(self.workflow.args.profile, self.compose_format)
+
+    @staticmethod
+    def get_filename(profile_name: str, compose_format: str = 'yml') -> str:
+        return f'compose-flow-{profile_name}.{compose_format}'
 
-        return f'compose-flow-{args.profile}.yml'
+    @staticmethod
+    def get_unrendered_filename(profile_name: str, compose_format: str = 'yml') -> str:
+        """
+        Returns the filename `profile compile --all-profiles` writes the profile to
+        """
+        return f'compose-flow-{profile_name}.unrendered.{compose_format}'
 
     @classmethod
     def fill_subparser(cls, parser, subparser):
         subparser.add_argument('action')
+        subparser.add_argument(
+            '--all-profiles',
+            action='store_true',
+            help=(
+                'with compile, compile every profile in compose-flow.yml without rendering '
+                'variables, at most --jobs at a time'
+            ),
+        )
+
+    @property
+    def compose_format(self) -> str:
+        return self.workflow.args.compose_format
+
+    @property
+    def compile_all(self) -> bool:
+        return self.workflow.args.action == 'compile' and self.workflow.args.all_profiles
+
+    @property
+    def remote_action(self) -> bool:
+        return not self.compile_all
+
+    @property
+    def setup_environment(self) -> bool:
+        return not self.compile_all
+
+    @property
+    def setup_profile(self) -> bool:
+        return not self.compile_all
 
     @property
     def data(self):
@@ -74,15 +278,85 @@ class Profile(BaseSubcommand):
 
         compose_content = self.load()
 
-        self._data = yaml_load(compose_content)
+        self._data = load_compose(compose_content, self.compose_format)
 
         return self._data
 
     def cat(self):
         """
         Prints the loaded compose file to stdout
+
+        The file is always printed as YAML, which is easier to read.
+        """
+        content = self.load()
+        if self.compose_format == 'json':
+            content = yaml_dump(load_compose(content, self.compose_format))
+
+        print(content)
+
+    def compile(self) -> [None, str]:
+        """
+        Writes the compose file, or with --all-profiles the compiled compose file of every profile
         """
-        print(self.load())
+        if not self.compile_all:
+            return self.write()
+
+        config = get_config() or {}
+
+        profiles = config.get('profiles') or {}
+        if not profiles:
+            raise ProfileError('no profiles defined in compose-flow.yml')
+
+        overlay_filenames = {name: get_overlay_filenames(x) for name, x in profiles.items()}
+
+        # overlays shared by several profiles, such as docker-compose.yml, are parsed once
+        filenames = sorted(set(x for y in overlay_filenames.values() for x in y))
+
+        results = {}
+        failed = {}
+        with ProcessPoolExecutor(max_workers=self.workflow.args.jobs) as executor:
+            with tracing.span('parse_overlays', filenames=filenames):
+                overlays = dict(zip(filenames, executor.map(load_overlay, filenames)))
+
+            futures = {
+                executor.submit(
+                    compile_profile,
+                    name,
+                    [overlays[x] for x in overlay_filenames[name]],
+                    f'{name}-{self.workflow.project_name}',
+                    self.compose_format,
+                ): name
+                for name in profiles
+            }
+
+            for future in as_completed(futures):
+                name = futures[future]
+
+                # a broken profile should not keep the others from being compiled
+                try:
+                    results[name] = future.result()
+                except Exception as exc:
+                    self.logger.error(f'unable to compile profile {name}: {exc}')
+
+                    failed[name] = exc
+
+        self.print_compile_summary(profiles, results, self.compose_format)
+
+        if failed:
+            return f'\nError: failed to compile profiles: {", ".join(sorted(failed))}'
+
+    @staticmethod
+    def print_compile_summary(profiles: list, results: dict, compose_format: str) -> None:
+        rows = []
+        for name in profiles:
+            if name in results:
+                services, duration = results[name]
+
+                rows.append((name, Profile.get_unrendered_filename(name, compose_format), services, f'{duration:.2f}s'))
+            else:
+                rows.append((name, 'failed', '', ''))
+
+        print(tabulate(rows, headers=('profile', 'filename', 'services', 'time')))
 
     def _check_services(self, check_fn: Callable, data: dict) -> list:
         """
@@ -196,81 +470,47 @@ class Profile(BaseSubcommand):
         return errors
 
     def cf_config_expand(self, data):
+        """
+        Expands services out into one service per replica
+
+        Replicas share the base service's data; only the parts of the service
+        changed by the increment handlers are copied, so large expansions stay
+        cheap to compile.
+        """
         expand_config = data['compose_flow']['expand']
         for service_name, config in expand_config.items():
             base_service = data['services'].pop(service_name)
             replicas = base_service['deploy']['replicas']
 
-            increment_config = expand_config[service_name].get('increment')
+            increment_config = expand_config[service_name].get('increment') or {}
+
+            deploy = {k: v for k, v in base_service['deploy'].items() if k != 'replicas'}
 
             for idx in range(replicas):
                 _service_name = f'{service_name}{idx+1}'
-                _service = copy.deepcopy(base_service)
-
-                _service['deploy'].pop('replicas')
-
-                if increment_config:
-                    for (
-                        _increment_config_name,
-                        _increment_config_data,
-                    ) in increment_config.items():
-                        fn_name = f'cf_config_expand_increment_{_increment_config_name}'
-                        _service = getattr(self, fn_name)(
-                            _increment_config_data, idx, _service
+                _service = dict(base_service, deploy=deploy)
+
+                for (
+                    _increment_config_name,
+                    _increment_config_data,
+                ) in increment_config.items():
+                    handler = INCREMENT_HANDLERS.get(_increment_config_name)
+                    if handler is None:
+                        raise ProfileError(
+                            f'unknown increment {_increment_config_name} for service {service_name}'
                         )
 
-                data['services'][_service_name] = _service
-
-    def cf_config_expand_increment_env(
-        self, increment_config: dict, item_index: int, service: dict
-    ) -> dict:
-        if not isinstance(service['environment'], list):
-            raise NotImplementedError(
-                'environment dictionary is not supported, use list format'
-            )
-
-        new_env = []
-        for item in service['environment']:
-            if '=' not in item:
-                new_env.append(item)
-
-                continue
-
-            k, v = item.split('=', 1)
-            if k not in increment_config:
-                new_env.append(item)
+                    _service = handler(_increment_config_data, idx, _service)
 
-                continue
-
-            v_int = int(v)
-
-            new_env.append(f'{k}={v_int+item_index}')
-
-        service['environment'] = new_env
-
-        return service
-
-    def cf_config_expand_increment_ports(
-        self, increment_config: dict, item_index: int, service: dict
-    ) -> dict:
-        new_ports = []
-
-        for item in service['ports']:
-            source, dest = item.split(':')
-            source_i = int(source)
-            dest_i = int(dest)
-
-            if increment_config.get('source_port', False):
-                source_i += item_index
-
-            if increment_config.get('destination_port', False):
-                dest_i += item_index
-
-            new_ports.append(f'{source_i}:{dest_i}')
-
-        service['ports'] = new_ports
+                data['services'][_service_name] = _service
 
-        return service
+            # the incremented named volumes are declared like the volume they're based on
+            declared_volumes = data.get('volumes') or {}
+            for source in increment_config.get('volumes', []):
+                if source in declared_volumes:
+                    volume = declared_volumes.pop(source)
+                    for idx in range(replicas):
+                        declared_volumes[f'{source}{idx+1}'] = volume
 
     def _check_cf_config(self, data):
         """
@@ -301,61 +541,75 @@ class Profile(BaseSubcommand):
 
         # perform transformations on the compiled profile
         if content:
-            data = yaml_load(content)
+            content = self.compile_data(
+                yaml_load(content), self.workflow.args.config_name, self.compose_format
+            )
 
-            # check if the environment needs to be copied from another service
-            data = self._copy_environment(data)
+        self._compiled_profile = content
 
-            # see if any services need to be expanded out
-            data = self._check_cf_config(data)
+        return content
 
-            # drop the compose_flow section if it exists
-            data.pop('compose_flow', None)
+    def compile_data(self, data: dict, config_name: str, compose_format: str = 'yml') -> str:
+        """
+        Applies compose-flow's transformations to the merged compose data
 
-            # for each service inject DOCKER_STACK and DOCKER_SERVICE
-            for service_name, service_data in data.get('services', {}).items():
-                service_environment = service_data.setdefault('environment', [])
+        Args:
+            data: the merged compose data; it's modified in place
+            config_name: the name of the stack the services are deployed in
+            compose_format: the format to serialize the compiled data in
 
-                # convert the service_environment into a dict
-                service_environment_d = {}
-                for item in service_environment:
-                    item_split = item.split('=', 1)
-                    k = item_split[0]
+        Returns:
+            compiled compose file as a string
+        """
+        # check if the environment needs to be copied from another service
+        data = self._copy_environment(data)
 
-                    if len(item_split) > 1:
-                        v = item_split[1]
-                    else:
-                        v = None
+        # see if any services need to be expanded out
+        data = self._check_cf_config(data)
 
-                    service_environment_d[k] = v
+        # drop the compose_flow section if it exists
+        data.pop('compose_flow', None)
 
-                for k, v in (
-                        ('DOCKER_SERVICE', service_name),
-                        ('DOCKER_STACK', self.workflow.args.config_name),
-                ):
-                    if k not in service_environment_d:
-                        service_environment_d[k] = v
+        # for each service inject DOCKER_STACK and DOCKER_SERVICE
+        for service_name, service_data in data.get('services', {}).items():
+            service_environment = service_data.setdefault('environment', [])
 
-                # reconstruct the k=v list honoring empty values
-                service_environment_l = []
-                for k, v in service_environment_d.items():
-                    if v is None:
-                        val = k
-                    else:
-                        val = f'{k}={v}'
-                    service_environment_l.append(val)
+            # convert the service_environment into a dict
+            service_environment_d = {}
+            for item in service_environment:
+                item_split = item.split('=', 1)
+                k = item_split[0]
 
-                # dump back out as list
-                service_data['environment'] = service_environment_l
+                if len(item_split) > 1:
+                    v = item_split[1]
+                else:
+                    v = None
 
-                # enforce resources
-                self.set_resources(service_name, service_data)
+                service_environment_d[k] = v
 
-            content = yaml_dump(data)
+            for k, v in (
+                    ('DOCKER_SERVICE', service_name),
+                    ('DOCKER_STACK', config_name),
+            ):
+                if k not in service_environment_d:
+                    service_environment_d[k] = v
 
-        self._compiled_profile = content
+            # reconstruct the k=v list honoring empty values
+            service_environment_l = []
+            for k, v in service_environment_d.items():
+                if v is None:
+                    val = k
+                else:
+                    val = f'{k}={v}'
+                service_environment_l.append(val)
 
-        return content
+            # dump back out as list
+            service_data['environment'] = service_environment_l
+
+            # enforce resources
+            self.set_resources(service_name, service_data)
+
+        return dump_compose(data, compose_format)
 
     def _copy_environment(self, data):
         """
@@ -424,11 +678,17 @@ class Profile(BaseSubcommand):
         Processes the profile to generate the compose file
         """
         content = self._compile(profile)
-        fh = tempfile.TemporaryFile(mode='w+')
+        fh = io.StringIO()
+
+        env = self.workflow.environment.data
+
+        # variables are only found in JSON strings, so escape the values to keep them valid
+        if self.compose_format == 'json':
+            env = {k: json.dumps(v)[1:-1] for k, v in env.items()}
 
         # render the file
         try:
-            rendered = render(content, env=self.workflow.environment.data)
+            rendered = render(content, env=env)
         except EnvError as exc:
             if not self.workflow.subcommand.is_missing_profile_okay(exc):
                 raise
@@ -446,9 +706,13 @@ class Profile(BaseSubcommand):
         """
         Loads the compose file that is generated from all the items listed in the profile
         """
-        fh = self.get_profile_compose_file(self.profile_files)
+        with tracing.span('compile_profile'):
+            fh = self.get_profile_compose_file(self.profile_files)
+
+            return fh.read()
 
-        return fh.read()
+    def is_multi_target_okay(self) -> bool:
+        return self.workflow.args.action in ('cat',)
 
     @property
     def logger(self):
@@ -480,7 +744,10 @@ class Profile(BaseSubcommand):
         """
         Fills in missing resources
         """
-        resources = service_data.get('deploy', {}).get('resources', {})
+        deploy = service_data.get('deploy', {})
+
+        # fill in a copy; expanded services share their resources
+        resources = {k: dict(v) for k, v in deploy.get('resources', {}).items()}
 
         # init limits and reservations
         changed = False
@@ -500,8 +767,14 @@ class Profile(BaseSubcommand):
 
                     changed = True
 
-        if changed:
-            service_data.setdefault('deploy', {})['resources'] = resources
+        if changed or 'resources' in deploy:
+            service_data['deploy'] = dict(deploy, resources=resources)
+
+    def dump(self) -> str:
+        """
+        Returns the loaded compose file as it's written to disk
+        """
+        return dump_compose(self.data, self.compose_format)
 
     @lru_cache()
     def write(self) -> None:
@@ -509,4 +782,4 @@ class Profile(BaseSubcommand):
         Writes the loaded compose file to disk
         """
         with open(self.filename, 'w') as fh:
-            fh.write(yaml_dump(self.data))
+            fh.write(self.dump())
@@ -1,7 +1,11 @@
 import logging
+import time
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import lru_cache
 
+from compose_flow import errors, registry, shell, utils
+
 from .base import BaseSubcommand
 
 
@@ -14,45 +18,95 @@ class Publish(BaseSubcommand):
     remote_action = True
     update_version_env_vars = True
 
-    def build(self):
-        compose = self.compose
-
-        compose.handle(extra_args=['build'])
+    def build(self, services: list = None):
+        self.builder.build(services, pull=False)
 
     @property
     @lru_cache()
-    def compose(self):
+    def builder(self):
         """
-        Returns a Compose subcommand
+        Returns a Build subcommand
         """
-        from .compose import Compose
+        from .build import Build
 
-        return Compose(self.workflow)
+        return Build(self.workflow)
 
     def do_validate_profile(self):
         return False
 
     @classmethod
     def fill_subparser(cls, parser, subparser) -> None:
-        pass
+        subparser.add_argument(
+            '--build-jobs',
+            type=int,
+            default=4,
+            help='number of images to build at once, default=4',
+        )
+        subparser.add_argument(
+            '--force',
+            action='store_true',
+            help='build and push images even when they are unchanged or already in the registry',
+        )
+        subparser.add_argument(
+            '--push-jobs',
+            type=int,
+            default=4,
+            help='number of images to push at once, default=4',
+        )
+        subparser.add_argument(
+            '--push-retries',
+            type=int,
+            default=3,
+            help='number of times to retry a failed push, default=3',
+        )
 
     def get_built_docker_images(self) -> list:
         """
         Returns a list of docker images built in the compose file
         """
-        docker_images = set()
+        return list(set(self.get_built_services().values()))
+
+    def get_built_services(self) -> dict:
+        """
+        Returns a dict mapping the services built in the compose file to their images
+        """
+        services = {}
 
         profile = self.workflow.profile
-        for service_data in profile.data['services'].values():
+        for service_name, service_data in profile.data['services'].items():
             if service_data.get('build'):
-                docker_images.add(service_data.get('image'))
+                services[service_name] = service_data.get('image')
 
-        return list(docker_images)
+        return services
 
     def handle(self):
-        self.build()
+        existing = set()
+        if not self.workflow.args.force:
+            if self.workflow.environment.is_release_version:
+                existing = registry.get_existing_images(self.get_built_docker_images())
+            else:
+                # the same tag may name different code, so its image in the registry may be stale
+                self.logger.info('version is not from a clean tag-version, publishing all images')
+
+        if not existing:
+            self.build()
+
+            self.push()
+
+            return
 
-        self.push()
+        for docker_image in sorted(existing):
+            self.logger.info(f'{docker_image} already published, skipping')
+
+        built_services = self.get_built_services()
+
+        services = sorted(x for x, y in built_services.items() if y not in existing)
+        if not services:
+            return
+
+        self.build(services)
+
+        self.push(sorted(set(built_services[x] for x in services)))
 
     def is_missing_env_arg_okay(self):
         return True
@@ -61,13 +115,87 @@ class Publish(BaseSubcommand):
     def logger(self):
         return logging.getLogger(f'{__name__}.{self.__class__.__name__}')
 
-    def push(self):
-        docker_images = self.get_built_docker_images()
-        for docker_image in docker_images:
-            if len(docker_images) > 1:
-                self.logger.info(f'pushing {docker_image}')
+    def push(self, docker_images: list = None):
+        args = self.workflow.args
+        docker_images = docker_images or self.get_built_docker_images()
 
-            if self.workflow.args.dry_run:
+        if args.dry_run:
+            for docker_image in docker_images:
                 self.logger.info(f'docker push {docker_image}')
+
+            return
+
+        env = self.workflow.environment.data
+
+        # a single image is pushed in the foreground in order to show docker's progress
+        if len(docker_images) == 1:
+            docker_image, success, _ = self.push_image(docker_images[0], env, foreground=True)
+
+            failed = [] if success else [docker_image]
+        else:
+            failed = self.push_concurrently(docker_images, env)
+
+        if failed:
+            raise errors.PushError(f'Error: unable to push {", ".join(sorted(failed))}')
+
+    def push_concurrently(self, docker_images: list, env: dict) -> list:
+        """
+        Pushes the given images in parallel
+
+        Returns:
+            list of the images that failed to push
+        """
+        failed = []
+
+        with ThreadPoolExecutor(max_workers=self.workflow.args.push_jobs) as executor:
+            futures = [
+                executor.submit(self.push_image, docker_image, env)
+                for docker_image in docker_images
+            ]
+
+            # print each image's output as a block once its push is done
+            for future in as_completed(futures):
+                docker_image, success, output = future.result()
+                if not success:
+                    failed.append(docker_image)
+
+                status = 'pushed' if success else 'FAILED'
+                self.logger.info(f'{status} {docker_image}')
+
+                print(output.rstrip(), flush=True)
+
+        return failed
+
+    def push_image(self, docker_image: str, env: dict, foreground: bool = False) -> tuple:
+        """
+        Pushes the given image, retrying failed pushes
+
+        Args:
+            docker_image: the image to push
+            env: the environment to push with
+            foreground: attach the push to the terminal instead of capturing its output
+
+        Returns:
+            tuple of the image, whether the push succeeded and the push output
+        """
+        output = ''
+        delays = utils.backoff_delays(self.workflow.args.push_retries, base=1.0, cap=16.0)
+
+        while True:
+            try:
+                if foreground:
+                    proc = self.execute(f'docker push {docker_image}', _env=env, _fg=True)
+                else:
+                    proc = self.execute(f'docker push {docker_image}', _env=env, _err_to_out=True)
+            except shell.ErrorReturnCode as exc:
+                output = (exc.stdout or b'').decode('utf8')
             else:
-                self.execute(f'docker push {docker_image}', _fg=True)
+                return docker_image, True, proc.stdout.decode('utf8')
+
+            delay = next(delays, None)
+            if delay is None:
+                return docker_image, False, output
+
+            self.logger.warning(f'push of {docker_image} failed, retrying in {delay:.1f}s')
+
+            time.sleep(delay)
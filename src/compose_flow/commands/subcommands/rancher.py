@@ -1,6 +1,7 @@
 """
 Rancher CLI subcommand
 """
+from compose_flow import settings
 from compose_flow.kube.mixins import KubeMixIn
 from .passthrough_base import PassthroughBaseSubcommand
 
@@ -16,6 +17,23 @@ class Rancher(PassthroughBaseSubcommand, KubeMixIn):
 
     setup_profile = False
 
+    @property
+    def rancher_config_dir(self) -> str:
+        """
+        The user's own Rancher config dir when exec'ing the CLI
+
+        The private copy is removed at exit, which never happens once the
+        process is replaced, so it would be left behind along with the
+        credentials in it.
+        """
+        if self.use_exec:
+            return settings.RANCHER_CONFIG_DIR
+
+        return super().rancher_config_dir
+
+    def get_command(self) -> list:
+        return super().get_command() + ['--config', self.rancher_config_dir]
+
     def handle(self, extra_args: list = None) -> [None, str]:
         self.switch_rancher_context()
 
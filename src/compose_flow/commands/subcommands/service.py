@@ -2,10 +2,11 @@
 """
 Subcommand for working with services
 
-This subcommand provides two actions:
+This subcommand provides three actions:
 
 - list
 - exec
+- logs
 
 The `list` action will list all the services for a stack when no additional
 arguments are given:
@@ -28,6 +29,14 @@ container:
 ```
 compose-flow -e dev service exec app /bin/bash
 ```
+
+The `logs` action streams the logs of every running container for the service
+at once, merged by timestamp.  Lines can be filtered on the nodes themselves
+with `--grep`:
+
+```
+compose-flow -e dev service logs app --follow --grep 'ERROR|WARN'
+```
 """
 import argparse
 import functools
@@ -39,7 +48,7 @@ import sys
 import time
 
 from .base import BaseSubcommand
-from compose_flow import errors, shell
+from compose_flow import cache, docker, errors, logs, settings, shell, utils
 
 
 class Service(BaseSubcommand):
@@ -47,6 +56,12 @@ class Service(BaseSubcommand):
 
     setup_profile = False
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # nodes that could not be inspected, which are not looked up again
+        self._uninspectable_nodes = set()
+
     @classmethod
     def fill_subparser(cls, parser, subparser):
         subparser.epilog = __doc__
@@ -58,6 +73,12 @@ class Service(BaseSubcommand):
         subparser.add_argument(
             '--retries', type=int, default=30, help='number of times to retry'
         )
+        subparser.add_argument(
+            '--timeout',
+            type=float,
+            default=30.0,
+            help='seconds to wait for a running container, default=30',
+        )
         subparser.add_argument(
             '--ssh', action='store_true', help='ssh to the machine, not the container'
         )
@@ -81,6 +102,24 @@ class Service(BaseSubcommand):
         subparser.add_argument(
             '--service-name', help='full service name to use instead of generated'
         )
+        subparser.add_argument(
+            '--follow', '-f', action='store_true', help='follow the log output'
+        )
+        subparser.add_argument(
+            '--tail', help='number of lines to show from the end of each container log'
+        )
+        subparser.add_argument(
+            '--since', help='show logs since the given timestamp or relative time'
+        )
+        subparser.add_argument(
+            '--grep', help='only show lines matching the given extended regex'
+        )
+        subparser.add_argument(
+            '--buffer-size',
+            type=int,
+            default=logs.DEFAULT_BUFFER_SIZE,
+            help=f'number of lines held to order them by time, default={logs.DEFAULT_BUFFER_SIZE}',
+        )
         subparser.add_argument('action', help='The action to run')
         subparser.add_argument('service', nargs='?', help='The desired service')
 
@@ -88,17 +127,68 @@ class Service(BaseSubcommand):
         args = self.workflow.args
 
         result = None
-        for i in range(args.retries):
+        deadline = time.time() + args.timeout
+
+        delays = list(utils.backoff_delays(args.retries))
+
+        for attempt, delay in enumerate(delays, 1):
+            # the container listing is cached; make sure every attempt gets a fresh listing
+            self.list_containers.cache_clear()
+
             try:
                 result = self.run_service()
             except errors.NoContainer:
-                time.sleep(1.0)
+                # do not wait after the last attempt
+                remaining = deadline - time.time()
+                if attempt == len(delays) or remaining <= 0:
+                    break
+
+                time.sleep(min(delay, remaining))
             else:
                 break
 
         if not result:
             sys.exit(f'No container found for service={self.service_name}')
 
+    def action_logs(self):
+        """
+        Streams the logs of all the service's containers, merged by timestamp
+        """
+        args = self.workflow.args
+        username = self.workflow.remote.username
+
+        tasks = self.list_containers()
+
+        # look up all the nodes at once before resolving each task's host
+        self.get_node_addresses([x['Node'] for x in tasks])
+
+        merger = logs.LogMerger(buffer_size=args.buffer_size)
+
+        for task in tasks:
+            docker_command = logs.get_docker_logs_command(
+                self.get_container_name(task),
+                follow=args.follow,
+                tail=args.tail,
+                since=args.since,
+                grep=args.grep,
+                sudo=args.sudo,
+            )
+
+            host_info = f'{username}@{self.get_ssh_host(task)}'
+            command = logs.get_ssh_command(host_info, docker_command)
+
+            logging.debug(f'command={command}')
+
+            merger.add_stream(f'{task["Name"]}@{task["Node"]}', command)
+
+        try:
+            failed = merger.run()
+        except KeyboardInterrupt:
+            return
+
+        if failed:
+            sys.exit(f'Error: unable to read logs from {failed} container(s)')
+
     def action_list(self):
         """
         Lists the stack
@@ -110,43 +200,113 @@ class Service(BaseSubcommand):
         if service_name:
             print('ALL CONTAINERS:\n')
 
-            for idx, item in enumerate(self.list_containers()):
-                print('\t{}: {}'.format(idx, item))
+            tasks = self.list_containers()
+            addresses = self.get_node_addresses([x['Node'] for x in tasks])
+
+            for idx, task in enumerate(tasks):
+                node = task['Node']
+                address = addresses.get(node) or 'unknown'
 
-            print(f'\nSELECTED:\n\t{self.select_container()}')
+                print(
+                    f'\t{idx}: {self.get_container_name(task)}'
+                    f' on {node} ({address}), {task["CurrentState"]}'
+                )
+
+            print(f'\nSELECTED:\n\t{self.get_container_name(self.select_container())}')
         else:
             # print(f'list services for env {self.project_name}\n')
             print(self.list_services())
 
-    @functools.lru_cache()
-    def list_containers(self, service_name: str = None):
-        service_name = service_name or self.service_name
+    @staticmethod
+    def get_container_name(task: dict) -> str:
+        """
+        Returns the name of the container running the given task
+        """
+        return f'{task["Name"]}.{task["ID"]}'
+
+    def get_node_addresses(self, nodes: list) -> dict:
+        """
+        Returns the addresses for the given swarm nodes
+
+        Addresses are cached per remote; only the nodes that are not in the
+        cache are looked up, all of them with a single `docker node inspect`.
+        Each address expires on its own, `settings.NODE_CACHE_TTL` seconds
+        after it was looked up, and nodes that cannot be inspected are not
+        looked up again for the rest of the run.
+        """
+        now = time.time()
+
+        entries = {}
+        if not self.workflow.args.refresh_cache:
+            entries = cache.read(self.node_cache_name) or {}
+
+        # each entry is the address and the time it was looked up
+        entries = {
+            x: y for x, y in entries.items()
+            if isinstance(y, list) and now - y[1] <= settings.NODE_CACHE_TTL
+        }
+
+        missing = set(nodes) - set(entries) - self._uninspectable_nodes
+        if missing:
+            try:
+                addresses = docker.get_node_addresses(missing)
+            except errors.DockerError as exc:
+                self.logger.warning(f'unable to inspect swarm nodes: {exc}')
+
+                self._uninspectable_nodes.update(missing)
+            else:
+                entries.update((x, [y, now]) for x, y in addresses.items())
+
+                cache.write(self.node_cache_name, entries)
+
+        return {x: y[0] for x, y in entries.items()}
+
+    def get_ssh_host(self, task: dict) -> str:
+        """
+        Returns the host to SSH into in order to reach the given task's container
+        """
+        node = task['Node']
+
+        address = self.get_node_addresses([node]).get(node)
+        if address:
+            return address
+
+        # fall back to the node's hostname, converting AWS-style names, e.g. ip-10-0-0-1
+        if node.startswith('ip-'):
+            return node.replace('ip-', '').replace('-', '.')
 
-        command = f'docker service ps --no-trunc --filter desired-state=running {service_name}'
+        return node
 
-        proc = self.execute(command)
+    @functools.lru_cache()
+    def list_containers(self, service_name: str = None) -> list:
+        """
+        Returns the running tasks for the given service
+        """
+        service_name = service_name or self.service_name
 
         # note; because this is being cached, create a list
         # instead of a generator becuase a generator can only
         # be iterated once
         items = []
 
-        try:
-            output = proc.stdout.decode('utf8').splitlines()[1:]
+        for task in docker.get_service_tasks(service_name):
+            if not task['Name'].startswith(f'{service_name}.'):
+                continue
 
-            # check to see there's at least one container listed
-            output[0]
-        except IndexError:
-            raise errors.NoContainer()
-        else:
-            for item in output:
-                if f'{service_name}.' not in item:
-                    continue
+            # only select tasks that are actually running, not ones still being scheduled
+            if not task['CurrentState'].lower().startswith('running'):
+                continue
 
-                items.append(item)
+            items.append(task)
+
+        if not items:
+            raise errors.NoContainer()
 
         return items
 
+    def is_multi_target_okay(self) -> bool:
+        return self.workflow.args.action in ('list',)
+
     def list_services(self):
         """
         Lists all the services for this stack
@@ -155,23 +315,15 @@ class Service(BaseSubcommand):
 
         return proc.stdout.decode('utf8')
 
+    @property
+    def node_cache_name(self) -> str:
+        return f'swarm-nodes-{self.workflow.args.remote or "local"}'
+
     def run_service(self):
         args = self.workflow.args
-        line = self.select_container()
-
-        container_info = line.strip()
-        container_info_split = container_info.split()
-
-        container_hash = container_info_split[0]
-        container_prefix = container_info_split[1]
-        container_host = container_info_split[3]
-
-        # print(container_info)
-
-        if container_host.startswith('ip-'):
-            container_host = container_host.replace('ip-', '').replace('-', '.')
+        task = self.select_container()
 
-        host_info = f'{self.workflow.remote.username}@{container_host}'
+        host_info = f'{self.workflow.remote.username}@{self.get_ssh_host(task)}'
 
         docker_user = ''
         if args.user:
@@ -179,7 +331,7 @@ class Service(BaseSubcommand):
 
         command = f'ssh -t {host_info}'
         docker_command = (
-            f'docker exec -t -i {docker_user}{container_prefix}.{container_hash}'
+            f'docker exec -t -i {docker_user}{self.get_container_name(task)}'
             f' {" ".join(self.workflow.args_remainder)}'
         )
 
@@ -12,11 +12,19 @@ compose-flow -e dev swarm inspect
 import argparse
 import collections
 
+from concurrent.futures import ThreadPoolExecutor
+
 from compose_flow import docker
 from tabulate import tabulate
 
 from .base import BaseSubcommand
 
+# the number of services to look up with a single `docker service inspect`
+INSPECT_BATCH_SIZE = 20
+
+# the number of `docker service inspect` calls to run at once
+INSPECT_WORKERS = 4
+
 
 # https://stackoverflow.com/questions/6027558/flatten-nested-python-dictionaries-compressing-keys
 def flatten(d, parent_key='', sep='_'):
@@ -34,6 +42,8 @@ def flatten(d, parent_key='', sep='_'):
 
 
 class Swarm(BaseSubcommand):
+    multi_target_okay = True
+
     setup_profile = False
 
     @classmethod
@@ -49,8 +59,8 @@ class Swarm(BaseSubcommand):
 
         service_status_l = []
 
-        for service in docker.get_services():
-            service_name = service['Name']
+        for service_config in self.get_service_configs():
+            service_name = service_config['Spec']['Name']
             service_status = {}
 
             service_info = {
@@ -58,9 +68,7 @@ class Swarm(BaseSubcommand):
                 'status': service_status,
             }
 
-            service_config = docker.get_service_config(service_name)
-
-            spec = service_config[0]['Spec']
+            spec = service_config['Spec']
             task_template = spec['TaskTemplate']
 
             # check placement constraints.  if the mode is global, the service should run on every available machine
@@ -83,3 +91,31 @@ class Swarm(BaseSubcommand):
         flat_l = [flatten(x) for x in service_status_l]
 
         print(tabulate(flat_l, headers='keys'))
+
+    @staticmethod
+    def get_service_configs() -> list:
+        """
+        Returns the inspected config of every service in the swarm
+
+        The service list is streamed and services are inspected in batches as
+        soon as a batch is filled, while the rest of the list is still being read.
+        """
+        futures = []
+        batch = []
+
+        with ThreadPoolExecutor(max_workers=INSPECT_WORKERS) as executor:
+            for service in docker.get_services():
+                batch.append(service['Name'])
+
+                if len(batch) == INSPECT_BATCH_SIZE:
+                    futures.append(executor.submit(docker.get_service_configs, batch))
+                    batch = []
+
+            if batch:
+                futures.append(executor.submit(docker.get_service_configs, batch))
+
+            service_configs = []
+            for future in futures:
+                service_configs.extend(future.result())
+
+        return service_configs
@@ -20,8 +20,9 @@ from .subcommands.env import Env
 from .subcommands.profile import Profile
 from .subcommands.remote import Remote
 
-from .. import errors, settings
-from ..config import DC_CONFIG_ROOT
+from .. import errors, settings, spawns, tracing
+from ..compose import COMPOSE_FORMATS
+from ..config import DC_CONFIG_ROOT, get_config
 from ..errors import CommandError, ErrorMessage
 from ..utils import get_repo_name, yaml_load
 
@@ -44,6 +45,9 @@ class Workflow(object):
         # the subcommand that is being run; defined in run() below
         self.subcommand = None
 
+        # the directory compose-flow was launched from, prior to changing into the config root
+        self.working_dir = os.getcwd()
+
         if os.path.exists(DC_CONFIG_ROOT):
             os.chdir(DC_CONFIG_ROOT)
 
@@ -110,8 +114,21 @@ class Workflow(object):
 
         # defaults for these args are set in _set_arg_defaults() below
         parser.add_argument('-c', '--config-name')
-        parser.add_argument('-e', '--environment')
+        parser.add_argument(
+            '-e',
+            '--environment',
+            help='the environment to use; a comma-separated list runs the command against each one',
+        )
         parser.add_argument('-p', '--profile')
+        parser.add_argument(
+            '--compose-format',
+            choices=COMPOSE_FORMATS,
+            default=settings.COMPOSE_FORMAT,
+            help=(
+                'the format compiled compose files are written in; json is much faster '
+                'to write and parse, default=%(default)s'
+            ),
+        )
         parser.add_argument(
             '-n',
             '--project-name',
@@ -127,6 +144,26 @@ class Workflow(object):
             help='override calling tag-version and set the version to the given value',
         )
 
+        # multi-target args
+        parser.add_argument(
+            '--all-remotes',
+            action='store_true',
+            help='run the command against every remote defined in the app config',
+        )
+        parser.add_argument(
+            '--all-clusters',
+            action='store_true',
+            help=(
+                'run the command against every cluster in the rancher `clusters` and '
+                '`kubecontexts` mappings in compose-flow.yml'
+            ),
+        )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            help='the maximum number of targets to run concurrently, default all of them',
+        )
+
         # misc args
         parser.add_argument(
             '--dirty',
@@ -134,6 +171,14 @@ class Workflow(object):
             help='allow dirty working copy for this command',
         )
         parser.add_argument('-l', '--loglevel', default='INFO')
+        parser.add_argument(
+            '--refresh-cache',
+            action='store_true',
+            help=(
+                'ignore locally cached lookups, such as swarm node addresses and '
+                'rancher projects, and refresh them'
+            ),
+        )
         parser.add_argument(
             '--noop',
             '--dry-run',
@@ -145,6 +190,23 @@ class Workflow(object):
             '--version', action='store_true', help='print version and exit'
         )
 
+        # instrumentation args
+        parser.add_argument(
+            '--spawn-report',
+            action='store_true',
+            help='print the number of times each external command was run',
+        )
+        parser.add_argument(
+            '--timings',
+            action='store_true',
+            help='print a table of the time spent in each phase and command',
+        )
+        parser.add_argument(
+            '--trace',
+            metavar='FILE',
+            help='write the time spent in each phase and command to FILE as Chrome trace events',
+        )
+
         self.subparsers = parser.add_subparsers(dest='command')
 
         for subcommand in find_subcommands():
@@ -173,15 +235,29 @@ class Workflow(object):
         if self._check_version_option():
             return
 
+        if self.args.trace or self.args.timings:
+            tracing.enable()
+
+        spawns.reset()
+
         try:
-            self._setup_environment()
+            targets = self.targets
+            if targets:
+                with tracing.span('handle_targets', targets=targets):
+                    return self.subcommand.handle_targets(targets)
+
+            with tracing.span('setup_environment'):
+                self._setup_environment()
 
-            self._setup_remote()
+            with tracing.span('setup_remote'):
+                self._setup_remote()
 
-            self._setup_profile()
+            with tracing.span('setup_profile'):
+                self._setup_profile()
 
             # execute the subcommand
-            message = self.subcommand.handle()
+            with tracing.span('handle', subcommand=self.args.command):
+                message = self.subcommand.handle()
 
             self._write_environment()
         except CommandError as exc:
@@ -192,6 +268,9 @@ class Workflow(object):
             return f'\n{exc}'
         else:
             return message
+        finally:
+            self._write_spawn_report()
+            self._write_trace()
 
     def _set_arg_defaults(self):
         """
@@ -241,7 +320,8 @@ class Workflow(object):
         if self.subcommand.do_validate_profile():
             profile.check()
 
-        self._write_profile()
+        if self.subcommand.write_profile:
+            self._write_profile()
 
     def _setup_remote(self):
         """
@@ -280,10 +360,62 @@ class Workflow(object):
 
         self.__class__.subcommand.fget.cache_clear()  # pylint: disable=E1101
 
+    @property
+    def targets(self) -> list:
+        """
+        Returns the list of environments to fan out to
+
+        An empty list is returned when the command is run against a single environment
+        """
+        if self.args.all_remotes:
+            targets = list(self.app_config.get('remotes', {}).keys())
+            if not targets:
+                raise ErrorMessage(f'no remotes defined in {self.app_config_path}')
+
+            return targets
+
+        if self.args.all_clusters:
+            config = get_config() or {}
+
+            mappings = [(config.get('rancher') or {}).get('clusters') or {}, config.get('kubecontexts') or {}]
+            targets = list(dict.fromkeys(x for mapping in mappings for x in mapping))
+            if not targets:
+                raise ErrorMessage('no rancher clusters or kubecontexts defined in compose-flow.yml')
+
+            return targets
+
+        environment = self.args.environment or ''
+        if ',' not in environment:
+            return []
+
+        return [x.strip() for x in environment.split(',') if x.strip()]
+
     def _write_environment(self):
         """
         Writes environment back out to the docker config
         """
 
+    def _write_spawn_report(self):
+        """
+        Prints the commands spawned during the run when `--spawn-report` is given
+        """
+        if self.args.spawn_report:
+            spawns.print_report(fh=sys.stderr)
+
+    def _write_trace(self):
+        """
+        Writes out the spans recorded when `--trace` or `--timings` is given
+        """
+        if not tracing.is_enabled():
+            return
+
+        if self.args.trace:
+            tracing.write_trace(self.args.trace)
+
+        if self.args.timings:
+            tracing.print_summary(fh=sys.stderr)
+
+        tracing.disable()
+
     def _write_profile(self):
         self.profile.write()
@@ -1,8 +1,24 @@
+import json
 import logging
 import os
 
 from .utils import remerge, yaml_dump, yaml_load
 
+# the formats compiled compose files can be written in; JSON is a subset of
+# YAML, so docker and docker-compose read either
+COMPOSE_FORMATS = ('yml', 'json')
+
+
+def dump_compose(data: dict, compose_format: str = 'yml') -> str:
+    """
+    Returns the compose data serialized in the given format
+    """
+    if compose_format == 'json':
+        # values YAML has types for and JSON does not, e.g. dates, are written as strings
+        return json.dumps(data, indent=2, default=str)
+
+    return yaml_dump(data)
+
 
 def get_overlay_filenames(overlay):
     logger = logging.getLogger('get_overlay_filenames')
@@ -56,6 +72,37 @@ def get_overlay_filenames(overlay):
     return overlay_filenames
 
 
+def load_compose(content: str, compose_format: str = 'yml') -> dict:
+    """
+    Returns the compose data parsed from content in the given format
+    """
+    if compose_format == 'json':
+        return json.loads(content)
+
+    return yaml_load(content)
+
+
+def load_overlay(filename: str) -> [dict, None]:
+    """
+    Returns the parsed contents of the overlay file, None when it does not exist
+    """
+    try:
+        with open(filename, 'r') as fh:
+            return yaml_load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def merge_overlays(overlays: list) -> [dict, None]:
+    """
+    Returns the parsed overlays merged together, later overlays taking precedence
+    """
+    if len(overlays) > 1:
+        return remerge(overlays)
+
+    return overlays[0]
+
+
 def merge_profile(profile: dict) -> str:
     """
     Returns the merged compose file contents
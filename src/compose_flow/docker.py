@@ -10,6 +10,21 @@ from compose_flow import shell
 from .errors import DockerError, NoSuchConfig, NotConnected
 
 
+@contextmanager
+def docker_errors():
+    """
+    Converts errors raised by a docker command into DockerError exceptions
+    """
+    try:
+        yield
+    except shell.ErrorReturnCode_1 as exc:
+        exc_s = f'{exc}'.lower()
+        if 'cannot connect to the docker daemon' in exc_s:
+            raise NotConnected()
+
+        raise DockerError(exc)
+
+
 @contextmanager
 def json_formatter(command: str) -> str:
     """
@@ -61,6 +76,48 @@ def get_nodes() -> Iterable:
         return get_docker_json(json_command, os.environ, jsonl=True)
 
 
+def get_local_images() -> set:
+    """
+    Returns the `repository:tag` names of all the images available locally
+    """
+    output = get_docker_output('docker images --format "{{ .Repository }}:{{ .Tag }}"', os.environ)
+
+    return set(output.splitlines())
+
+
+def get_node_addresses(names: Iterable[str]) -> dict:
+    """
+    Returns the IP addresses of the given swarm nodes
+
+    All the nodes are looked up with a single `docker node inspect` call
+
+    Args:
+        names: the hostnames or IDs of the nodes to look up
+
+    Returns:
+        dict mapping the node hostname and ID to its address
+    """
+    names = sorted(set(names))
+    if not names:
+        return {}
+
+    addresses = {}
+
+    nodes = list(get_docker_json(f'docker node inspect {" ".join(names)}', os.environ))[0]
+    for node in nodes:
+        address = node.get('Status', {}).get('Addr')
+
+        # managers may report an unspecified address; fall back to the manager address
+        if not address or address == '0.0.0.0':
+            manager_address = node.get('ManagerStatus', {}).get('Addr', '')
+            address = manager_address.rsplit(':', 1)[0] or None
+
+        addresses[node['Description']['Hostname']] = address
+        addresses[node['ID']] = address
+
+    return addresses
+
+
 def get_service_config(name: str) -> dict:
     """
     Returns `docker service inspect` as a data object
@@ -77,6 +134,40 @@ def get_service_config(name: str) -> dict:
         return data
 
 
+def get_service_configs(names: Iterable[str]) -> list:
+    """
+    Returns `docker service inspect` for multiple services with a single call
+
+    Args:
+        names: the names of the services
+
+    Returns:
+        list of dicts in the same order as the given names
+    """
+    names = list(names)
+    if not names:
+        return []
+
+    with json_formatter(f'docker service inspect {" ".join(names)}') as command:
+        return list(stream_docker_json(command, os.environ))
+
+
+def get_service_tasks(name: str, desired_state: str = 'running') -> list:
+    """
+    Returns the tasks of the given service as data objects
+
+    Args:
+        name: the name of the service
+        desired_state: only return tasks with this desired state
+
+    Returns:
+        list of dicts as output by `docker service ps`
+    """
+    command = f'docker service ps --no-trunc --filter desired-state={desired_state} {name}'
+    with json_formatter(command) as json_command:
+        return list(get_docker_json(json_command, os.environ, jsonl=True))
+
+
 def get_services() -> Iterable:
     """
     Returns an iterable of service objects
@@ -85,6 +176,20 @@ def get_services() -> Iterable:
         return get_docker_json(json_command, os.environ, jsonl=True)
 
 
+def get_stack_services(name: str) -> list:
+    """
+    Returns the services of the given stack as data objects
+
+    Args:
+        name: the name of the stack
+
+    Returns:
+        list of dicts as output by `docker stack services`
+    """
+    with json_formatter(f'docker stack services {name}') as json_command:
+        return list(get_docker_json(json_command, os.environ, jsonl=True))
+
+
 def load_config(name: str, path: str) -> None:
     """
     Loads config into swarm
@@ -103,6 +208,14 @@ def remove_config(name: str) -> None:
     shell.execute(f'docker config rm {name}', os.environ)
 
 
+def tag_image(source: str, target: str) -> None:
+    """
+    Tags the source image with the target name
+    """
+    with docker_errors():
+        shell.execute(f'docker tag {source} {target}', os.environ)
+
+
 def get_docker_json(command: str, env: dict, jsonl: bool = False) -> [dict, Iterable]:
     """
     Returns docker output as a JSON object
@@ -115,13 +228,10 @@ def get_docker_json(command: str, env: dict, jsonl: bool = False) -> [dict, Iter
     Returns:
         dict
     """
-    content = get_docker_output(command, env)
-
     if jsonl:
-        for line in content.splitlines():
-            yield json.loads(line)
+        yield from stream_docker_json(command, env)
     else:
-        yield json.loads(content)
+        yield json.loads(get_docker_output(command, env))
 
 
 def get_docker_output(command: str, env: dict) -> str:
@@ -135,13 +245,28 @@ def get_docker_output(command: str, env: dict) -> str:
     Returns:
         str
     """
-    try:
+    with docker_errors():
         proc = shell.execute(command, env)
-    except shell.ErrorReturnCode_1 as exc:
-        exc_s = f'{exc}'.lower()
-        if 'cannot connect to the docker daemon' in exc_s:
-            raise NotConnected()
-
-        raise DockerError(exc)
 
     return proc.stdout.decode('utf8')
+
+
+def stream_docker_json(command: str, env: dict) -> Iterable:
+    """
+    Yields docker output as JSON objects, one per line, as they are produced
+
+    Unlike `get_docker_output()` the output is not buffered in full, so the
+    first objects are available while docker is still running.
+
+    Args:
+        command: the docker command to run
+        env: the environment to run the command under
+
+    Returns:
+        iterable of dicts
+    """
+    with docker_errors():
+        for line in shell.execute(command, env, _iter=True):
+            line = line.strip()
+            if line:
+                yield json.loads(line)
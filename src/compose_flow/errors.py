@@ -22,6 +22,12 @@ class AlreadyConnected(ErrorMessage):
     """
 
 
+class BuildError(ErrorMessage):
+    """
+    Raised when docker images fail to build
+    """
+
+
 class EnvError(ErrorMessage):
     """
     Error for when environment variables are not found
@@ -58,12 +64,36 @@ class ProfileError(ErrorMessage):
     """
 
 
+class PushError(ErrorMessage):
+    """
+    Raised when docker images fail to push
+    """
+
+
+class RancherError(ErrorMessage):
+    """
+    Raised when the Rancher API cannot answer a request
+    """
+
+
+class RegistryError(Exception):
+    """
+    Raised when a docker registry cannot answer a request
+    """
+
+
 class RemoteUndefined(ErrorMessage):
     """
     Raised when no remote is defined
     """
 
 
+class RolloutError(ErrorMessage):
+    """
+    Raised when the services of a stack fail to converge after a deploy
+    """
+
+
 class RuntimeEnvError(ErrorMessage):
     """
     Raised when variable substitution at runtime fails
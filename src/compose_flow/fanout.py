@@ -0,0 +1,164 @@
+"""
+Fan-out module
+
+Runs a compose-flow command against multiple targets (environments) at once.
+Every target is run in its own compose-flow process so that per-environment
+state, such as the SSH tunnel and the `DOCKER_HOST` it sets up, stays isolated.
+"""
+import collections
+import subprocess
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tabulate import tabulate
+
+from . import spawns, tracing
+
+# global options that select targets; they are stripped from the argv given to each target
+# `--trace` is stripped as well so that the targets do not all write to the same file
+TARGET_FLAGS = ('--all-remotes', '--all-clusters')
+TARGET_OPTIONS = ('-e', '--environment', '--jobs', '--trace')
+
+TargetResult = collections.namedtuple(
+    'TargetResult', ['target', 'returncode', 'output', 'duration']
+)
+
+
+def get_target_command(target: str, argv: list) -> list:
+    """
+    Returns the command that runs compose-flow against a single target
+    """
+    return [sys.executable, '-m', 'compose_flow', '-e', target] + argv
+
+
+def get_status(result: TargetResult) -> str:
+    """
+    Returns a short description of how the target did, e.g. `ok 12.3s`
+    """
+    if result is None:
+        return 'skipped'
+
+    status = 'ok' if result.returncode == 0 else f'failed ({result.returncode})'
+
+    return f'{status} {result.duration:.1f}s'
+
+
+def print_report(targets: list, phases: dict, fh=None) -> None:
+    """
+    Prints a table of how each target did in each phase of a multi-phase run
+
+    Args:
+        targets: the targets in the order they were given
+        phases: a dict of phase name to the list of TargetResult objects for that phase
+    """
+    results = [{x.target: x for x in y} for y in phases.values()]
+
+    rows = [[x] + [get_status(y.get(x)) for y in results] for x in targets]
+
+    print(tabulate(rows, headers=['target'] + list(phases)), file=fh or sys.stdout)
+
+
+def print_result(result: TargetResult, width: int = 0, fh=None) -> None:
+    """
+    Prints the output of a target with every line prefixed by the target name
+    """
+    fh = fh or sys.stdout
+
+    for line in result.output.splitlines():
+        print(f'{result.target:<{width}} | {line}', file=fh)
+
+    fh.flush()
+
+
+def run_target(target: str, argv: list, cwd: str = None) -> TargetResult:
+    """
+    Runs compose-flow against the given target and collects its output
+    """
+    start = time.time()
+
+    command = get_target_command(target, argv)
+
+    spawns.record(command)
+
+    with tracing.span(target, 'target', argv=command) as trace:
+        proc = subprocess.run(
+            command,
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+
+        trace.args['exit_code'] = proc.returncode
+
+    return TargetResult(
+        target, proc.returncode, proc.stdout.decode('utf8', 'replace'), time.time() - start
+    )
+
+
+def run_targets(targets: list, argv: list, cwd: str = None, jobs: int = None) -> list:
+    """
+    Runs compose-flow against all the given targets concurrently
+
+    The output of each target is printed as soon as that target completes so
+    that the output of different targets is never interleaved.
+
+    Args:
+        targets: the environment names to run against
+        argv: the compose-flow arguments, without any target options
+        cwd: the directory to run compose-flow from
+        jobs: the maximum number of targets to run at once, all of them by default
+
+    Returns:
+        list of TargetResult objects in the order the targets were given
+    """
+    width = max(len(x) for x in targets)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs or len(targets)) as executor:
+        futures = [executor.submit(run_target, x, argv, cwd) for x in targets]
+
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.target] = result
+
+            print_result(result, width=width)
+
+    return [results[x] for x in targets]
+
+
+def strip_target_args(argv: list, command: str = None) -> list:
+    """
+    Returns the given argv without the options that select targets
+
+    Only the global options that come before the subcommand are inspected,
+    everything from the subcommand onward is passed along untouched.
+    """
+    stripped = []
+
+    idx = 0
+    while idx < len(argv):
+        arg = argv[idx]
+
+        if command and arg == command:
+            stripped.extend(argv[idx:])
+
+            break
+
+        if arg in TARGET_FLAGS:
+            idx += 1
+        elif arg in TARGET_OPTIONS:
+            idx += 2
+        elif arg.startswith('--') and arg.split('=', 1)[0] in TARGET_OPTIONS:
+            idx += 1
+        elif arg.startswith('-e') and not arg.startswith('--'):
+            # the value is attached to the short option, e.g. `-edev,prod`
+            idx += 1
+        else:
+            stripped.append(arg)
+
+            idx += 1
+
+    return stripped
@@ -0,0 +1,434 @@
+"""
+Git module
+
+Computes the same version string as the `tag-version` cli, reading the
+repository's refs and index directly instead of running git whenever possible.
+
+The version and the result of the working copy check are cached along with
+a fingerprint of the files they were derived from, so repeated runs in an
+unchanged checkout do not run git at all.
+"""
+import hashlib
+import os
+import struct
+import zlib
+
+from . import cache, shell
+
+# the size of an index entry up to the path, without extended flags
+INDEX_ENTRY_SIZE = 62
+
+INDEX_EXTENDED_FLAG = 0x4000
+
+
+class GitRepo(object):
+    """
+    Reads version information from a git repository
+    """
+
+    def __init__(self, git_dir: str, work_tree: str):
+        self.git_dir = git_dir
+        self.work_tree = work_tree
+
+        # linked worktrees keep their own HEAD and index, but share refs and objects
+        self.common_dir = git_dir
+
+        try:
+            with open(os.path.join(git_dir, 'commondir'), 'r') as fh:
+                self.common_dir = os.path.normpath(os.path.join(git_dir, fh.read().strip()))
+        except FileNotFoundError:
+            pass
+
+    @property
+    def branch(self) -> str:
+        """
+        Returns the branch name the way `tag-version` appends it to versions
+        """
+        branch = os.environ.get('GIT_BRANCH')
+        if branch is None:
+            head = self.read_head()
+
+            branch = 'HEAD'
+            if head.startswith('ref: refs/heads/'):
+                branch = head[len('ref: refs/heads/'):]
+
+        return branch.replace('/', '--')
+
+    @property
+    def cache_name(self) -> str:
+        git_dir_hash = hashlib.sha1(self.git_dir.encode('utf8')).hexdigest()[:12]
+
+        return f'tag-version-{git_dir_hash}'
+
+    def describe(self) -> str:
+        """
+        Returns the output of `git describe --tags --always`
+        """
+        proc = shell.execute('git describe --tags --always', os.environ, _cwd=self.work_tree)
+
+        return proc.stdout.decode('utf8').strip()
+
+    def get_exact_tag(self, commit: str) -> [str, bool, None]:
+        """
+        Returns the tag that points at the given commit
+
+        Returns:
+            the tag name, None when no tag points at the commit or False when
+            it's not possible to tell without running git
+        """
+        matches = []
+        unresolved = False
+
+        for name, (target, peeled) in self.get_tags().items():
+            if not peeled:
+                peeled = self.peel_tag(target)
+
+            if peeled is None:
+                unresolved = True
+            elif peeled == commit:
+                matches.append(name)
+
+        if len(matches) == 1:
+            return matches[0]
+        elif matches or unresolved:
+            return False
+
+        return None
+
+    def get_index_paths(self) -> list:
+        """
+        Returns the paths of all the files tracked in the index
+
+        Supports index versions 2, 3 and 4.
+        """
+        with open(os.path.join(self.git_dir, 'index'), 'rb') as fh:
+            data = fh.read()
+
+        signature, version, count = struct.unpack('>4sLL', data[:12])
+        if signature != b'DIRC' or version not in (2, 3, 4):
+            raise ValueError(f'unsupported index version={version}')
+
+        paths = []
+        pos = 12
+        previous_path = b''
+
+        for _ in range(count):
+            entry_start = pos
+
+            flags, = struct.unpack('>H', data[pos + 60:pos + 62])
+            pos += INDEX_ENTRY_SIZE
+
+            if version >= 3 and flags & INDEX_EXTENDED_FLAG:
+                pos += 2
+
+            if version == 4:
+                # the path is prefix compressed against the previous entry's path
+                strip, pos = read_offset(data, pos)
+
+                end = data.index(b'\0', pos)
+                path = previous_path[:len(previous_path) - strip] + data[pos:end]
+                pos = end + 1
+            else:
+                end = data.index(b'\0', pos)
+                path = data[pos:end]
+
+                # entries are padded with NULs to a multiple of eight bytes
+                pos = entry_start + ((end - entry_start + 8) & ~7)
+
+            paths.append(path.decode('utf8', 'surrogateescape'))
+            previous_path = path
+
+        return paths
+
+    def get_status_key(self, ignored: list = None) -> str:
+        """
+        Returns a fingerprint of everything `git status` looks at
+
+        This covers the stat info of the index and of every tracked file as
+        well as the mtime of every directory in the work tree, which changes
+        whenever a file is added to or removed from the directory.
+
+        Args:
+            ignored: the ignored directories, relative to the work tree, which are not walked
+        """
+        hasher = hashlib.sha1()
+
+        for path in ('HEAD', 'index'):
+            hasher.update(get_stat_key(os.path.join(self.git_dir, path)))
+
+        hasher.update(get_stat_key(os.path.join(self.common_dir, 'info', 'exclude')))
+
+        for path in self.get_index_paths():
+            hasher.update(path.encode('utf8', 'surrogateescape'))
+            hasher.update(get_stat_key(os.path.join(self.work_tree, path)))
+
+        # nothing in an ignored directory shows up in the status, and changing the ignore
+        # rules changes a .gitignore file or info/exclude, both of which are fingerprinted
+        ignored = set(ignored or ())
+
+        for root, dirs, _ in os.walk(self.work_tree):
+            directory = os.path.relpath(root, self.work_tree)
+            if directory == '.':
+                directory = ''
+
+            dirs[:] = sorted(
+                x for x in dirs if x != '.git' and os.path.join(directory, x) not in ignored
+            )
+
+            hasher.update(f'dir:{directory}'.encode('utf8', 'surrogateescape'))
+            hasher.update(get_stat_key(root))
+
+        return hasher.hexdigest()
+
+    def get_status(self) -> tuple:
+        """
+        Returns the lines of `git status --untracked --short` and the ignored directories
+
+        Ignored directories are listed by the same command without descending
+        into them.
+        """
+        proc = shell.execute(
+            'git status --untracked --short --ignored=matching', os.environ, _cwd=self.work_tree
+        )
+
+        status = []
+        ignored = []
+
+        for line in proc.stdout.decode('utf8').splitlines():
+            if not line.startswith('!! '):
+                status.append(line)
+            elif line.endswith('/'):
+                ignored.append(line[len('!! '):].rstrip('/'))
+
+        return status, ignored
+
+    def get_tags(self) -> dict:
+        """
+        Returns all the tags in the repo
+
+        Returns:
+            dict mapping tag names to a tuple of the target and, when known, the peeled commit
+        """
+        tags = {}
+
+        try:
+            with open(os.path.join(self.common_dir, 'packed-refs'), 'r') as fh:
+                name = None
+                peeled = False
+
+                for line in fh:
+                    line = line.strip()
+
+                    if line.startswith('# pack-refs with:'):
+                        # when peeled, tags without a `^` line point directly at a commit
+                        peeled = 'peeled' in line.split(':', 1)[1].split()
+                    elif line.startswith('^') and name:
+                        tags[name] = (tags[name][0], line[1:])
+                    elif line and not line.startswith('#'):
+                        sha, ref = line.split(' ', 1)
+
+                        name = None
+                        if ref.startswith('refs/tags/'):
+                            name = ref[len('refs/tags/'):]
+                            tags[name] = (sha, sha if peeled else None)
+        except FileNotFoundError:
+            pass
+
+        # loose refs take precedence over packed ones
+        tags_dir = os.path.join(self.common_dir, 'refs', 'tags')
+        for root, _, files in os.walk(tags_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, tags_dir).replace(os.sep, '/')
+
+                with open(path, 'r') as fh:
+                    tags[name] = (fh.read().strip(), None)
+
+        return tags
+
+    def get_version_key(self) -> str:
+        """
+        Returns a fingerprint of everything the version is derived from
+        """
+        hasher = hashlib.sha1()
+
+        hasher.update(self.read_head().encode('utf8'))
+        hasher.update((self.resolve_head() or '').encode('utf8'))
+        hasher.update((os.environ.get('GIT_BRANCH') or '').encode('utf8'))
+        hasher.update(get_stat_key(os.path.join(self.common_dir, 'packed-refs')))
+
+        for root, dirs, files in os.walk(os.path.join(self.common_dir, 'refs', 'tags')):
+            dirs.sort()
+
+            hasher.update(get_stat_key(root))
+            for filename in sorted(files):
+                hasher.update(get_stat_key(os.path.join(root, filename)))
+
+        return hasher.hexdigest()
+
+    def is_clean(self) -> tuple:
+        """
+        Returns whether the working copy is clean
+
+        Returns:
+            tuple of whether the working copy is clean and the `git status` lines
+        """
+        entry = cache.read(self.cache_name) or {}
+
+        status_key = self.get_status_key(entry.get('ignored'))
+        if entry.get('status_key') == status_key:
+            status = entry['status']
+        else:
+            status, ignored = self.get_status()
+
+            # take the fingerprint again in case git refreshed the index
+            entry.update({
+                'status_key': self.get_status_key(ignored),
+                'status': status,
+                'ignored': ignored,
+            })
+            cache.write(self.cache_name, entry)
+
+        return not status, status
+
+    def peel_tag(self, sha: str) -> [str, None]:
+        """
+        Returns the commit a tag points to
+
+        Returns:
+            the commit sha, or None when the tag object is packed and cannot be read
+        """
+        path = os.path.join(self.common_dir, 'objects', sha[:2], sha[2:])
+
+        try:
+            with open(path, 'rb') as fh:
+                data = zlib.decompress(fh.read())
+        except FileNotFoundError:
+            return None
+
+        header, _, body = data.partition(b'\0')
+        if header.startswith(b'commit '):
+            return sha
+        elif header.startswith(b'tag '):
+            target = body.split(b'\n', 1)[0]
+            if target.startswith(b'object '):
+                return self.peel_tag(target[len(b'object '):].decode('utf8'))
+
+        return None
+
+    def read_head(self) -> str:
+        with open(os.path.join(self.git_dir, 'HEAD'), 'r') as fh:
+            return fh.read().strip()
+
+    def resolve_head(self) -> [str, None]:
+        """
+        Returns the commit HEAD points to, or None when there are no commits
+        """
+        head = self.read_head()
+        if not head.startswith('ref: '):
+            return head
+
+        ref = head[len('ref: '):]
+
+        for git_dir in (self.git_dir, self.common_dir):
+            try:
+                with open(os.path.join(git_dir, ref), 'r') as fh:
+                    return fh.read().strip()
+            except FileNotFoundError:
+                pass
+
+        try:
+            with open(os.path.join(self.common_dir, 'packed-refs'), 'r') as fh:
+                for line in fh:
+                    if line.rstrip('\n').endswith(f' {ref}'):
+                        return line.split(' ', 1)[0]
+        except FileNotFoundError:
+            pass
+
+        return None
+
+    def tag_version(self) -> str:
+        """
+        Returns the version string, running `git describe` only when the commit is not tagged
+        """
+        entry = cache.read(self.cache_name) or {}
+
+        version_key = self.get_version_key()
+        if entry.get('version_key') == version_key:
+            return entry['version']
+
+        commit = self.resolve_head()
+        if not commit:
+            return None
+
+        version = self.get_exact_tag(commit)
+        if version is False:
+            version = self.describe()
+
+            # check whether describe found an exact match
+            if version not in self.get_tags():
+                version = f'{version}-{self.branch}'
+        elif version is None:
+            version = f'{self.describe()}-{self.branch}'
+
+        entry.update({'version_key': version_key, 'version': version})
+        cache.write(self.cache_name, entry)
+
+        return version
+
+
+def find_repo(path: str = None) -> [GitRepo, None]:
+    """
+    Returns the repo the given path, or the current directory, is in
+    """
+    path = os.path.abspath(path or os.getcwd())
+
+    while True:
+        git_path = os.path.join(path, '.git')
+
+        if os.path.isdir(git_path):
+            return GitRepo(git_path, path)
+        elif os.path.isfile(git_path):
+            # worktrees and submodules point to the actual git dir
+            with open(git_path, 'r') as fh:
+                content = fh.read().strip()
+
+            if content.startswith('gitdir: '):
+                git_dir = os.path.join(path, content[len('gitdir: '):])
+
+                return GitRepo(os.path.normpath(git_dir), path)
+
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+
+        path = parent
+
+
+def get_stat_key(path: str) -> bytes:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return b'missing\0'
+
+    return f'{stat.st_mtime_ns}:{stat.st_size}:{stat.st_mode}\0'.encode('utf8')
+
+
+def read_offset(data: bytes, pos: int) -> tuple:
+    """
+    Reads a variable length integer as encoded in index v4 entries
+
+    Returns:
+        tuple of the integer and the position after it
+    """
+    byte = data[pos]
+    pos += 1
+
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+
+        value = ((value + 1) << 7) | (byte & 0x7f)
+
+    return value, pos
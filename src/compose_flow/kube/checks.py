@@ -2,10 +2,16 @@
 
 from abc import ABC
 import logging
-from typing import List
+from typing import Callable, Iterable, List
 
 import yaml
 
+# use libyaml when it's available; it's several times faster on large manifest sets
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# rules registered without kinds are run against every document
+ANY_KIND = '*'
+
 POD_TEMPLATE_RESOURCES = [
     'DaemonSet',
     'Deployment',
@@ -20,55 +26,136 @@ JOB_TEMPLATE_RESOURCES = [
 ]
 
 
+def rule(*kinds: str) -> Callable:
+    """
+    Registers the decorated checker method as a rule for documents of the given kinds
+
+    The method is called with each matching document and returns, or
+    yields, the violations found in it; with no kinds it's called with
+    every document.
+    """
+    def decorator(fn):
+        fn.rule_kinds = kinds or (ANY_KIND,)
+
+        return fn
+
+    return decorator
+
+
 class BaseChecker(ABC):
     check_prefix = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # build the rule registry once per class rather than on every check
+        cls._rules = {}
+        cls._checks = []
+
+        for name in sorted(dir(cls)):
+            if name.startswith('__'):
+                continue
+
+            attr = getattr(cls, name)
+            if not callable(attr):
+                continue
+
+            for kind in getattr(attr, 'rule_kinds', ()):
+                cls._rules.setdefault(kind, []).append(attr)
+
+            if cls.check_prefix and name.startswith(cls.check_prefix):
+                cls._checks.append(name)
+
     @property
     def logger(self):
         return logging.getLogger(f'{__name__}.{self.__class__.__name__}')
 
     def check(self, rendered: str) -> List[str]:
-        """Main method that runs all check methods defined on this class."""
+        """
+        Main method that runs all the rules and check methods defined on this class
+
+        Every document is visited once and passed to the rules registered
+        for its kind; all violations are collected rather than only the first.
+        """
         errors = []
 
-        if self.check_prefix is None:
+        if self.check_prefix is None and not self._rules:
             raise AttributeError("The class attribute `check_prefix` must be non-null!")
 
         # Load all YAML documents from string `rendered`
         loaded = self._load_rendered_yaml(rendered)
 
-        checks = self._get_all_checks()
-        for check in checks:
+        for kind, documents in self.index_documents(loaded).items():
+            rules = self._rules.get(kind, []) + self._rules.get(ANY_KIND, [])
+            if not rules:
+                continue
+
+            for document in documents:
+                for rule_fn in rules:
+                    errors.extend(
+                        f'{get_document_name(document)}: {x}'
+                        for x in iter_errors(rule_fn(self, document))
+                    )
+
+        # checks that look at the documents as a whole
+        for check in self._get_all_checks():
             result = check(loaded)
             if result:
                 errors.append(result)
 
         return errors
 
+    @staticmethod
+    def index_documents(documents: list) -> dict:
+        """
+        Returns the documents grouped by kind
+
+        Empty documents, e.g. from a trailing `---`, are skipped.
+        """
+        index = {}
+
+        for document in documents:
+            if isinstance(document, dict):
+                index.setdefault(document.get('kind'), []).append(document)
+
+        return index
+
     def _get_all_checks(self):
         """Return a list of the methods on this class which begin with `check_prefix`."""
-        this_class = self.__class__
+        return [getattr(self, x) for x in self._checks]
 
-        check_list = [
-            getattr(self, func) for func in dir(self.__class__)
-            if callable(getattr(this_class, func))
-            and func.startswith(self.check_prefix)
-        ]
+    def _load_rendered_yaml(self, rendered: str) -> list:
+        """Load the rendered YAML which is passed in to the `check` method."""
+        return list(yaml.load_all(rendered, Loader=YAML_LOADER))
 
-        return check_list
 
-    def _load_rendered_yaml(self, rendered: str) -> dict:
-        """Load the rendered YAML which is passed in to the `check` method."""
-        return [d for d in yaml.load_all(rendered)]
+def get_document_name(document: dict) -> str:
+    """
+    Returns the `Kind/name` of the document, used to tell which document a violation is in
+    """
+    name = (document.get('metadata') or {}).get('name') or '<unnamed>'
+
+    return f'{document.get("kind")}/{name}'
+
+
+def iter_errors(result: [str, Iterable, None]) -> Iterable:
+    """
+    Returns the errors returned by a rule as an iterable
+    """
+    if not result:
+        return []
+    elif isinstance(result, str):
+        return [result]
+
+    return result
 
 
 class ManifestChecker(BaseChecker):
     """Check Kubernetes YAML resource manifests."""
-    check_prefix = '_check_manifest_'
 
-    def _check_manifest_ingress_annotations(self, documents: list) -> str:
+    @rule('Ingress')
+    def check_ingress_annotations(self, doc: dict) -> Iterable:
         """Check ingresses for appropriate annotations"""
-        ingress_kind = 'Ingress'
         internal_value = 'internal'
         external_value = 'internet-facing'
 
@@ -81,67 +168,80 @@ class ManifestChecker(BaseChecker):
                                   'Please ensure you are deploying to a production cluster '
                                   'and you intend to make your services PUBLICLY accessible!')
 
-        for doc in documents:
-            if doc.get('kind') == ingress_kind:
-                metadata = doc.get('metadata')
-                if metadata is None:
-                    return missing_metadata_msg
-                annotations = metadata.get('annotations')
-                if annotations is None:
-                    return ingress_error_msg
-
-                class_anno = annotations.get('kubernetes.io/ingress.class')
-                if class_anno != 'nginx':
-                    print(annotations)
-                    has_internal = any('scheme' in k and internal_value in v for k, v in annotations.items())
-                    has_external = any('scheme' in k and external_value in v for k, v in annotations.items())
-                    if has_external:
-                        self.logger.warn(public_ingress_warning)
-                    if not has_internal and not has_external:
-                        return ingress_error_msg
-
-    def _check_manifest_resources(self, documents: list) -> str:
+        metadata = doc.get('metadata')
+        if metadata is None:
+            yield missing_metadata_msg
+
+            return
+
+        annotations = metadata.get('annotations')
+        if annotations is None:
+            yield ingress_error_msg
+
+            return
+
+        class_anno = annotations.get('kubernetes.io/ingress.class')
+        if class_anno != 'nginx':
+            has_internal = any('scheme' in k and internal_value in v for k, v in annotations.items())
+            has_external = any('scheme' in k and external_value in v for k, v in annotations.items())
+            if has_external:
+                self.logger.warning(public_ingress_warning)
+            if not has_internal and not has_external:
+                yield ingress_error_msg
+
+    @rule(*POD_TEMPLATE_RESOURCES)
+    def check_resources(self, doc: dict) -> Iterable:
         """Check resource types that deploy Pods for resource constraints."""
-        for doc in documents:
-            kind = doc.get('kind')
-
-            # If this kind defines a job template, pull it out
-            if kind in JOB_TEMPLATE_RESOURCES:
-                doc = doc.get('spec').get('jobTemplate')
-                if doc is None:
-                    return f'{kind} resources MUST specify a job template!'
-
-            if kind in POD_TEMPLATE_RESOURCES:
-                pod_template = doc.get('spec').get('template')
-                if pod_template is None:
-                    return f'{kind} resources MUST specify a pod template!'
-
-                pod_spec = pod_template.get('spec')
-                if pod_spec is None:
-                    return f'{kind} resources MUST specify a pod spec!'
-
-                containers = pod_spec.get('containers')
-                if not containers:
-                    return f'{kind} resources MUST specify at least one container!'
-
-                init_containers = pod_spec.get('initContainers')
-                if init_containers:
-                    containers = containers + init_containers
-
-                missing_resources_msg = (f'All containers and initContainers in a {kind}'
-                                         'must define resource constraints!')
-                for cont in containers:
-                    resources = cont.get('resources')
-                    if not resources:
-                        return missing_resources_msg
-
-                    limits = resources.get('limits')
-                    if not limits or not limits.get('cpu') or not limits.get('memory'):
-                        return missing_resources_msg
-
-                    requests = resources.get('requests')
-                    if not requests or not requests.get('cpu') or not requests.get('memory'):
-                        return missing_resources_msg
+        kind = doc.get('kind')
+
+        # If this kind defines a job template, pull it out
+        if kind in JOB_TEMPLATE_RESOURCES:
+            doc = (doc.get('spec') or {}).get('jobTemplate')
+            if doc is None:
+                yield f'{kind} resources MUST specify a job template!'
+
+                return
+
+        pod_template = (doc.get('spec') or {}).get('template')
+        if pod_template is None:
+            yield f'{kind} resources MUST specify a pod template!'
+
+            return
+
+        pod_spec = pod_template.get('spec')
+        if pod_spec is None:
+            yield f'{kind} resources MUST specify a pod spec!'
+
+            return
+
+        containers = pod_spec.get('containers')
+        if not containers:
+            yield f'{kind} resources MUST specify at least one container!'
+
+            return
+
+        init_containers = pod_spec.get('initContainers')
+        if init_containers:
+            containers = containers + init_containers
+
+        for cont in containers:
+            missing_resources_msg = (f'All containers and initContainers in a {kind} '
+                                     f'must define resource constraints! '
+                                     f'container={cont.get("name")}')
+
+            resources = cont.get('resources')
+            if not resources:
+                yield missing_resources_msg
+
+                continue
+
+            limits = resources.get('limits')
+            requests = resources.get('requests')
+
+            if not limits or not limits.get('cpu') or not limits.get('memory'):
+                yield missing_resources_msg
+            elif not requests or not requests.get('cpu') or not requests.get('memory'):
+                yield missing_resources_msg
 
 
 class AnswersChecker(BaseChecker):
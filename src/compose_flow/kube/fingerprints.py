@@ -0,0 +1,107 @@
+"""
+Manifest fingerprints
+
+Hashes rendered Kubernetes documents so that documents that have not changed
+since they were last applied can be skipped on the next deploy.  The
+fingerprint is stored in an annotation on each object, so the comparison is
+made against the cluster itself rather than against anything kept locally.
+"""
+import hashlib
+import json
+
+import yaml
+
+from compose_flow.kube.checks import YAML_LOADER
+
+# the annotation that holds a document's fingerprint
+FINGERPRINT_ANNOTATION = 'compose-flow/fingerprint'
+
+
+def annotate(document: dict, fingerprint: str) -> dict:
+    """
+    Returns a copy of the document with its fingerprint in an annotation
+    """
+    document = dict(document)
+
+    metadata = dict(document.get('metadata') or {})
+    annotations = dict(metadata.get('annotations') or {})
+
+    annotations[FINGERPRINT_ANNOTATION] = fingerprint
+    metadata['annotations'] = annotations
+    document['metadata'] = metadata
+
+    return document
+
+
+def get_changed_keys(live_fingerprints: dict, fingerprints: dict) -> set:
+    """
+    Returns the keys of the documents whose fingerprint differs from the one in the cluster
+    """
+    return set(x for x, y in fingerprints.items() if live_fingerprints.get(x) != y)
+
+
+def get_document_key(document: dict, namespace: str = None) -> str:
+    """
+    Returns the `kind/namespace/name` that identifies the document in the cluster
+    """
+    metadata = document.get('metadata') or {}
+    namespace = metadata.get('namespace') or namespace or 'default'
+
+    return f'{document.get("kind")}/{namespace}/{metadata.get("name")}'
+
+
+def get_fingerprint(document: dict, *args) -> str:
+    """
+    Returns a hash of the document's content along with the given args
+
+    The document is hashed in a canonical form so that formatting changes
+    that do not change the content do not change the fingerprint.
+    """
+    hasher = hashlib.sha256()
+
+    hasher.update(json.dumps([document, args], sort_keys=True, default=str).encode('utf8'))
+
+    return hasher.hexdigest()
+
+
+def get_live_fingerprints(output: str) -> dict:
+    """
+    Returns the fingerprints annotated on the objects in `kubectl get -o json` output
+
+    Returns:
+        dict mapping the key of each annotated object to its fingerprint
+    """
+    if not output.strip():
+        return {}
+
+    data = json.loads(output)
+
+    items = data.get('items', []) if data.get('kind') == 'List' else [data]
+
+    live_fingerprints = {}
+    for item in items:
+        annotations = (item.get('metadata') or {}).get('annotations') or {}
+
+        fingerprint = annotations.get(FINGERPRINT_ANNOTATION)
+        if fingerprint:
+            live_fingerprints[get_document_key(item)] = fingerprint
+
+    return live_fingerprints
+
+
+def load_documents(content: str) -> list:
+    """
+    Returns the non-empty documents in the rendered content
+    """
+    return [x for x in yaml.load_all(content, Loader=YAML_LOADER) if x]
+
+
+def set_namespace(document: dict, namespace: str) -> dict:
+    """
+    Returns a copy of the document in the given namespace, unless it names its own
+    """
+    metadata = document.get('metadata') or {}
+    if not namespace or metadata.get('namespace'):
+        return document
+
+    return dict(document, metadata=dict(metadata, namespace=namespace))
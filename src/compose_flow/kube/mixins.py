@@ -1,24 +1,28 @@
 """
 Compose subcommand
 """
+from collections import OrderedDict, namedtuple
 from functools import lru_cache
+import atexit
 import os
 import pathlib
-import sh
+import shlex
+import shutil
+import tempfile
 import yaml
 
 
+from compose_flow import settings, shell
 from compose_flow.errors import InvalidTargetClusterError, MissingManifestError, ManifestCheckError
 from compose_flow.config import get_config
+from compose_flow.kube import fingerprints, rancher
 from compose_flow.kube.checks import BaseChecker, ManifestChecker, AnswersChecker
 from compose_flow.utils import render, render_jinja
 
-CLUSTER_LS_FORMAT = '{{.Cluster.Name}}: {{.Cluster.ID}}'
-PROJECT_LS_FORMAT = '{{.Project.Name}}: {{.Project.ID}}'
-
 EXCLUDE_PROFILES = ['local']
 
-NONFATAL_ERROR_MESSAGES = ['strconv.ParseFloat: parsing "']
+# a command that applies rendered documents read from stdin
+ApplyCommand = namedtuple('ApplyCommand', ['command', 'content'])
 
 
 class KubeMixIn(object):
@@ -26,8 +30,6 @@ class KubeMixIn(object):
     Mix-in for generic Kubernetes CLI interactions
     """
 
-    kubectl_command = 'rancher kubectl'
-
     @property
     @lru_cache()
     def config(self):
@@ -60,43 +62,161 @@ class KubeMixIn(object):
         else:
             return install_command_method(app_name, rendered_path, namespace, chart, version)
 
+    @property
+    def helm_command(self) -> str:
+        return f'helm --kube-context {shlex.quote(self.kube_context)}'
+
+    @property
+    def kubectl_command(self) -> str:
+        return f'kubectl --context {shlex.quote(self.kube_context)}'
+
+    @property
+    def rancher_command(self) -> str:
+        return f'rancher --config {shlex.quote(self.rancher_config_dir)}'
+
+    @lru_cache()
     def list_helm_apps(self) -> str:
-        return str(self.execute("helm ls -q --all")).split('\n')
+        return str(self.execute(f"{self.helm_command} ls -q --all")).split('\n')
 
     def get_helm_app_install_command(
             self, app_name: str, rendered_path: str,
             namespace: str, chart: str, version: str):
-        return f'helm install --name {app_name} -f {rendered_path} --namespace {namespace} --version {version} {chart}'
+        return (
+            f'{self.helm_command} install --name {app_name} -f {rendered_path} '
+            f'--namespace {namespace} --version {version} {chart}'
+        )
 
     def get_helm_app_upgrade_command(self, app_name: str, rendered_path: str, chart: str, version: str):
-        return f'helm upgrade {app_name} {chart} -f {rendered_path} --version {version}'
+        return f'{self.helm_command} upgrade {app_name} {chart} -f {rendered_path} --version {version}'
 
+    @lru_cache()
     def list_rancher_apps(self) -> str:
-        return str(self.execute("rancher apps ls --format '{{.App.Name}}'")).split('\n')
+        return str(self.execute(f"{self.rancher_command} apps ls --format '{{{{.App.Name}}}}'")).split('\n')
 
     def get_rancher_app_install_command(
             self, app_name: str, rendered_path: str,
             namespace: str, chart: str, version: str):
-        return f'rancher apps install --answers {rendered_path} --namespace {namespace} --version {version} {chart} {app_name}'
+        return (
+            f'{self.rancher_command} apps install --answers {rendered_path} '
+            f'--namespace {namespace} --version {version} {chart} {app_name}'
+        )
 
     def get_rancher_app_upgrade_command(self, app_name: str, rendered_path: str, chart: str, version: str):
-        return f'rancher apps upgrade --answers {rendered_path} {app_name} {version}'
+        return f'{self.rancher_command} apps upgrade --answers {rendered_path} {app_name} {version}'
 
-    def get_kubectl_command(self, manifest: dict, kubectl_prefix: str = 'kubectl') -> str:
-        '''Construct command to apply a Kubernetes YAML manifest using kubectl.'''
+    def get_kubectl_apply_commands(self, manifests: list, kubectl_prefix: str = 'kubectl',
+                                   full: bool = True, annotate: bool = False) -> list:
+        '''
+        Render all the manifests in memory and apply them with as few commands as possible.
+
+        Manifests are grouped by namespace, prune label and action, and each
+        group is applied with a single command that reads the rendered
+        documents from stdin.
+
+        Unless `full` is set, every document is annotated with its fingerprint
+        and documents whose fingerprint matches the one on the object in the
+        cluster are left out; the objects are read with a single `kubectl get`.
+        Groups with a prune label are applied in full when any of their
+        documents changed, since the documents left out would otherwise be
+        pruned.
+
+        Returns a list of ApplyCommand tuples.
+        '''
+        groups = OrderedDict()
+
+        for manifest in manifests:
+            if isinstance(manifest, str):
+                manifest = {'path': manifest}
+
+            key = (manifest.get('namespace'), manifest.get('label'), manifest.get('action', 'apply'))
+            documents = self.render_manifest_documents(manifest['path'], manifest.get('raw', False))
+
+            groups.setdefault(key, []).extend(documents)
+
+        group_documents = OrderedDict()
+        for (namespace, deploy_label, action), contents in groups.items():
+            documents = []
+            for content in contents:
+                documents.extend(fingerprints.load_documents(content))
+
+            group_documents[(namespace, deploy_label, action)] = documents
+
+        live_fingerprints = None
+        if not full:
+            live_fingerprints = self.get_live_fingerprints(group_documents, kubectl_prefix)
+
+        commands = []
+        for (namespace, deploy_label, action), documents in group_documents.items():
+            command = self.get_kubectl_base_command(namespace, deploy_label, action, kubectl_prefix) + '-'
+
+            keys = [fingerprints.get_document_key(x, namespace) for x in documents]
+            hashes = OrderedDict(
+                (key, fingerprints.get_fingerprint(document, namespace, deploy_label, action))
+                for key, document in zip(keys, documents)
+            )
+
+            if live_fingerprints is not None:
+                changed = fingerprints.get_changed_keys(live_fingerprints, hashes)
+                if not changed:
+                    self.logger.info('%s: no manifests changed, skipping', command)
+
+                    continue
+
+                if not deploy_label:
+                    documents = [x for x, y in zip(documents, keys) if y in changed]
+                    keys = [x for x in keys if x in changed]
+
+            # the annotation is what the next deploy compares against
+            if annotate or not full:
+                documents = [fingerprints.annotate(x, hashes[y]) for x, y in zip(documents, keys)]
+
+            content = yaml.safe_dump_all(documents, default_flow_style=False)
+
+            commands.append(ApplyCommand(command, content))
+
+        return commands
+
+    def get_kubectl_base_command(self, namespace: str, deploy_label: str, action: str,
+                                 kubectl_prefix: str = 'kubectl') -> str:
+        '''Construct the kubectl command up to the `-f` argument's value.'''
+        namespace_str = f'--namespace {namespace} ' if namespace else ''
+        deploy_label_str = f'-l deploy={deploy_label} --prune ' if deploy_label else ''
+
+        return f'{kubectl_prefix} {namespace_str}{action} {deploy_label_str}--validate -f '
+
+    def get_live_fingerprints(self, group_documents: dict, kubectl_prefix: str = 'kubectl') -> [dict, None]:
+        '''
+        Return the fingerprints annotated on the objects in the cluster, read with one `kubectl get`.
+
+        Returns None when the objects cannot be read, in which case everything is applied.
+        '''
+        documents = []
+        for (namespace, _, _), group in group_documents.items():
+            documents.extend(fingerprints.set_namespace(x, namespace) for x in group)
+
+        if not documents:
+            return {}
 
-        deploy_label = self.workflow.args.config_name
+        content = yaml.safe_dump_all(documents, default_flow_style=False)
+
+        try:
+            proc = self.execute(f'{kubectl_prefix} get --ignore-not-found -o json -f -', _in=content)
+        except shell.ErrorReturnCode as exc:
+            self.logger.warning('unable to read the deployed manifests, applying all of them: %s', exc)
 
+            return None
+
+        return fingerprints.get_live_fingerprints(proc.stdout.decode('utf8'))
+
+    def get_kubectl_command(self, manifest: dict, kubectl_prefix: str = 'kubectl') -> str:
+        '''Construct command to apply a Kubernetes YAML manifest using kubectl.'''
         raw_path = manifest['path']
         deploy_label = manifest.get('label')
         namespace = manifest.get('namespace')
         action = manifest.get('action', 'apply')
         raw = manifest.get('raw', False)
 
-        namespace_str = f'--namespace {namespace} ' if namespace else ''
-        deploy_label_str = '-l deploy={deploy_label} --prune ' if deploy_label else ''
-
-        command = f'{kubectl_prefix} {namespace_str}{action} {deploy_label_str}--validate -f '
+        command = self.get_kubectl_base_command(namespace, deploy_label, action, kubectl_prefix)
 
         if os.path.isdir(raw_path):
             rendered_path = self.render_nested_manifests(raw_path, raw)
@@ -156,6 +276,20 @@ class KubeMixIn(object):
     def get_answers_filename(self, app_name: str) -> str:
         return f'compose-flow-{self.cluster_name}-{app_name}-answers.yml'
 
+    def render_manifest_documents(self, manifest_path: str, raw: bool) -> list:
+        '''
+        Render the manifest at the given path, or every manifest in the given
+        directory, in memory and return the rendered contents.
+        '''
+        if os.path.isdir(manifest_path):
+            paths = sorted(pathlib.Path(manifest_path).glob('**/*.y*ml'))
+        elif os.path.isfile(manifest_path):
+            paths = [manifest_path]
+        else:
+            raise MissingManifestError("Missing manifest at path: {}".format(manifest_path))
+
+        return [self.render_yaml(x, ManifestChecker(), raw) for x in paths]
+
     def render_single_yaml(self, input_path: str, output_path: str,
                            checker: BaseChecker = None, raw: bool = False
                            ) -> None:
@@ -165,6 +299,16 @@ class KubeMixIn(object):
         '''
         self.logger.info("Rendering YAML at %s to %s", input_path, output_path)
 
+        rendered = self.render_yaml(input_path, checker, raw)
+
+        with open(output_path, 'w') as fh:
+            fh.write(rendered)
+
+    def render_yaml(self, input_path: str, checker: BaseChecker = None, raw: bool = False) -> str:
+        '''
+        Read in single YAML file from specified path, render environment variables
+        and check the result.
+        '''
         with open(input_path, 'r') as fh:
             content = fh.read()
 
@@ -180,8 +324,7 @@ class KubeMixIn(object):
             if errors:
                 raise ManifestCheckError('\n'.join(errors))
 
-        with open(output_path, 'w') as fh:
-            fh.write(rendered)
+        return rendered
 
     @lru_cache()
     def render_manifest(self, manifest_path: str, raw: bool) -> str:
@@ -218,32 +361,98 @@ class KubeMixIn(object):
         return rendered_path
 
     # Native Kube context management logic
-    def switch_kube_context(self):
+    @property
+    @lru_cache()
+    def kube_context(self) -> str:
         '''
-        Switch current kubectl context to target specified cluster based on environment
+        The kubectl context of the cluster targeted by the environment
+
+        The context is passed to every kubectl and helm command rather than
+        switched to, so the current context in the kubeconfig is left alone
+        and deploys to different clusters can run side by side.
         '''
         profile_name = self.workflow.args.profile
         context_mapping = self.config.get('kubecontexts', {})
 
         target_context = context_mapping.get(profile_name, profile_name)
-        try:
-            self.execute(f'kubectl config use-context {target_context}')
-        except sh.ErrorReturnCode_1:
+
+        contexts = get_kube_contexts()
+        if contexts is not None and target_context not in contexts:
             raise InvalidTargetClusterError("No context is defined for profile {}!\n\n"
                                             "Please specify a corresponding context in your kubeconfig file "
                                             "or map this profile name to an existing context "
                                             "in the 'kubecontexts' section of compose-flow.yml".format(profile_name))
 
+        return target_context
+
     # Rancher context management logic
     @property
     @lru_cache()
-    def cluster_listing(self):
-        cluster_ls_command = f"rancher cluster ls --format '{CLUSTER_LS_FORMAT}'"
-        output = str(self.execute(cluster_ls_command)).strip()
-        for err in NONFATAL_ERROR_MESSAGES:
-            if err in output:
-                output = output.replace(err, '')
-        return yaml.load(output)
+    def rancher_config_dir(self) -> str:
+        '''
+        A Rancher CLI config dir private to this run
+
+        The user's Rancher config is copied into a temp dir that is removed at
+        exit, so switching the context does not change the context of other
+        rancher commands, including concurrent deploys of the same profile.
+        '''
+        project_name = self.rancher_config['project']
+
+        config_root = os.path.join(settings.APP_CONFIG_ROOT, 'rancher')
+        os.makedirs(config_root, mode=0o700, exist_ok=True)
+
+        config_dir = tempfile.mkdtemp(
+            prefix=f'{self.workflow.args.profile}-{project_name}-', dir=config_root
+        )
+        atexit.register(shutil.rmtree, config_dir, ignore_errors=True)
+
+        source = os.path.join(settings.RANCHER_CONFIG_DIR, rancher.CONFIG_FILENAME)
+        if os.path.exists(source):
+            shutil.copyfile(source, os.path.join(config_dir, rancher.CONFIG_FILENAME))
+
+        return config_dir
+
+    @property
+    def cluster_listing(self) -> dict:
+        '''The IDs of the clusters on the Rancher server, by name'''
+        return self.rancher_listing['clusters']
+
+    @property
+    @lru_cache()
+    def rancher_listing(self) -> dict:
+        return self.get_rancher_listing()
+
+    def get_rancher_listing(self, refresh: bool = False) -> dict:
+        '''
+        Returns the clusters and projects on the Rancher server the CLI is logged in to
+
+        The listing is cached for `settings.RANCHER_CACHE_TTL` seconds, unless
+        `--refresh-cache` is given.
+        '''
+        server = rancher.get_current_server(self.rancher_config_dir)
+
+        return rancher.get_listing(
+            server,
+            ttl=settings.RANCHER_CACHE_TTL,
+            refresh=refresh or self.workflow.args.refresh_cache,
+        )
+
+    def get_project_id(self, project_name: str, listing: dict) -> [str, None]:
+        '''
+        Returns the ID of the named project, in the target cluster when several clusters have one
+        '''
+        projects = [x for x in listing['projects'] if x['name'] == project_name]
+        if len(projects) > 1:
+            self.logger.info(
+                "Multiple clusters have a project called %s - "
+                "switching context by Project ID", project_name
+            )
+
+            cluster_id = listing['clusters'].get(self.cluster_name)
+            projects = [x for x in projects if x['clusterId'] == cluster_id]
+
+        if len(projects) == 1:
+            return projects[0]['id']
 
     @property
     def cluster_name(self):
@@ -272,28 +481,45 @@ class KubeMixIn(object):
         '''
         Switch Rancher CLI context to target specified cluster based on environment
         and specified project name from compose-flow.yml
+
+        Only the private config in `rancher_config_dir` is switched, and the
+        project is looked up in the cached Rancher listing rather than by the
+        Rancher CLI.
         '''
         # Get the project name specified in compose-flow.yml
         target_project_name = self.rancher_config['project']
 
-        base_context_switch_command = "rancher context switch "
-        name_context_switch_command = base_context_switch_command + target_project_name
-        try:
-            self.logger.info(name_context_switch_command)
-            self.execute(name_context_switch_command)
-        except sh.ErrorReturnCode_1 as exc:  # pylint: disable=E1101
-            stderr = str(exc.stderr)
-            if 'Multiple resources of type project found for name' in stderr:
-                self.logger.info(
-                    "Multiple clusters have a project called %s - "
-                    "switching context by Project ID", target_project_name
-                )
-                # Choose the one that matches target cluster ID
-                opts = stderr[stderr.find('[')+1:stderr.find(']')].split(' ')
-                target_project_id = [o for o in opts if self.cluster_id in o][0]
-
-                id_context_switch_command = base_context_switch_command + target_project_id
-                self.logger.info(id_context_switch_command)
-                self.execute(id_context_switch_command)
-            else:
-                raise
+        project_id = self.get_project_id(target_project_name, self.rancher_listing)
+        if project_id is None and not self.workflow.args.refresh_cache:
+            # the project may have been created since the listing was cached
+            project_id = self.get_project_id(target_project_name, self.get_rancher_listing(refresh=True))
+
+        if project_id is None:
+            raise InvalidTargetClusterError(
+                f'No project named {target_project_name} found in cluster {self.cluster_name}'
+            )
+
+        self.logger.info('switching rancher context to %s', project_id)
+
+        rancher.set_project(self.rancher_config_dir, project_id)
+
+
+def get_kube_contexts() -> [set, None]:
+    """
+    Returns the names of the contexts defined in the kubeconfig files
+
+    Returns None when there are no kubeconfig files to look in, e.g. when
+    kubectl is configured some other way, so the context is not validated.
+    """
+    paths = [x for x in settings.KUBECONFIG.split(os.pathsep) if x and os.path.exists(x)]
+    if not paths:
+        return None
+
+    contexts = set()
+    for path in paths:
+        with open(path, 'r') as fh:
+            kubeconfig = yaml.safe_load(fh) or {}
+
+        contexts.update(x.get('name') for x in kubeconfig.get('contexts') or [])
+
+    return contexts
@@ -0,0 +1,145 @@
+"""
+Rancher module
+
+Looks up Rancher clusters and projects through the v3 HTTP API, using the
+server and credentials the Rancher CLI was logged in with, and switches the
+CLI's context by writing its config directly.
+
+The cluster and project listing is cached per Rancher server, so repeated
+deploys resolve their context without talking to Rancher at all.
+"""
+import base64
+import json
+import os
+import ssl
+import tempfile
+import urllib.error
+import urllib.request
+
+from compose_flow import cache
+from compose_flow.errors import RancherError
+
+# the file in the Rancher config dir that holds the CLI's servers and current context
+CONFIG_FILENAME = 'cli2.json'
+
+DEFAULT_TIMEOUT = 10.0
+
+
+def api_get(server: dict, path: str, timeout: float = DEFAULT_TIMEOUT) -> list:
+    """
+    Returns every item in the given API collection, e.g. `clusters`
+    """
+    url = f'{get_api_url(server)}/{path}?limit=-1'
+
+    request = urllib.request.Request(url)
+    request.add_header('Accept', 'application/json')
+
+    authorization = get_authorization(server)
+    if authorization:
+        request.add_header('Authorization', authorization)
+
+    context = None
+    if server.get('cacert'):
+        context = ssl.create_default_context(cadata=server['cacert'])
+
+    try:
+        with urllib.request.urlopen(request, timeout=timeout, context=context) as response:
+            data = json.loads(response.read().decode('utf8'))
+    except (urllib.error.URLError, OSError, ValueError) as exc:
+        raise RancherError(f'unable to list {path} at {url}: {exc}')
+
+    return data.get('data', [])
+
+
+def get_api_url(server: dict) -> str:
+    """
+    Returns the URL of the server's v3 API
+
+    The CLI stores the URL it was logged in with, with or without the API path.
+    """
+    url = server.get('url', '').rstrip('/')
+    if url.endswith('/v3'):
+        url = url[:-3]
+
+    return f'{url}/v3'
+
+
+def get_authorization(server: dict) -> [str, None]:
+    token = server.get('tokenKey')
+    if not token and server.get('accessKey'):
+        token = f'{server["accessKey"]}:{server.get("secretKey", "")}'
+
+    if not token:
+        return None
+
+    return f'Basic {base64.b64encode(token.encode("utf8")).decode("utf8")}'
+
+
+def get_current_server(config_dir: str, config: dict = None) -> dict:
+    """
+    Returns the server the CLI config in the given dir is logged in to
+    """
+    if config is None:
+        config = load_config(config_dir)
+
+    server = config.get('Servers', {}).get(config.get('CurrentServer'))
+    if not server:
+        path = os.path.join(config_dir, CONFIG_FILENAME)
+
+        raise RancherError(f'no current server in {path}; is the rancher cli logged in?')
+
+    return server
+
+
+def get_listing(server: dict, ttl: float = None, refresh: bool = False) -> dict:
+    """
+    Returns the clusters and projects on the given server
+
+    Returns:
+        dict with `clusters`, a dict of cluster name to ID, and `projects`, a
+        list of dicts with each project's `id`, `name` and `clusterId`
+    """
+    cache_name = f'rancher-{get_api_url(server)}'
+
+    if not refresh:
+        listing = cache.read(cache_name, ttl=ttl)
+        if listing is not None:
+            return listing
+
+    listing = {
+        'clusters': {x['name']: x['id'] for x in api_get(server, 'clusters')},
+        'projects': [
+            {'id': x['id'], 'name': x['name'], 'clusterId': x.get('clusterId')}
+            for x in api_get(server, 'projects')
+        ],
+    }
+
+    cache.write(cache_name, listing)
+
+    return listing
+
+
+def load_config(config_dir: str) -> dict:
+    try:
+        with open(os.path.join(config_dir, CONFIG_FILENAME), 'r') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def set_project(config_dir: str, project_id: str) -> None:
+    """
+    Switches the CLI config in the given dir to the given project
+
+    This is what `rancher context switch` does, without running the CLI.
+    """
+    config = load_config(config_dir)
+
+    get_current_server(config_dir, config)['project'] = project_id
+
+    # write to a temp file first so a concurrent run never sees a partial config
+    fd, temp_path = tempfile.mkstemp(dir=config_dir)
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(config, fh)
+
+    os.replace(temp_path, os.path.join(config_dir, CONFIG_FILENAME))
@@ -0,0 +1,248 @@
+"""
+Logs module
+
+Streams logs from many containers at once and merges them into a single
+stream ordered by timestamp.
+"""
+import heapq
+import itertools
+import os
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+
+from compose_flow import settings, spawns, tracing
+
+# the directory, private to the user, that holds the ssh multiplex sockets
+SSH_CONTROL_DIR = os.path.join(settings.APP_CONFIG_ROOT, 'ssh')
+
+# runs the docker command piped into grep, exiting with the status of docker or,
+# when docker succeeds, of grep; grep not matching anything is not an error
+GREP_PIPELINE = (
+    'exec 3>&1; '
+    'statuses=$({{ {{ {command}; echo $? >&4; }}'
+    ' | {{ {grep} >&3 || [ $? -eq 1 ] || echo 2 >&4; }}; }} 4>&1); '
+    'for status in $statuses; do [ "$status" -eq 0 ] || exit "$status"; done'
+)
+
+# the number of lines that are buffered from all streams in order to sort them
+DEFAULT_BUFFER_SIZE = 1000
+
+# the maximum number of lines each stream may have waiting to be merged
+DEFAULT_QUEUE_SIZE = 100
+
+# seconds without new lines after which all buffered lines are printed
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+
+def get_docker_logs_command(
+    container: str,
+    follow: bool = False,
+    tail: str = None,
+    since: str = None,
+    grep: str = None,
+    sudo: bool = False,
+) -> str:
+    """
+    Returns the shell command that prints a container's logs on a swarm node
+
+    When `grep` is given, lines are filtered on the node itself so that only
+    matching lines are sent over the connection.  The command then exits with
+    docker's status, or grep's when grep fails for any reason other than not
+    finding a match.
+    """
+    command = 'docker logs --timestamps'
+
+    if sudo:
+        command = f'sudo {command}'
+
+    if follow:
+        command = f'{command} --follow'
+
+    if tail:
+        command = f'{command} --tail {shlex.quote(tail)}'
+
+    if since:
+        command = f'{command} --since {shlex.quote(since)}'
+
+    command = f'{command} {shlex.quote(container)} 2>&1'
+
+    if grep:
+        command = GREP_PIPELINE.format(
+            command=command, grep=f'grep --line-buffered -E {shlex.quote(grep)}'
+        )
+
+    return command
+
+
+def get_ssh_command(host: str, remote_command: str) -> list:
+    """
+    Returns the ssh command that runs the given command on the remote host
+    """
+    return ['ssh'] + get_ssh_multiplex_options() + [host, remote_command]
+
+
+def get_ssh_multiplex_options() -> list:
+    """
+    Returns the ssh options that allow all the streams going to the same node to share one connection
+
+    The sockets are kept in a directory only the user can access so that
+    other local users cannot pre-create or hijack them.
+    """
+    os.makedirs(SSH_CONTROL_DIR, mode=0o700, exist_ok=True)
+    os.chmod(SSH_CONTROL_DIR, 0o700)
+
+    return [
+        '-o', 'ControlMaster=auto',
+        '-o', f'ControlPath={os.path.join(SSH_CONTROL_DIR, "%C")}',
+        '-o', 'ControlPersist=60',
+    ]
+
+
+class LogMerger(object):
+    """
+    Merges the output of multiple log streams by timestamp
+
+    Each stream is read in its own thread into a bounded queue; when the
+    queue is full the reader stops reading, which in turn stalls the remote
+    process, so a slow consumer applies backpressure all the way to the node.
+
+    Lines are held in a reorder buffer of at most `buffer_size` lines and the
+    oldest line is printed whenever the buffer is full.  The buffer is also
+    flushed whenever no lines arrive for `flush_interval` seconds so that
+    followed streams are printed promptly.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        fh=None,
+    ):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fh = fh or sys.stdout
+
+        self._buffer = []
+        self._counter = itertools.count()
+        self._procs = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._streams = []
+
+    def add_stream(self, label: str, command: list) -> None:
+        """
+        Adds a stream that is produced by the given command
+        """
+        self._streams.append((label, command))
+
+    def emit(self, item: tuple) -> None:
+        _timestamp, _idx, label, line = item
+
+        print(f'{label} | {line}', file=self.fh)
+
+    def flush(self) -> None:
+        """
+        Prints all the buffered lines in order
+        """
+        while self._buffer:
+            self.emit(heapq.heappop(self._buffer))
+
+        self.fh.flush()
+
+    @staticmethod
+    def parse_line(line: str) -> tuple:
+        """
+        Splits the timestamp prefixed by `docker logs --timestamps` from the line
+        """
+        line_split = line.split(' ', 1)
+        if len(line_split) == 2 and line_split[0][:1].isdigit():
+            return line_split[0], line_split[1]
+
+        return '', line
+
+    def push(self, timestamp: str, label: str, line: str) -> None:
+        """
+        Adds a line to the reorder buffer, printing the oldest line when the buffer is full
+        """
+        heapq.heappush(self._buffer, (timestamp, next(self._counter), label, line))
+
+        while len(self._buffer) > self.buffer_size:
+            self.emit(heapq.heappop(self._buffer))
+
+    def read_stream(self, label: str, proc: subprocess.Popen, trace: tracing.Span) -> None:
+        """
+        Reads the lines of a stream into the queue
+
+        The stream's span is finished once its process has exited.
+        """
+        try:
+            for line_b in proc.stdout:
+                line = line_b.decode('utf8', 'replace').rstrip('\n')
+                timestamp, line = self.parse_line(line)
+
+                # blocks when the merger falls behind
+                self._queue.put((timestamp, label, line))
+        finally:
+            proc.stdout.close()
+            proc.wait()
+
+            trace.finish(exit_code=proc.returncode)
+
+            self._queue.put(None)
+
+    def run(self) -> int:
+        """
+        Runs all the streams and prints the merged output until they all end
+
+        Returns:
+            the number of streams that exited with an error
+        """
+        threads = []
+
+        for label, command in self._streams:
+            spawns.record(command)
+
+            trace = tracing.Span(os.path.basename(command[0]), 'exec', {'argv': command})
+
+            proc = subprocess.Popen(
+                command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+            )
+            self._procs.append(proc)
+
+            thread = threading.Thread(target=self.read_stream, args=(label, proc, trace), daemon=True)
+            thread.start()
+
+            threads.append(thread)
+
+        remaining = len(threads)
+
+        try:
+            while remaining:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    self.flush()
+
+                    continue
+
+                if item is None:
+                    remaining -= 1
+                else:
+                    self.push(*item)
+        finally:
+            self.stop()
+
+            self.flush()
+
+        return len([x for x in self._procs if x.returncode])
+
+    def stop(self) -> None:
+        """
+        Terminates any stream that is still running
+        """
+        for proc in self._procs:
+            if proc.poll() is None:
+                proc.terminate()
@@ -0,0 +1,198 @@
+"""
+Registry module
+
+Queries docker registries through the v2 HTTP API.
+"""
+import json
+import logging
+import os
+import re
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+from .errors import RegistryError
+
+DOCKER_HUB_REGISTRY = 'registry-1.docker.io'
+
+# the key docker uses for Docker Hub credentials in ~/.docker/config.json
+DOCKER_HUB_AUTH_KEY = 'https://index.docker.io/v1/'
+
+DOCKER_CONFIG_PATH = os.path.join(
+    os.environ.get('DOCKER_CONFIG', os.path.expanduser('~/.docker')), 'config.json'
+)
+
+# registries that are spoken to over plain http
+INSECURE_REGISTRIES = ('localhost', '127.0.0.1')
+
+MANIFEST_MEDIA_TYPES = (
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.oci.image.index.v1+json',
+)
+
+DEFAULT_TIMEOUT = 10.0
+
+
+def get_auth(registry: str) -> str:
+    """
+    Returns the base64 encoded credentials for the registry from the docker config
+
+    Credentials kept in a credential store are not looked up.
+    """
+    try:
+        with open(DOCKER_CONFIG_PATH, 'r') as fh:
+            config = json.load(fh)
+    except (IOError, ValueError):
+        return None
+
+    auths = config.get('auths', {})
+
+    keys = [registry, f'https://{registry}']
+    if registry == DOCKER_HUB_REGISTRY:
+        keys.insert(0, DOCKER_HUB_AUTH_KEY)
+
+    for key in keys:
+        auth = auths.get(key, {}).get('auth')
+        if auth:
+            return auth
+
+
+def get_existing_images(images: Iterable[str], jobs: int = 8) -> set:
+    """
+    Returns the images that are already in their registries
+
+    All the images are checked concurrently; an image that cannot be checked
+    is considered missing.
+    """
+    images = list(images)
+    if not images:
+        return set()
+
+    logger = logging.getLogger(__name__)
+
+    def check(image):
+        try:
+            return image_exists(image)
+        except RegistryError as exc:
+            logger.warning(f'unable to check registry for {image}: {exc}')
+
+            return False
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(check, images)
+
+        return set(image for image, exists in zip(images, results) if exists)
+
+
+def get_token(challenge: str, auth: str = None, timeout: float = DEFAULT_TIMEOUT) -> str:
+    """
+    Returns a bearer token for the given `WWW-Authenticate` challenge
+    """
+    params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+
+    realm = params.pop('realm', None)
+    if not realm:
+        raise RegistryError(f'no realm in challenge {challenge}')
+
+    request = urllib.request.Request(f'{realm}?{urllib.parse.urlencode(params)}')
+    if auth:
+        request.add_header('Authorization', f'Basic {auth}')
+
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            data = json.loads(response.read().decode('utf8'))
+    except (urllib.error.URLError, OSError, ValueError) as exc:
+        raise RegistryError(f'unable to get token: {exc}')
+
+    return data.get('token') or data.get('access_token')
+
+
+def get_manifest_url(registry: str, repository: str, reference: str) -> str:
+    scheme = 'https'
+    if registry.split(':', 1)[0] in INSECURE_REGISTRIES:
+        scheme = 'http'
+
+    return f'{scheme}://{registry}/v2/{repository}/manifests/{reference}'
+
+
+def head_manifest(url: str, authorization: str = None, timeout: float = DEFAULT_TIMEOUT) -> tuple:
+    """
+    Makes a HEAD request for the given manifest
+
+    Returns:
+        tuple of the status code and the `WWW-Authenticate` header
+    """
+    request = urllib.request.Request(url, method='HEAD')
+    request.add_header('Accept', ', '.join(MANIFEST_MEDIA_TYPES))
+
+    if authorization:
+        request.add_header('Authorization', authorization)
+
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, None
+    except urllib.error.HTTPError as exc:
+        return exc.code, exc.headers.get('WWW-Authenticate')
+    except (urllib.error.URLError, OSError) as exc:
+        raise RegistryError(f'unable to reach {url}: {exc}')
+
+
+def image_exists(image: str, timeout: float = DEFAULT_TIMEOUT) -> bool:
+    """
+    Returns whether the image's manifest is in the registry
+
+    Only the manifest headers are requested, nothing is downloaded.
+    """
+    registry, repository, reference = parse_image(image)
+
+    url = get_manifest_url(registry, repository, reference)
+
+    status, challenge = head_manifest(url, timeout=timeout)
+    if status == 401 and challenge:
+        auth = get_auth(registry)
+
+        if challenge.lower().startswith('bearer'):
+            token = get_token(challenge, auth=auth, timeout=timeout)
+            status, challenge = head_manifest(url, f'Bearer {token}', timeout=timeout)
+        elif auth:
+            status, challenge = head_manifest(url, f'Basic {auth}', timeout=timeout)
+
+    if status == 200:
+        return True
+    elif status == 404:
+        return False
+
+    raise RegistryError(f'unexpected status {status} for {url}')
+
+
+def parse_image(image: str) -> tuple:
+    """
+    Splits a docker image name into its registry, repository and tag or digest
+
+    Returns:
+        tuple of the registry, the repository and the reference
+    """
+    name, reference = image, 'latest'
+
+    if '@' in name:
+        name, reference = name.split('@', 1)
+    elif ':' in name.rsplit('/', 1)[-1]:
+        name, reference = name.rsplit(':', 1)
+
+    registry = DOCKER_HUB_REGISTRY
+
+    name_split = name.split('/', 1)
+    if len(name_split) == 2 and (
+        '.' in name_split[0] or ':' in name_split[0] or name_split[0] == 'localhost'
+    ):
+        registry, name = name_split
+
+    if registry == DOCKER_HUB_REGISTRY and '/' not in name:
+        name = f'library/{name}'
+
+    return registry, name, reference
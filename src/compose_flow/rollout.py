@@ -0,0 +1,196 @@
+"""
+Rollout module
+
+Watches the services of a stack after a deploy until they converge.
+"""
+import json
+import sys
+import time
+
+from tabulate import tabulate
+
+from compose_flow import docker
+from compose_flow.errors import DockerError, RolloutError
+
+# update states that mean the rollout did not go through
+FAILED_STATES = ('paused', 'rollback_paused', 'rollback_completed')
+
+# update states that mean the rollout is still in progress
+UPDATING_STATES = ('updating', 'rollback_started')
+
+CONVERGED = 'converged'
+
+DEFAULT_POLL_INTERVAL = 2.0
+
+
+class StackWatcher(object):
+    """
+    Polls the services of a stack until all of them have converged
+
+    Every poll is two docker calls regardless of the number of services: one
+    `docker stack services` for the replica counts and one bulk
+    `docker service inspect` for the update status of every service.
+    """
+
+    def __init__(self, stack: str, timeout: float, poll_interval: float = DEFAULT_POLL_INTERVAL, fh=None):
+        self.stack = stack
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.fh = fh or sys.stdout
+
+        self.rollouts = {}
+
+        # the update status and task spec of each service prior to the deploy
+        self._previous_updates = {}
+        self._previous_specs = {}
+
+    @staticmethod
+    def get_replicas(service: dict) -> tuple:
+        """
+        Returns the running and desired replicas of a `docker stack services` entry
+        """
+        # newer docker versions append info such as `(max 1 per node)`
+        replicas = service['Replicas'].split()[0]
+        running, desired = replicas.split('/', 1)
+
+        return int(running), int(desired)
+
+    @staticmethod
+    def get_task_spec(service_config: dict) -> str:
+        """
+        Returns the part of a service's spec that swarm rolls out to its tasks
+        """
+        task_template = (service_config.get('Spec') or {}).get('TaskTemplate')
+
+        return json.dumps(task_template, sort_keys=True)
+
+    def get_state(self, service: dict, service_config: dict) -> str:
+        """
+        Returns the rollout state of a service
+
+        Swarm starts rolling out a changed service some time after `docker
+        stack deploy` returns, so the replica counts are only trusted once an
+        update newer than the pre-deploy one has been seen, or when the
+        service's task spec was not changed by the deploy.
+        """
+        name = service['Name']
+        update_status = service_config.get('UpdateStatus') or {}
+
+        # an update status left over from a previous deploy says nothing about this one
+        if update_status.get('StartedAt') == self._previous_updates.get(name):
+            update_status = {}
+
+        state = update_status.get('State')
+        if state in FAILED_STATES or state in UPDATING_STATES:
+            return state
+
+        previous_spec = self._previous_specs.get(name)
+        if not update_status and previous_spec and previous_spec != self.get_task_spec(service_config):
+            return 'pending'
+
+        running, desired = self.get_replicas(service)
+        if running != desired:
+            return 'starting'
+
+        return CONVERGED
+
+    def poll(self) -> dict:
+        """
+        Returns the state and replicas of every service in the stack
+        """
+        services = docker.get_stack_services(self.stack)
+        service_configs = docker.get_service_configs([x['ID'] for x in services])
+
+        statuses = {}
+        for service, service_config in zip(services, service_configs):
+            statuses[service['Name']] = (
+                self.get_state(service, service_config),
+                service['Replicas'],
+            )
+
+        return statuses
+
+    def print_summary(self) -> None:
+        rows = []
+        for name, rollout in sorted(self.rollouts.items()):
+            duration = rollout['duration']
+            if duration is not None:
+                duration = f'{duration:.1f}s'
+
+            rows.append((name, rollout['state'], rollout['replicas'], duration))
+
+        print(tabulate(rows, headers=('service', 'state', 'replicas', 'rollout time')), file=self.fh)
+
+    def snapshot(self) -> None:
+        """
+        Records the update status and task spec of the stack's services before deploying
+        """
+        try:
+            services = docker.get_stack_services(self.stack)
+            service_configs = docker.get_service_configs([x['ID'] for x in services])
+        except DockerError:
+            # the stack does not exist yet
+            return
+
+        for service, service_config in zip(services, service_configs):
+            update_status = service_config.get('UpdateStatus') or {}
+
+            self._previous_updates[service['Name']] = update_status.get('StartedAt')
+            self._previous_specs[service['Name']] = self.get_task_spec(service_config)
+
+    def update(self, statuses: dict, elapsed: float) -> None:
+        """
+        Updates the rollout of each service, printing any change in progress
+        """
+        for name, (state, replicas) in sorted(statuses.items()):
+            rollout = self.rollouts.setdefault(
+                name, {'state': None, 'replicas': None, 'duration': None}
+            )
+
+            if (state, replicas) == (rollout['state'], rollout['replicas']):
+                continue
+
+            rollout.update({'state': state, 'replicas': replicas})
+
+            message = f'{name}: {state}, replicas {replicas}'
+            if state == CONVERGED and rollout['duration'] is None:
+                rollout['duration'] = elapsed
+
+                message = f'{message} in {elapsed:.1f}s'
+
+            print(message, file=self.fh)
+
+    def wait(self) -> None:
+        """
+        Waits for all the services in the stack to converge
+
+        Raises:
+            RolloutError when a service fails to roll out or the timeout is reached
+        """
+        start = time.time()
+
+        while True:
+            elapsed = time.time() - start
+
+            self.update(self.poll(), elapsed)
+
+            failed = sorted(x for x, y in self.rollouts.items() if y['state'] in FAILED_STATES)
+            if failed:
+                self.print_summary()
+
+                raise RolloutError(f'Error: rollout failed for {", ".join(failed)}')
+
+            pending = sorted(x for x, y in self.rollouts.items() if y['state'] != CONVERGED)
+            if self.rollouts and not pending:
+                break
+
+            if elapsed >= self.timeout:
+                self.print_summary()
+
+                raise RolloutError(
+                    f'Error: timed out after {self.timeout}s waiting for {", ".join(pending) or self.stack}'
+                )
+
+            time.sleep(self.poll_interval)
+
+        self.print_summary()
@@ -0,0 +1,97 @@
+"""
+Scheduler module
+
+Runs tasks that depend on one another concurrently; a task is started as
+soon as all the tasks it depends on have succeeded.
+"""
+import collections
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable
+
+from .errors import ErrorMessage
+
+FAILED = 'failed'
+SKIPPED = 'skipped'
+SUCCEEDED = 'succeeded'
+
+TaskResult = collections.namedtuple('TaskResult', ['name', 'status', 'output', 'duration'])
+
+
+def get_dependents(dependencies: dict, names) -> set:
+    """
+    Returns the given tasks along with every task that depends on them, directly or not
+    """
+    dependents = set(names)
+
+    added = True
+    while added:
+        added = False
+
+        for name, task_dependencies in dependencies.items():
+            if name not in dependents and task_dependencies & dependents:
+                dependents.add(name)
+                added = True
+
+    return dependents
+
+
+def run(dependencies: dict, fn: Callable, jobs: int = 4, callback: Callable = None) -> dict:
+    """
+    Runs the given tasks, each one after the tasks it depends on
+
+    Args:
+        dependencies: dict mapping each task name to the set of task names it depends on;
+            dependencies that are not tasks themselves are ignored
+        fn: called with a task name; returns a tuple of whether it succeeded and its output
+        jobs: the maximum number of tasks to run at once
+        callback: called with each TaskResult as soon as it's available
+
+    Returns:
+        dict mapping each task name to its TaskResult
+    """
+    pending = {x: set(y) & set(dependencies) for x, y in dependencies.items()}
+    results = {}
+
+    def finish(result):
+        results[result.name] = result
+
+        if callback:
+            callback(result)
+
+    def run_task(name):
+        start = time.time()
+        success, output = fn(name)
+
+        return TaskResult(name, SUCCEEDED if success else FAILED, output, time.time() - start)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = set()
+
+        while pending or running:
+            # skip the tasks that depend on a task that did not succeed
+            for name in sorted(pending):
+                failed = [x for x in pending[name] if x in results and results[x].status != SUCCEEDED]
+                if failed:
+                    del pending[name]
+
+                    finish(TaskResult(name, SKIPPED, f'{", ".join(sorted(failed))} did not build', 0))
+
+            ready = sorted(x for x, y in pending.items() if y <= set(results))
+            for name in ready:
+                del pending[name]
+
+                running.add(executor.submit(run_task, name))
+
+            if not running:
+                if pending:
+                    raise ErrorMessage(f'Error: dependency cycle between {", ".join(sorted(pending))}')
+
+                break
+
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(future.result())
+
+    return results
@@ -17,3 +17,24 @@ USER = os.environ.get('USER', 'nobody')
 DEFAULT_CF_REMOTE_USER = os.environ.get('CF_REMOTE_USER', USER)
 
 DOCKER_IMAGE_PREFIX = os.environ.get('CF_DOCKER_IMAGE_PREFIX', 'localhost.localdomain')
+
+# the format compiled compose files are written in, `yml` or `json`
+COMPOSE_FORMAT = os.environ.get('CF_COMPOSE_FORMAT', 'yml')
+
+# whether passthrough subcommands replace compose-flow with the command by default
+PASSTHROUGH_EXEC = os.environ.get('CF_PASSTHROUGH_EXEC', '').lower() in ('1', 'true', 'yes')
+
+# location of locally cached data, such as swarm node addresses
+APP_CACHE_ROOT = os.environ.get('CF_CACHE_ROOT', os.path.join(APP_CONFIG_ROOT, 'cache'))
+
+# the Rancher CLI config that per-project copies are made from
+RANCHER_CONFIG_DIR = os.environ.get('RANCHER_CONFIG_DIR', os.path.expanduser('~/.rancher'))
+
+# number of seconds the cached Rancher cluster and project listing is considered fresh
+RANCHER_CACHE_TTL = int(os.environ.get('CF_RANCHER_CACHE_TTL', 3600))
+
+# the kubeconfig files that kube contexts are looked up in
+KUBECONFIG = os.environ.get('KUBECONFIG', os.path.expanduser('~/.kube/config'))
+
+# number of seconds a cached swarm node address table is considered fresh
+NODE_CACHE_TTL = int(os.environ.get('CF_NODE_CACHE_TTL', 300))
@@ -1,8 +1,33 @@
+"""
+Shell module
+
+Runs commands with `subprocess`, either capturing their output, streaming it
+line by line or attaching them to the terminal.
+
+Commands that exit with a non-zero status raise `ErrorReturnCode_<status>`,
+a subclass of `ErrorReturnCode`, so that callers can handle specific
+exit codes the same way they did when commands were run with `sh`.
+"""
 import os
-import sh
 import shlex
+import subprocess
+import tempfile
+import threading
+import time
+
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from typing import Iterable
+
+from . import spawns, tracing
 
-from sh import ErrorReturnCode_1  # noqa: F401 pylint: disable=E1101
+# how often commands run with a cancel event check whether they were cancelled
+CANCEL_POLL_INTERVAL = 0.1
+
+# the number of commands execute_many() runs at once by default
+DEFAULT_JOBS = 4
+
+# the amount of output included in error messages
+ERROR_OUTPUT_SIZE = 750
 
 # these runtime environment variables should be injected into
 # the compose flow environment prior to executing a command
@@ -19,13 +44,139 @@ OS_ENV_INCLUDES = (
 )
 
 
-def execute(command: str, env, **kwargs):
+class ErrorReturnCode(Exception):
+    """
+    Raised when a command exits with a non-zero status
+    """
+    exit_code = None
+
+    def __init__(self, full_cmd: str, stdout: bytes, stderr: bytes, truncate: bool = True):
+        self.full_cmd = full_cmd
+        self.stdout = stdout
+        self.stderr = stderr
+
+        stdout_s = stdout or b''
+        stderr_s = stderr or b''
+        if truncate:
+            stdout_s = stdout_s[:ERROR_OUTPUT_SIZE]
+            stderr_s = stderr_s[:ERROR_OUTPUT_SIZE]
+
+        message = (
+            f'\n\n  RAN: {full_cmd}'
+            f'\n\n  STDOUT:\n{stdout_s.decode("utf8", "replace")}'
+            f'\n\n  STDERR:\n{stderr_s.decode("utf8", "replace")}'
+        )
+
+        super().__init__(message)
+
+
+class TimeoutException(ErrorReturnCode):
+    """
+    Raised when a command does not finish within its timeout
+    """
+
+    def __init__(self, full_cmd: str, timeout: float):
+        self.timeout = timeout
+
+        super().__init__(full_cmd, b'', f'timed out after {timeout} seconds'.encode('utf8'))
+
+
+class CommandResult(object):
+    """
+    The result of a command that ran to completion
+    """
+
+    def __init__(self, argv: list, exit_code: int, stdout: bytes, stderr: bytes):
+        self.argv = argv
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def __str__(self):
+        return self.stdout.decode('utf8', 'replace')
+
+
+_error_classes = {}
+_error_classes_lock = threading.Lock()
+
+
+def get_error_class(exit_code: int) -> type:
+    """
+    Returns the ErrorReturnCode subclass for the given exit code
+
+    Commands killed by a signal have a negative exit code and raise
+    `SignalException_<signal>`.
+    """
+    with _error_classes_lock:
+        error_class = _error_classes.get(exit_code)
+        if error_class is None:
+            name = f'ErrorReturnCode_{exit_code}'
+            if exit_code < 0:
+                name = f'SignalException_{-exit_code}'
+
+            error_class = type(name, (ErrorReturnCode,), {'exit_code': exit_code})
+            _error_classes[exit_code] = error_class
+
+    return error_class
+
+
+ErrorReturnCode_1 = get_error_class(1)
+
+
+def execute(command: [str, list], env, **kwargs):
     """
     Executes a shell command
+
+    Args:
+        command: the command line, or its argv list, which is used as-is
+        env: the environment to run the command with
+        kwargs: options passed on to run()
     """
-    command_split = shlex.split(command)
+    argv = command
+    if isinstance(command, str):
+        argv = shlex.split(command)
+
+    spawns.record(argv)
+
+    return run(argv, get_env(env), **kwargs)
+
+
+def execute_many(commands: Iterable, env, jobs: int = DEFAULT_JOBS, **kwargs) -> list:
+    """
+    Executes multiple commands concurrently
+
+    As soon as one command fails the commands that are still running are
+    killed, the ones that have not started are cancelled, and the error is
+    raised.
+
+    Returns:
+        list of CommandResult in the same order as the given commands
+    """
+    cancel = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(execute, x, env, _cancel=cancel, **kwargs) for x in commands
+        ]
+
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            cancel.set()
+
+            for future in futures:
+                future.cancel()
+
+            raise
+
+    return [x.result() for x in futures]
 
-    # make a copy of the environment and inject the DOCKER_HOST
+
+def get_env(env: dict) -> dict:
+    """
+    Returns a copy of the given environment with the runtime variables injected
+    """
     _env = env.copy()
 
     for env_var in OS_ENV_INCLUDES:
@@ -33,8 +184,195 @@ def execute(command: str, env, **kwargs):
         if env_val:
             _env.update({env_var: env_val})
 
-    kwargs.update(dict(_env=_env))
+    return _env
+
+
+def run(
+    argv: list,
+    env: dict,
+    _fg: bool = False,
+    _iter: bool = False,
+    _in: [str, bytes] = None,
+    _cwd: str = None,
+    _err_to_out: bool = False,
+    _timeout: float = None,
+    _cancel: threading.Event = None,
+):
+    """
+    Runs the command in the given argv list
+
+    Args:
+        argv: the program and its arguments
+        env: the environment to run the command with, as-is
+        _fg: attach the command to the terminal instead of capturing its output
+        _iter: return an iterator of the command's output lines as they are produced
+        _in: data written to the command's stdin
+        _cwd: the directory to run the command in
+        _err_to_out: merge stderr into stdout
+        _timeout: the number of seconds after which the command is killed
+        _cancel: event that, when set, kills the command
+
+    Returns:
+        CommandResult, or an iterator of str lines when `_iter` is set
+    """
+    full_cmd = ' '.join(shlex.quote(x) for x in argv)
+
+    if _cancel is not None and _cancel.is_set():
+        raise CancelledError(full_cmd)
+
+    if isinstance(_in, str):
+        _in = _in.encode('utf8')
+
+    if _iter:
+        return _iter_lines(argv, env, full_cmd, _cwd, _err_to_out, _timeout)
+
+    with tracing.span(os.path.basename(argv[0]), 'exec', argv=argv) as trace:
+        exit_code, stdout, stderr = _run(
+            argv, env, full_cmd, _fg, _in, _cwd, _err_to_out, _timeout, _cancel
+        )
+
+        trace.args['exit_code'] = exit_code
+
+    stdout = stdout or b''
+    stderr = stderr or b''
+
+    if exit_code != 0:
+        raise get_error_class(exit_code)(full_cmd, stdout, stderr)
+
+    return CommandResult(argv, exit_code, stdout, stderr)
+
+
+def _run(
+    argv: list,
+    env: dict,
+    full_cmd: str,
+    fg: bool,
+    data: bytes,
+    cwd: str,
+    err_to_out: bool,
+    timeout: float,
+    cancel: threading.Event,
+) -> tuple:
+    """
+    Runs the command to completion
+
+    Returns:
+        tuple of the exit code, stdout and stderr
+    """
+    kwargs = {}
+    if not fg:
+        kwargs.update(
+            stdin=subprocess.DEVNULL if data is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT if err_to_out else subprocess.PIPE,
+        )
+    elif data is not None:
+        kwargs.update(stdin=subprocess.PIPE)
+
+    proc = subprocess.Popen(argv, env=env, cwd=cwd, **kwargs)
+
+    try:
+        stdout, stderr = _communicate(proc, full_cmd, data, timeout, cancel)
+    except BaseException:
+        proc.kill()
+        proc.communicate()
+
+        raise
+
+    return proc.returncode, stdout, stderr
+
+
+def _communicate(proc, full_cmd: str, data: bytes, timeout: float, cancel: threading.Event) -> tuple:
+    """
+    Waits for the process to finish, enforcing the timeout and the cancel event
+    """
+    deadline = None
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+
+    while True:
+        step = None
+        if cancel is not None:
+            step = CANCEL_POLL_INTERVAL
+
+        if deadline is not None:
+            remaining = max(deadline - time.monotonic(), 0)
+            step = remaining if step is None else min(step, remaining)
+
+        try:
+            return proc.communicate(data, timeout=step)
+        except subprocess.TimeoutExpired:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutException(full_cmd, timeout)
+
+            if cancel is not None and cancel.is_set():
+                raise CancelledError(full_cmd)
+
+
+def _iter_lines(argv: list, env: dict, full_cmd: str, cwd: str, err_to_out: bool, timeout: float):
+    """
+    Starts the command and returns an iterator of its output lines
+
+    stderr is spooled to a temporary file rather than a pipe so that it can
+    be included in the error without a thread to drain it.
+    """
+    trace = tracing.Span(os.path.basename(argv[0]), 'exec', {'argv': argv})
+
+    stderr_fh = None if err_to_out else tempfile.TemporaryFile()
+
+    proc = subprocess.Popen(
+        argv,
+        env=env,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT if err_to_out else stderr_fh,
+        universal_newlines=True,
+        encoding='utf8',
+        errors='replace',
+    )
+
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        proc.kill()
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+
+    def iterate():
+        try:
+            for line in proc.stdout:
+                yield line
+
+            proc.wait()
+        finally:
+            if timer:
+                timer.cancel()
+
+            # the caller stopped iterating before the command finished
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+            proc.stdout.close()
+
+            trace.finish(exit_code=proc.returncode)
+
+            stderr = b''
+            if stderr_fh:
+                stderr_fh.seek(0)
+                stderr = stderr_fh.read()
+                stderr_fh.close()
+
+        if timed_out.is_set():
+            raise TimeoutException(full_cmd, timeout)
 
-    proc = getattr(sh, command_split[0])
+        if proc.returncode != 0:
+            raise get_error_class(proc.returncode)(full_cmd, b'', stderr)
 
-    return proc(*command_split[1:], **kwargs)
+    return iterate()
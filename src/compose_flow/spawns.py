@@ -0,0 +1,68 @@
+"""
+Spawns module
+
+Keeps track of every external command that is run, so the number of
+processes a run spawns can be reported with `--spawn-report` and capped in
+tests.
+"""
+import collections
+import os
+import threading
+
+from tabulate import tabulate
+
+_lock = threading.Lock()
+_spawns = []
+
+
+def get_command_name(argv: list) -> str:
+    """
+    Returns the program and its first argument that is not an option, e.g. `docker service`
+    """
+    name = os.path.basename(argv[0])
+
+    for arg in argv[1:]:
+        if not arg.startswith('-'):
+            return f'{name} {arg}'
+
+    return name
+
+
+def get_spawns() -> list:
+    """
+    Returns the argv of every command spawned since the last reset
+    """
+    with _lock:
+        return list(_spawns)
+
+
+def get_summary() -> list:
+    """
+    Returns the number of spawns of each command, most frequent first
+
+    Returns:
+        list of tuples of the command name and its count
+    """
+    counts = collections.Counter(get_command_name(x) for x in get_spawns())
+
+    return sorted(counts.items(), key=lambda x: (-x[1], x[0]))
+
+
+def print_report(fh=None) -> None:
+    """
+    Prints a table of the commands spawned and the number of times each was spawned
+    """
+    rows = get_summary()
+    rows.append(('total', sum(x[1] for x in rows)))
+
+    print(tabulate(rows, headers=['command', 'spawns']), file=fh)
+
+
+def record(argv: list) -> None:
+    with _lock:
+        _spawns.append(list(argv))
+
+
+def reset() -> None:
+    with _lock:
+        del _spawns[:]
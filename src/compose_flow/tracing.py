@@ -0,0 +1,171 @@
+"""
+Tracing module
+
+Records how long each phase of a run and each command it executes takes.
+
+Spans are only recorded once tracing is enabled, which the `--trace` and
+`--timings` options do; the recorded spans can be written out as Chrome
+trace events, viewable in chrome://tracing or https://ui.perfetto.dev, or
+summarized in a table.
+"""
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+from tabulate import tabulate
+
+_enabled = False
+_lock = threading.Lock()
+_spans = []
+
+
+class Span(object):
+    """
+    A timed section of a run
+    """
+
+    def __init__(self, name: str, category: str, args: dict = None):
+        self.name = name
+        self.category = category
+        self.args = args or {}
+
+        self.thread_id = threading.get_ident()
+
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def finish(self, **args) -> None:
+        """
+        Ends the span, adding the given args to it
+        """
+        if self.duration is not None:
+            return
+
+        self.duration = time.perf_counter() - self.start
+        self.args.update(args)
+
+        if _enabled:
+            with _lock:
+                _spans.append(self)
+
+
+def disable() -> None:
+    global _enabled
+
+    _enabled = False
+
+
+def enable() -> None:
+    """
+    Starts recording spans, discarding the ones recorded previously
+    """
+    global _enabled
+
+    with _lock:
+        del _spans[:]
+
+    _enabled = True
+
+
+def get_spans() -> list:
+    with _lock:
+        return list(_spans)
+
+
+def get_summary() -> list:
+    """
+    Returns the recorded spans grouped by name
+
+    Returns:
+        list of dicts, in the order each name was first started
+    """
+    rows = {}
+
+    for span in sorted(get_spans(), key=lambda x: x.start):
+        row = rows.setdefault(
+            span.name, {'name': span.name, 'category': span.category, 'count': 0, 'total': 0, 'max': 0}
+        )
+
+        row['count'] += 1
+        row['total'] += span.duration
+        row['max'] = max(row['max'], span.duration)
+
+    return list(rows.values())
+
+
+def get_trace_events() -> dict:
+    """
+    Returns the recorded spans in the Chrome trace event format
+    """
+    pid = os.getpid()
+
+    events = []
+    for span in sorted(get_spans(), key=lambda x: x.start):
+        events.append(
+            {
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': int(span.start * 1e6),
+                'dur': int(span.duration * 1e6),
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': span.args,
+            }
+        )
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def print_summary(fh=None) -> None:
+    """
+    Prints a table of the time spent in each phase and command
+    """
+    rows = []
+    for row in get_summary():
+        rows.append(
+            [
+                row['name'],
+                row['category'],
+                row['count'],
+                f'{row["total"]:.3f}',
+                f'{row["max"]:.3f}',
+            ]
+        )
+
+    print(tabulate(rows, headers=['name', 'category', 'count', 'total (s)', 'max (s)']), file=fh)
+
+
+@contextmanager
+def span(name: str, category: str = 'phase', **args):
+    """
+    Records the time spent within the block
+
+    The yielded Span's `args` can be updated to add information that's only
+    known once the block has run.
+    """
+    current = Span(name, category, args)
+
+    try:
+        yield current
+    except BaseException as exc:
+        current.finish(error=exc.__class__.__name__)
+
+        raise
+    else:
+        current.finish()
+
+
+def write_trace(path: str) -> None:
+    """
+    Writes the recorded spans to the given path as Chrome trace events
+    """
+    with open(path, 'w') as fh:
+        json.dump(get_trace_events(), fh)
@@ -1,15 +1,17 @@
 import base64
 import logging
+import random
 import re
 import os
 import yaml
 
 from collections import OrderedDict
+from typing import Iterable
 
 from boltons.iterutils import remap, get_path, default_enter, default_visit
 from jinja2 import Environment
 
-from compose_flow import shell
+from compose_flow import git, shell, tracing
 
 from .errors import TagVersionError, EnvError, ProfileError
 
@@ -17,12 +19,59 @@ from .errors import TagVersionError, EnvError, ProfileError
 VAR_RE = re.compile(r'\${(?P<varname>.*?)(?P<junk>[:?].*)?}')
 
 
+def backoff_delays(retries: int, base: float = 0.25, cap: float = 4.0) -> Iterable[float]:
+    """
+    Generates exponentially increasing delays with jitter
+
+    Half of each delay is fixed and the other half is random so that
+    concurrent callers do not retry in lock step.
+
+    Args:
+        retries: the number of delays to generate
+        base: the delay, in seconds, of the first retry
+        cap: the maximum delay, in seconds
+    """
+    for attempt in range(retries):
+        delay = min(cap, base * 2 ** attempt)
+
+        yield delay / 2 + random.uniform(0, delay / 2)
+
+
 def get_repo_name() -> str:
     repo_name = os.path.basename(os.getcwd())
 
     return repo_name
 
 
+def get_git_version(default: str) -> [str, None]:
+    """
+    Returns the `tag-version` version by reading the git repo directly
+
+    Returns:
+        the version, or None when it cannot be computed without the `tag-version` cli
+    """
+    logger = logging.getLogger(__name__)
+
+    repo = git.find_repo()
+    if not repo:
+        return None
+
+    try:
+        clean, status = repo.is_clean()
+        if not clean:
+            raise TagVersionError(
+                'Warning: working copy not clean',
+                shell_exception=None,
+                tag_version=f'{default}-dirty',
+            )
+
+        return repo.tag_version()
+    except (OSError, ValueError, shell.ErrorReturnCode) as exc:
+        logger.debug(f'unable to compute version from git, falling back to tag-version: {exc}')
+
+    return None
+
+
 def get_tag_version(default: str = None) -> str:
     """
     Returns the version of code as returned by the `tag-version` cli command
@@ -33,6 +82,13 @@ def get_tag_version(default: str = None) -> str:
     """
     # inject the version from tag-version command into the loaded environment
     tag_version = default or 'unknown'
+
+    with tracing.span('git_version'):
+        version = get_git_version(tag_version)
+
+    if version:
+        return version
+
     try:
         proc = shell.execute('tag-version', os.environ)
     except Exception as exc:
@@ -194,7 +250,10 @@ def yaml_dump(data, stream=None, Dumper=yaml.Dumper, **kwds):
     """
 
     class OrderedDumper(Dumper):
-        pass
+        # write out data that appears more than once in full rather than as
+        # anchors and aliases, e.g. the data shared by expanded services
+        def ignore_aliases(self, data):
+            return True
 
     def _dict_representer(dumper, data):
         return dumper.represent_mapping(
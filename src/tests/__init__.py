@@ -1,7 +1,11 @@
 import os
+import tempfile
 
+from contextlib import contextmanager
 from unittest import TestCase, mock
 
+from compose_flow import spawns
+
 CF_DOCKER_IMAGE_PREFIX = 'test.registry.prefix.com'
 
 os.environ['CF_DOCKER_IMAGE_PREFIX'] = CF_DOCKER_IMAGE_PREFIX
@@ -14,8 +18,65 @@ class BaseTestCase(TestCase):
 
         super().setUp()
 
-        self.sh_patcher = mock.patch('compose_flow.shell.sh')
-        self.sh_mock = self.sh_patcher.start()
+        # commands are never actually run
+        self.run_patcher = mock.patch('compose_flow.shell.run')
+        self.run_mock = self.run_patcher.start()
+
+        # keep cached lookups out of the user's config root
+        self.cache_root = tempfile.TemporaryDirectory()
+        self.cache_patcher = mock.patch(
+            'compose_flow.settings.APP_CACHE_ROOT', new=self.cache_root.name
+        )
+        self.cache_patcher.start()
+
+        # look up kube contexts in the test's own kubeconfig, which does not exist unless written
+        self.kubeconfig_patcher = mock.patch(
+            'compose_flow.settings.KUBECONFIG', new=os.path.join(self.cache_root.name, 'kubeconfig')
+        )
+        self.kubeconfig_patcher.start()
+
+        # keep ssh multiplex sockets out of the user's config root as well
+        self.ssh_control_dir_patcher = mock.patch(
+            'compose_flow.logs.SSH_CONTROL_DIR', new=os.path.join(self.cache_root.name, 'ssh')
+        )
+        self.ssh_control_dir_patcher.start()
+
+        # versions come from the mocked out tag-version cli rather than this repo
+        self.find_repo_patcher = mock.patch('compose_flow.git.find_repo', return_value=None)
+        self.find_repo_patcher.start()
+
+    @contextmanager
+    def assertMaxSpawns(self, count: int, program: str = None):
+        """
+        Asserts that the block runs at most `count` commands, or `program` commands when given
+
+        Commands are stubbed out, so this catches code that runs a command per
+        item where a single command would do.
+        """
+        spawns.reset()
+
+        yield
+
+        argv_l = [x for x in spawns.get_spawns() if program is None or x[0] == program]
+        if len(argv_l) > count:
+            commands = '\n'.join(' '.join(x) for x in argv_l)
+
+            self.fail(f'{len(argv_l)} commands run, expected at most {count}:\n{commands}')
+
+    def get_run_calls(self, program: str) -> list:
+        """
+        Returns the argv lists of the commands run with the given program
+        """
+        return [x[1][0] for x in self.run_mock.mock_calls if x[1] and x[1][0][0] == program]
 
     def tearDown(self):
-        self.sh_patcher.stop()
+        self.run_patcher.stop()
+
+        self.find_repo_patcher.stop()
+
+        self.ssh_control_dir_patcher.stop()
+
+        self.kubeconfig_patcher.stop()
+
+        self.cache_patcher.stop()
+        self.cache_root.cleanup()
@@ -16,6 +16,5 @@ class BaseSubcommandTestCase(BaseTestCase):
         command = TestSubcommand(workflow)
         proc = command.execute('docker ps')
 
-        # make sure that sh was executed with the workflow environment
-        sh_mock = self.sh_mock
-        sh_mock.docker.assert_called_with('ps', _env=workflow.environment.data)
+        # make sure that the command was run with the workflow environment
+        self.run_mock.assert_called_with(['docker', 'ps'], workflow.environment.data)
@@ -0,0 +1,286 @@
+import os
+import shlex
+import tempfile
+
+from unittest import TestCase, mock
+
+from compose_flow import build_cache
+from compose_flow.commands import Workflow
+
+from tests import BaseTestCase
+
+
+class DockerignoreTestCase(TestCase):
+    def get_patterns(self, *lines):
+        with tempfile.TemporaryDirectory() as context:
+            with open(os.path.join(context, '.dockerignore'), 'w') as fh:
+                fh.write('\n'.join(lines))
+
+            return build_cache.load_dockerignore(context)
+
+    def test_directory_excludes_contents(self, *mocks):
+        patterns = self.get_patterns('node_modules')
+
+        self.assertEqual(True, build_cache.is_ignored('node_modules/foo/index.js', patterns))
+        self.assertEqual(False, build_cache.is_ignored('src/node_modules.txt', patterns))
+
+    def test_double_star(self, *mocks):
+        patterns = self.get_patterns('**/*.pyc')
+
+        self.assertEqual(True, build_cache.is_ignored('app.pyc', patterns))
+        self.assertEqual(True, build_cache.is_ignored('app/models/user.pyc', patterns))
+        self.assertEqual(False, build_cache.is_ignored('app/models/user.py', patterns))
+
+    def test_exception(self, *mocks):
+        """
+        Ensure the last matching pattern wins
+        """
+        patterns = self.get_patterns('# comment', '*.md', '!README.md')
+
+        self.assertEqual(True, build_cache.is_ignored('CHANGES.md', patterns))
+        self.assertEqual(False, build_cache.is_ignored('README.md', patterns))
+
+
+class ContextHashTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.context = tempfile.TemporaryDirectory()
+
+        self.write('Dockerfile', 'FROM python:3.6\n')
+        self.write('app/main.py', 'print("hello")\n')
+        self.write('.dockerignore', 'docs\n')
+
+    def tearDown(self):
+        self.context.cleanup()
+
+        super().tearDown()
+
+    def get_hash(self, env=None, **build):
+        return build_cache.get_context_hash(dict(context=self.context.name, **build), env)
+
+    def write(self, path, content):
+        path = os.path.join(self.context.name, path)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fh:
+            fh.write(content)
+
+    def test_changed_file(self, *mocks):
+        context_hash = self.get_hash()
+
+        self.write('app/main.py', 'print("goodbye")\n')
+
+        self.assertNotEqual(context_hash, self.get_hash())
+
+    def test_ignored_file(self, *mocks):
+        context_hash = self.get_hash()
+
+        self.write('docs/index.md', '# docs\n')
+
+        self.assertEqual(context_hash, self.get_hash())
+
+    def test_build_args(self, *mocks):
+        context_hash = self.get_hash(args={'VERSION': '1'})
+
+        self.assertEqual(context_hash, self.get_hash(args=['VERSION=1']))
+        self.assertNotEqual(context_hash, self.get_hash(args={'VERSION': '2'}))
+
+    def test_build_target(self, *mocks):
+        """
+        Ensure services built from the same context to different stages do not share a hash
+        """
+        self.assertNotEqual(self.get_hash(target='app'), self.get_hash(target='worker'))
+        self.assertNotEqual(self.get_hash(), self.get_hash(target='app'))
+
+        self.assertNotEqual(self.get_hash(labels={'a': '1'}), self.get_hash(labels={'a': '2'}))
+        self.assertNotEqual(self.get_hash(cache_from=['app:1']), self.get_hash(cache_from=['app:2']))
+
+    def test_build_args_from_env(self, *mocks):
+        """
+        Ensure args without a value are hashed with their value from the environment
+        """
+        context_hash = self.get_hash(args=['VERSION'], env={'VERSION': '1'})
+
+        self.assertEqual(context_hash, self.get_hash(args=['VERSION=1']))
+        self.assertEqual(context_hash, self.get_hash(args={'VERSION': None}, env={'VERSION': '1'}))
+        self.assertNotEqual(context_hash, self.get_hash(args=['VERSION'], env={'VERSION': '2'}))
+
+
+@mock.patch('compose_flow.build_cache.docker')
+class ChangedServicesTestCase(BaseTestCase):
+    def test_reuses_unchanged_image(self, *mocks):
+        """
+        Ensure an unchanged service is skipped and its last image tagged with the new name
+        """
+        docker_mock = mocks[0]
+        docker_mock.get_local_images.return_value = {'app:1'}
+
+        services = {'app': {'image': 'app:2'}, 'worker': {'image': 'worker:2'}}
+        hashes = {'app': 'aaa', 'worker': 'bbb'}
+
+        build_cache.record_builds('test', {'app': {'image': 'app:1'}, 'worker': {'image': 'worker:1'}}, hashes)
+
+        changed = build_cache.get_changed_services(services, dict(hashes, worker='ccc'), 'test')
+
+        self.assertEqual(['worker'], changed)
+        docker_mock.tag_image.assert_called_with('app:1', 'app:2')
+
+    def test_missing_image_rebuilt(self, *mocks):
+        docker_mock = mocks[0]
+        docker_mock.get_local_images.return_value = set()
+
+        build_cache.record_builds('test', {'app': {'image': 'app:1'}}, {'app': 'aaa'})
+
+        changed = build_cache.get_changed_services({'app': {'image': 'app:2'}}, {'app': 'aaa'}, 'test')
+
+        self.assertEqual(['app'], changed)
+        docker_mock.tag_image.assert_not_called()
+
+    def test_dry_run_does_not_tag(self, *mocks):
+        docker_mock = mocks[0]
+        docker_mock.get_local_images.return_value = {'app:1'}
+
+        build_cache.record_builds('test', {'app': {'image': 'app:1'}}, {'app': 'aaa'})
+
+        changed = build_cache.get_changed_services(
+            {'app': {'image': 'app:2'}}, {'app': 'aaa'}, 'test', dry_run=True
+        )
+
+        self.assertEqual([], changed)
+        docker_mock.tag_image.assert_not_called()
+
+
+class BuildDependenciesTestCase(TestCase):
+    def test_from_service_image(self, *mocks):
+        """
+        Ensure a service built FROM another service's image depends on it
+        """
+        with tempfile.TemporaryDirectory() as context:
+            for name, content in (
+                ('Dockerfile.base', 'FROM python:3.6\n'),
+                ('Dockerfile.app', 'ARG BASE\nFROM --platform=linux/amd64 ${BASE} AS app\n'),
+                ('Dockerfile.worker', 'FROM app/base\n'),
+            ):
+                with open(os.path.join(context, name), 'w') as fh:
+                    fh.write(content)
+
+            services = {
+                'base': {
+                    'build': {'context': context, 'dockerfile': 'Dockerfile.base'},
+                    'image': 'app/base:latest',
+                },
+                'app': {
+                    'build': {'context': context, 'dockerfile': 'Dockerfile.app', 'args': {'BASE': 'app/base:latest'}},
+                    'image': 'app/app:1',
+                },
+                'worker': {
+                    'build': {'context': context, 'dockerfile': 'Dockerfile.worker'},
+                    'image': 'app/worker:1',
+                },
+            }
+
+            self.assertEqual(
+                {'base': set(), 'app': {'base'}, 'worker': {'base'}},
+                build_cache.get_build_dependencies(services),
+            )
+
+
+@mock.patch('compose_flow.commands.subcommands.build.build_cache.get_build_dependencies')
+@mock.patch('compose_flow.commands.subcommands.build.build_cache.get_context_hashes')
+class BuildTestCase(BaseTestCase):
+    def get_build(self, argv):
+        workflow = Workflow(argv=shlex.split(argv))
+
+        build = workflow.subcommand
+        build.compose.handle = mock.Mock(return_value='')
+        build.get_build_services = mock.Mock(
+            return_value={'app': {'image': 'app:1'}, 'worker': {'image': 'worker:1'}}
+        )
+
+        return build
+
+    def get_built(self, build) -> list:
+        return sorted(x[2]['extra_args'] for x in build.compose.handle.mock_calls)
+
+    def test_only_changed_services_built(self, *mocks):
+        get_context_hashes_mock = mocks[0]
+        get_context_hashes_mock.return_value = {'app': 'aaa', 'worker': 'bbb'}
+
+        get_build_dependencies_mock = mocks[1]
+        get_build_dependencies_mock.return_value = {'app': set(), 'worker': set()}
+
+        build = self.get_build('build')
+
+        with mock.patch('sys.stdout'):
+            build.build()
+
+        self.assertEqual(
+            [['build', '--pull', 'app'], ['build', '--pull', 'worker']], self.get_built(build)
+        )
+
+        # nothing changed, nothing is built
+        build.compose.handle.reset_mock()
+        with mock.patch('compose_flow.build_cache.docker.get_local_images') as get_local_images_mock:
+            get_local_images_mock.return_value = {'app:1', 'worker:1'}
+
+            build.build()
+
+        build.compose.handle.assert_not_called()
+
+        # one service changed, only that one is built
+        get_context_hashes_mock.return_value = {'app': 'aaa', 'worker': 'ccc'}
+        with mock.patch('compose_flow.build_cache.docker.get_local_images') as get_local_images_mock:
+            get_local_images_mock.return_value = {'app:1', 'worker:1'}
+
+            with mock.patch('sys.stdout'):
+                build.build()
+
+        self.assertEqual([['build', '--pull', 'worker']], self.get_built(build))
+
+    def test_dependents_rebuilt(self, *mocks):
+        """
+        Ensure an image built from a changed image is rebuilt without pulling its base
+        """
+        get_context_hashes_mock = mocks[0]
+        get_context_hashes_mock.return_value = {'app': 'aaa', 'worker': 'bbb'}
+
+        get_build_dependencies_mock = mocks[1]
+        get_build_dependencies_mock.return_value = {'app': set(), 'worker': {'app'}}
+
+        build = self.get_build('build')
+
+        with mock.patch('sys.stdout'):
+            build.build()
+
+        get_context_hashes_mock.return_value = {'app': 'ccc', 'worker': 'bbb'}
+        build.compose.handle.reset_mock()
+
+        with mock.patch('compose_flow.build_cache.docker.get_local_images') as get_local_images_mock:
+            get_local_images_mock.return_value = {'app:1', 'worker:1'}
+
+            with mock.patch('sys.stdout'):
+                build.build()
+
+        self.assertEqual(
+            [['build', '--pull', 'app'], ['build', 'worker']], self.get_built(build)
+        )
+
+    def test_force(self, *mocks):
+        get_context_hashes_mock = mocks[0]
+        get_context_hashes_mock.return_value = {'app': 'aaa', 'worker': 'bbb'}
+
+        get_build_dependencies_mock = mocks[1]
+        get_build_dependencies_mock.return_value = {'app': set(), 'worker': set()}
+
+        build = self.get_build('build')
+
+        with mock.patch('sys.stdout'):
+            build.build()
+
+        build = self.get_build('build --force')
+
+        with mock.patch('sys.stdout'):
+            build.build()
+
+        self.assertEqual(2, build.compose.handle.call_count)
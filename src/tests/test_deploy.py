@@ -1,9 +1,14 @@
+import json
+import os
 import shlex
+import tempfile
 
 from unittest import mock
 
+from compose_flow import errors, fanout
 from compose_flow.commands import Workflow
 from compose_flow.commands.subcommands.profile import Profile
+from compose_flow.kube import fingerprints
 
 from tests import BaseTestCase
 
@@ -75,3 +80,331 @@ class DeployTestCase(BaseTestCase):
             _check_mock = getattr(workflow.profile, name)
 
             self.assertGreater(_check_mock.call_count, 0, f'{name} not called')
+
+    @mock.patch('compose_flow.commands.subcommands.profile.Profile.data', new_callable=mock.PropertyMock)
+    def test_docker_stdin(self, *mocks):
+        """
+        Ensures the compiled profile is passed to docker on stdin rather than written to disk
+        """
+        profile_data_mock = mocks[0]
+        profile_data_mock.return_value = {
+            'services': {
+                'app': {
+                    'image': 'foo:test',
+                    'deploy': {
+                        'placement': {'constraints': ['node.role == worker']},
+                        'resources': {
+                            'limits': {'memory': '100M'},
+                            'reservations': {'memory': '100M'},
+                        },
+                    },
+                },
+            },
+        }
+
+        write_mock = mocks[1]
+
+        workflow = Workflow(argv=shlex.split('-e dev deploy docker --stdin'))
+        workflow.environment.write = mock.Mock()
+
+        self.assertEqual(None, workflow.run())
+
+        write_mock.assert_not_called()
+
+        deploys = [x for x in self.run_mock.mock_calls if x[1] and x[1][0][:3] == ['docker', 'stack', 'deploy']]
+        self.assertEqual(1, len(deploys))
+
+        self.assertIn('--compose-file -', ' '.join(deploys[0][1][0]))
+        self.assertIn('image: foo:test', deploys[0][2]['_in'])
+
+    @mock.patch('compose_flow.kube.mixins.KubeMixIn.config', new_callable=mock.PropertyMock)
+    def test_helm_apps_listed_once(self, *mocks):
+        """
+        Ensure the installed helm apps are listed once rather than once per app
+        """
+        config_mock = mocks[0]
+        config_mock.return_value = {
+            'helm': [
+                {'name': f'app{x}', 'version': '1.0', 'namespace': 'default', 'chart': 'chart', 'answers': 'answers.yml'}
+                for x in range(3)
+            ]
+        }
+
+        workflow = Workflow(argv=shlex.split('-e dev deploy helm'))
+
+        deploy = workflow.subcommand
+        deploy.render_answers = mock.Mock(return_value='answers.yml')
+
+        # the context is passed to helm rather than switched to with kubectl
+        with self.assertMaxSpawns(0, program='kubectl'), self.assertMaxSpawns(1, program='helm'):
+            commands = deploy.build_helm_command()
+
+        self.assertEqual(3, len(commands))
+        self.assertEqual(['helm', '--kube-context', 'dev', 'ls', '-q', '--all'], self.get_run_calls('helm')[0])
+        self.assertTrue(commands[0].startswith('helm --kube-context dev install'))
+
+    @mock.patch('compose_flow.kube.mixins.KubeMixIn.config', new_callable=mock.PropertyMock)
+    def test_missing_kube_context(self, *mocks):
+        """
+        Ensure the kube context is looked up in the kubeconfig without running kubectl
+        """
+        config_mock = mocks[0]
+        config_mock.return_value = {'kubecontexts': {'prod': 'prod-cluster'}}
+
+        with open(os.path.join(self.cache_root.name, 'kubeconfig'), 'w') as fh:
+            fh.write('contexts:\n- name: dev\n- name: prod-cluster\n')
+
+        workflow = Workflow(argv=shlex.split('-e prod deploy kubectl'))
+        self.assertEqual('prod-cluster', workflow.subcommand.kube_context)
+
+        workflow = Workflow(argv=shlex.split('-e stage deploy kubectl'))
+        with self.assertRaises(errors.InvalidTargetClusterError):
+            workflow.subcommand.kube_context
+
+        self.assertEqual([], self.run_mock.mock_calls)
+
+    @mock.patch('compose_flow.kube.mixins.KubeMixIn.config', new_callable=mock.PropertyMock)
+    @mock.patch('compose_flow.kube.rancher.api_get')
+    def test_private_rancher_config(self, *mocks):
+        """
+        Ensure the rancher context is switched in a copy of the user's rancher config
+
+        The project is looked up in the cached listing and the rancher cli is not run.
+        """
+        api_get_mock = mocks[0]
+        api_get_mock.side_effect = lambda server, path: {
+            'clusters': [{'id': 'c-dev', 'name': 'dev'}, {'id': 'c-prod', 'name': 'prod'}],
+            'projects': [
+                {'id': 'c-dev:p-web', 'name': 'web', 'clusterId': 'c-dev'},
+                {'id': 'c-prod:p-web', 'name': 'web', 'clusterId': 'c-prod'},
+            ],
+        }[path]
+
+        config_mock = mocks[1]
+        config_mock.return_value = {'rancher': {'project': 'web'}}
+
+        rancher_dir = os.path.join(self.cache_root.name, 'rancher')
+        os.makedirs(rancher_dir)
+        with open(os.path.join(rancher_dir, 'cli2.json'), 'w') as fh:
+            json.dump({'Servers': {'default': {'url': 'https://rancher'}}, 'CurrentServer': 'default'}, fh)
+
+        with mock.patch('compose_flow.settings.RANCHER_CONFIG_DIR', new=rancher_dir), \
+                mock.patch('compose_flow.settings.APP_CONFIG_ROOT', new=self.cache_root.name):
+            config_dirs = []
+            for _ in range(2):
+                workflow = Workflow(argv=shlex.split('-e prod deploy rancher'))
+                workflow.subcommand.switch_rancher_context()
+
+                config_dirs.append(workflow.subcommand.rancher_config_dir)
+
+            config_dir = config_dirs[-1]
+
+        self.assertNotEqual(rancher_dir, config_dir)
+
+        # concurrent runs of the same profile never share a config
+        self.assertNotEqual(config_dirs[0], config_dirs[1])
+
+        with open(os.path.join(config_dir, 'cli2.json'), 'r') as fh:
+            self.assertEqual('c-prod:p-web', json.load(fh)['Servers']['default']['project'])
+
+        # the second deploy uses the cached listing
+        self.assertEqual(2, len(api_get_mock.mock_calls))
+        self.assertEqual([], self.get_run_calls('rancher'))
+
+    @mock.patch('compose_flow.kube.mixins.KubeMixIn.config', new_callable=mock.PropertyMock)
+    def test_single_apply(self, *mocks):
+        """
+        Ensure manifests are rendered in memory and applied with one command per prune label
+        """
+        config_mock = mocks[0]
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            os.makedirs(os.path.join(tempdir, 'more'))
+
+            for name in ('a.yml', 'b.yml', 'more/c.yaml', 'web.yml'):
+                with open(os.path.join(tempdir, name), 'w') as fh:
+                    fh.write(f'kind: ConfigMap\nmetadata:\n  name: ${{NAME}}-{name}\n')
+
+            config_mock.return_value = {
+                'kubectl_manifests': [
+                    os.path.join(tempdir, 'a.yml'),
+                    {'path': os.path.join(tempdir, 'web.yml'), 'label': 'web'},
+                    os.path.join(tempdir, 'more'),
+                    {'path': os.path.join(tempdir, 'b.yml'), 'raw': True},
+                ]
+            }
+
+            workflow = Workflow(argv=shlex.split('-e dev deploy kubectl --single-apply'))
+            workflow.environment._data = {'NAME': 'test'}
+            workflow.environment.write = mock.Mock()
+
+            deploy = workflow.subcommand
+
+            # nothing is in the cluster yet
+            self.run_mock.return_value = mock.Mock(stdout=b'')
+
+            # one get for the whole deploy and one apply per prune label; the context is
+            # passed rather than switched to
+            with self.assertMaxSpawns(3, program='kubectl'):
+                deploy.handle()
+
+            files = os.listdir(tempdir)
+
+        # nothing is rendered to disk
+        self.assertEqual([], [x for x in files if x.startswith('compose-flow-')])
+
+        applies = [x for x in self.run_mock.mock_calls if x[1] and x[1][0][:4] == ['kubectl', '--context', 'dev', 'apply']]
+        self.assertEqual(2, len(applies))
+
+        self.assertEqual(['kubectl', '--context', 'dev', 'apply', '--validate', '-f', '-'], applies[0][1][0])
+        content = applies[0][2]['_in']
+        self.assertEqual(3, content.count('kind: ConfigMap'))
+        self.assertIn('name: test-a.yml', content)
+        self.assertIn('name: ${NAME}-b.yml', content)
+
+        self.assertEqual(
+            ['kubectl', '--context', 'dev', 'apply', '-l', 'deploy=web', '--prune', '--validate', '-f', '-'],
+            applies[1][1][0],
+        )
+
+    @mock.patch('compose_flow.kube.mixins.KubeMixIn.config', new_callable=mock.PropertyMock)
+    def test_unchanged_manifests_skipped(self, *mocks):
+        """
+        Ensure manifests whose fingerprint matches the one in the cluster are not applied again
+        """
+        config_mock = mocks[0]
+
+        # the objects in the cluster, by key
+        cluster = {}
+
+        def run(argv, env, **kwargs):
+            documents = fingerprints.load_documents(kwargs.get('_in') or '')
+
+            if 'get' in argv:
+                items = [cluster[x] for x in map(fingerprints.get_document_key, documents) if x in cluster]
+
+                return mock.Mock(stdout=json.dumps({'kind': 'List', 'items': items}).encode('utf8'))
+
+            for document in documents:
+                cluster[fingerprints.get_document_key(document)] = document
+
+            return mock.Mock(stdout=b'')
+
+        self.run_mock.side_effect = run
+
+        def deploy(argv):
+            self.run_mock.reset_mock()
+
+            workflow = Workflow(argv=shlex.split(f'-e dev deploy kubectl --single-apply {argv}'))
+            workflow.environment._data = {'NAME': 'test'}
+            workflow.environment.write = mock.Mock()
+            workflow.subcommand.handle()
+
+            return [
+                x[2]['_in'] for x in self.run_mock.mock_calls
+                if x[1] and x[1][0][:4] == ['kubectl', '--context', 'dev', 'apply']
+            ]
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            for name in ('a.yml', 'b.yml', 'web.yml'):
+                with open(os.path.join(tempdir, name), 'w') as fh:
+                    fh.write(f'kind: ConfigMap\nmetadata:\n  name: {name}\n')
+
+            config_mock.return_value = {
+                'kubectl_manifests': [
+                    os.path.join(tempdir, 'a.yml'),
+                    os.path.join(tempdir, 'b.yml'),
+                    {'path': os.path.join(tempdir, 'web.yml'), 'label': 'web'},
+                ]
+            }
+
+            applies = deploy('')
+            self.assertEqual(2, len(applies))
+            self.assertIn('compose-flow/fingerprint:', applies[0])
+
+            # nothing changed, which is found out with a single get
+            self.assertEqual([], deploy(''))
+            self.assertEqual(1, len(self.get_run_calls('kubectl')))
+
+            with open(os.path.join(tempdir, 'b.yml'), 'a') as fh:
+                fh.write('data:\n  foo: bar\n')
+
+            applies = deploy('')
+
+            self.assertEqual(1, len(applies))
+            self.assertNotIn('name: a.yml', applies[0])
+            self.assertIn('name: b.yml', applies[0])
+
+            # the object was changed or removed in the cluster by someone else
+            del cluster['ConfigMap/default/a.yml']
+
+            applies = deploy('')
+
+            self.assertEqual(1, len(applies))
+            self.assertIn('name: a.yml', applies[0])
+
+            self.assertEqual(2, len(deploy('--full')))
+
+
+@mock.patch('compose_flow.fanout.print_report')
+@mock.patch('compose_flow.fanout.run_targets')
+class DeployTargetsTestCase(BaseTestCase):
+    def get_phases(self, run_targets_mock) -> list:
+        return [(x[1][0], x[1][1]) for x in run_targets_mock.mock_calls]
+
+    def test_prepare_then_deploy(self, *mocks):
+        """
+        Ensure every target is prepared with a dry run before any is deployed
+        """
+        run_targets_mock = mocks[0]
+        run_targets_mock.side_effect = lambda targets, argv, **kwargs: [
+            fanout.TargetResult(x, 0, '', 0.1) for x in targets
+        ]
+
+        workflow = Workflow(argv=shlex.split('-e dev,stage,prod --jobs 2 deploy rancher --canary'))
+
+        self.assertEqual(None, workflow.run())
+
+        self.assertEqual(
+            [
+                (['dev', 'stage', 'prod'], ['--dry-run', 'deploy', 'rancher', '--canary']),
+                (['dev'], ['deploy', 'rancher', '--canary']),
+                (['stage', 'prod'], ['deploy', 'rancher', '--canary']),
+            ],
+            self.get_phases(run_targets_mock),
+        )
+        self.assertEqual(2, run_targets_mock.mock_calls[-1][2]['jobs'])
+
+        report_mock = mocks[1]
+        self.assertEqual(['prepare', 'canary', 'deploy'], list(report_mock.mock_calls[0][1][1]))
+
+    def test_failed_prepare(self, *mocks):
+        """
+        Ensure nothing is deployed when any target fails to prepare
+        """
+        run_targets_mock = mocks[0]
+        run_targets_mock.return_value = [
+            fanout.TargetResult('dev', 0, '', 0.1),
+            fanout.TargetResult('prod', 1, '', 0.1),
+        ]
+
+        workflow = Workflow(argv=shlex.split('-e dev,prod deploy kubectl'))
+
+        self.assertRegex(workflow.run(), r'nothing deployed, failed to prepare targets: prod')
+        self.assertEqual(1, len(run_targets_mock.mock_calls))
+
+    def test_failed_canary(self, *mocks):
+        run_targets_mock = mocks[0]
+        run_targets_mock.side_effect = lambda targets, argv, **kwargs: [
+            fanout.TargetResult(x, int('--dry-run' not in argv), '', 0.1) for x in targets
+        ]
+
+        workflow = Workflow(argv=shlex.split('-e dev,prod deploy helm --canary'))
+
+        self.assertRegex(workflow.run(), r'canary dev failed')
+        self.assertEqual(2, len(run_targets_mock.mock_calls))
+
+    def test_docker_not_multi_target_okay(self, *mocks):
+        workflow = Workflow(argv=shlex.split('-e dev,prod deploy docker'))
+
+        self.assertRegex(workflow.run(), r'cannot be run against multiple targets')
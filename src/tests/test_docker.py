@@ -21,3 +21,34 @@ class DockerTestCase(TestCase):
         get_docker_json_mock.side_effect = DockerError('No such config')
 
         self.assertRaises(NoSuchConfig, docker.get_config, 'test')
+
+    @mock.patch('compose_flow.docker.shell.execute')
+    def test_stream_docker_json(self, *mocks):
+        """
+        Ensure objects are yielded as lines are produced, before the command finishes
+        """
+        execute_mock = mocks[0]
+
+        def lines():
+            yield '{"Name": "one"}\n'
+            yield '{"Name": "two"}\n'
+
+            raise AssertionError('output should not be read ahead')
+
+        execute_mock.return_value = lines()
+
+        stream = docker.stream_docker_json('docker service ls', {})
+
+        self.assertEqual({'Name': 'one'}, next(stream))
+
+        execute_mock.assert_called_with('docker service ls', {}, _iter=True)
+
+        stream.close()
+
+    @mock.patch('compose_flow.docker.shell')
+    def test_stream_docker_json_error(self, *mocks):
+        shell_mock = mocks[0]
+        shell_mock.ErrorReturnCode_1 = Exception
+        shell_mock.execute.side_effect = Exception('something went wrong')
+
+        self.assertRaises(DockerError, list, docker.stream_docker_json('docker service ls', {}))
@@ -0,0 +1,138 @@
+import io
+import shlex
+import sys
+
+from unittest import TestCase, mock
+
+from compose_flow import fanout, spawns
+from compose_flow.commands import Workflow
+
+from tests import BaseTestCase
+
+
+class StripTargetArgsTestCase(TestCase):
+    def test_strips_target_options(self, *mocks):
+        """
+        Ensure the options that select targets are removed
+        """
+        argv = shlex.split('-e dev,prod --jobs 2 --all-remotes --all-clusters --trace t.json --dirty swarm inspect')
+
+        self.assertEqual(['--dirty', 'swarm', 'inspect'], fanout.strip_target_args(argv, 'swarm'))
+
+    def test_strips_attached_values(self, *mocks):
+        argv = shlex.split('-edev,prod --environment=stage --jobs=3 env cat')
+
+        self.assertEqual(['env', 'cat'], fanout.strip_target_args(argv, 'env'))
+
+    def test_subcommand_args_untouched(self, *mocks):
+        """
+        Ensure options after the subcommand are passed through as-is
+        """
+        argv = shlex.split('-e dev,prod docker run -e FOO=1 busybox')
+
+        self.assertEqual(
+            ['docker', 'run', '-e', 'FOO=1', 'busybox'],
+            fanout.strip_target_args(argv, 'docker'),
+        )
+
+
+@mock.patch('compose_flow.fanout.print_result')
+@mock.patch('compose_flow.fanout.subprocess')
+class RunTargetsTestCase(TestCase):
+    def test_runs_each_target(self, *mocks):
+        subprocess_mock = mocks[0]
+        subprocess_mock.run.return_value = mock.Mock(returncode=0, stdout=b'ok\n')
+
+        spawns.reset()
+
+        results = fanout.run_targets(['dev', 'prod'], ['swarm', 'inspect'])
+
+        self.assertEqual(['dev', 'prod'], [x.target for x in results])
+
+        commands = sorted(x[1][0] for x in subprocess_mock.run.mock_calls)
+        self.assertEqual(
+            [
+                [sys.executable, '-m', 'compose_flow', '-e', 'dev', 'swarm', 'inspect'],
+                [sys.executable, '-m', 'compose_flow', '-e', 'prod', 'swarm', 'inspect'],
+            ],
+            commands,
+        )
+
+        self.assertEqual(commands, sorted(spawns.get_spawns()))
+
+
+class PrintReportTestCase(TestCase):
+    def test_report(self, *mocks):
+        fh = io.StringIO()
+
+        fanout.print_report(
+            ['dev', 'prod'],
+            {
+                'prepare': [fanout.TargetResult('dev', 0, '', 1.0), fanout.TargetResult('prod', 0, '', 1.0)],
+                'deploy': [fanout.TargetResult('prod', 2, '', 3.0)],
+            },
+            fh=fh,
+        )
+
+        lines = fh.getvalue().splitlines()
+
+        self.assertIn('prepare', lines[0])
+        self.assertRegex(lines[2], r'dev\s+ok 1.0s\s+skipped')
+        self.assertRegex(lines[3], r'prod\s+ok 1.0s\s+failed \(2\) 3.0s')
+
+
+class WorkflowTargetsTestCase(BaseTestCase):
+    def test_single_environment(self, *mocks):
+        workflow = Workflow(argv=shlex.split('-e dev swarm inspect'))
+
+        self.assertEqual([], workflow.targets)
+
+    def test_multiple_environments(self, *mocks):
+        workflow = Workflow(argv=shlex.split('-e dev,prod swarm inspect'))
+
+        self.assertEqual(['dev', 'prod'], workflow.targets)
+
+    @mock.patch('compose_flow.commands.workflow.Workflow.app_config', new_callable=mock.PropertyMock)
+    def test_all_remotes(self, *mocks):
+        app_config_mock = mocks[0]
+        app_config_mock.return_value = {'remotes': {'dev': {}, 'prod': {}}}
+
+        workflow = Workflow(argv=shlex.split('--all-remotes swarm inspect'))
+
+        self.assertEqual(['dev', 'prod'], workflow.targets)
+
+    @mock.patch('compose_flow.commands.workflow.get_config')
+    def test_all_clusters(self, *mocks):
+        get_config_mock = mocks[0]
+        get_config_mock.return_value = {
+            'rancher': {'clusters': {'dev': 'dev-cluster', 'prod': 'prod-cluster'}},
+            'kubecontexts': {'prod': 'prod-context', 'stage': 'stage-context'},
+        }
+
+        workflow = Workflow(argv=shlex.split('--all-clusters deploy helm'))
+
+        self.assertEqual(['dev', 'prod', 'stage'], workflow.targets)
+
+    def test_not_multi_target_okay(self, *mocks):
+        """
+        Ensure commands that modify state cannot be fanned out
+        """
+        workflow = Workflow(argv=shlex.split('-e dev,prod env edit'))
+
+        self.assertRegex(workflow.run(), r'cannot be run against multiple targets')
+
+    @mock.patch('compose_flow.commands.subcommands.base.fanout.run_targets')
+    def test_failed_targets(self, *mocks):
+        run_targets_mock = mocks[0]
+        run_targets_mock.return_value = [
+            fanout.TargetResult('dev', 0, '', 0.1),
+            fanout.TargetResult('prod', 1, '', 0.1),
+        ]
+
+        workflow = Workflow(argv=shlex.split('-e dev,prod swarm inspect'))
+
+        self.assertRegex(workflow.run(), r'failed targets: prod')
+
+        run_targets_mock.assert_called_with(
+            ['dev', 'prod'], ['swarm', 'inspect'], cwd=workflow.working_dir, jobs=None
+        )
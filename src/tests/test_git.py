@@ -0,0 +1,159 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+from unittest import TestCase, mock, skipUnless
+
+from compose_flow import git, shell
+
+
+@skipUnless(shutil.which('git'), 'git is not installed')
+class GitRepoTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.work_tree = os.path.join(self.tempdir.name, 'repo')
+
+        self.cache_patcher = mock.patch(
+            'compose_flow.settings.APP_CACHE_ROOT', new=os.path.join(self.tempdir.name, 'cache')
+        )
+        self.cache_patcher.start()
+
+        self.env_patcher = mock.patch.dict(os.environ, {'GIT_BRANCH': 'feature/foo'})
+        self.env_patcher.start()
+
+        os.makedirs(os.path.join(self.work_tree, 'src'))
+
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'test@example.com')
+        self.git('config', 'user.name', 'test')
+
+        self.write('README.md', 'readme\n')
+        self.write('src/app.py', 'print("hello")\n')
+        self.commit('initial')
+
+        self.repo = git.find_repo(os.path.join(self.work_tree, 'src'))
+
+        # count the git commands run by the repo
+        self.execute_patcher = mock.patch('compose_flow.git.shell.execute', side_effect=shell.execute)
+        self.execute_mock = self.execute_patcher.start()
+
+    def tearDown(self):
+        self.execute_patcher.stop()
+        self.env_patcher.stop()
+        self.cache_patcher.stop()
+
+        self.tempdir.cleanup()
+
+        super().tearDown()
+
+    def commit(self, message: str) -> None:
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', message)
+
+    def git(self, *args) -> str:
+        proc = subprocess.run(
+            ('git',) + args, cwd=self.work_tree, stdout=subprocess.PIPE, check=True
+        )
+
+        return proc.stdout.decode('utf8').strip()
+
+    def write(self, path: str, content: str) -> None:
+        with open(os.path.join(self.work_tree, path), 'w') as fh:
+            fh.write(content)
+
+    def test_exact_tag(self, *mocks):
+        """
+        Ensure a tagged commit's version is found without running git
+        """
+        self.git('tag', '-a', '-m', 'release', '1.0.0')
+
+        self.assertEqual('1.0.0', self.repo.tag_version())
+        self.execute_mock.assert_not_called()
+
+    def test_exact_packed_tag(self, *mocks):
+        self.git('tag', '1.0.0')
+        self.git('pack-refs', '--all')
+
+        self.assertEqual('1.0.0', self.repo.tag_version())
+        self.execute_mock.assert_not_called()
+
+    def test_untagged_commit(self, *mocks):
+        """
+        Ensure the version matches `tag-version` and is cached
+        """
+        self.git('tag', '-a', '-m', 'release', '1.0.0')
+
+        self.write('src/app.py', 'print("goodbye")\n')
+        self.commit('second')
+
+        expected = f'{self.git("describe", "--tags", "--always")}-feature--foo'
+
+        self.assertEqual(expected, self.repo.tag_version())
+        self.assertEqual(expected, self.repo.tag_version())
+
+        self.assertEqual(1, self.execute_mock.call_count)
+
+        # a new tag invalidates the cached version
+        self.git('tag', '1.0.1')
+
+        self.assertEqual('1.0.1', self.repo.tag_version())
+
+    def test_is_clean(self, *mocks):
+        self.assertEqual(True, self.repo.is_clean()[0])
+        self.assertEqual(True, self.repo.is_clean()[0])
+
+        # the second check is served from the cache
+        self.assertEqual(1, self.execute_mock.call_count)
+
+        self.write('src/new.py', '')
+        self.assertEqual(False, self.repo.is_clean()[0])
+
+        os.remove(os.path.join(self.work_tree, 'src/new.py'))
+        self.assertEqual(True, self.repo.is_clean()[0])
+
+        self.write('README.md', 'changed\n')
+        self.assertEqual(False, self.repo.is_clean()[0])
+
+    def test_is_clean_untracked_directory(self, *mocks):
+        """
+        Ensure a file added to a directory without tracked files invalidates the cache
+        """
+        os.makedirs(os.path.join(self.work_tree, 'emptydir'))
+        self.assertEqual(True, self.repo.is_clean()[0])
+
+        self.write('emptydir/newfile', '')
+        self.assertEqual((False, ['?? emptydir/newfile']), self.repo.is_clean())
+
+    def test_is_clean_ignored_directory(self, *mocks):
+        """
+        Ensure ignored directories are not walked, so changes in them do not invalidate the cache
+        """
+        self.write('.gitignore', 'node_modules/\n')
+        self.commit('ignore')
+
+        os.makedirs(os.path.join(self.work_tree, 'node_modules', 'foo'))
+
+        self.assertEqual((True, []), self.repo.is_clean())
+
+        self.write('node_modules/foo/index.js', '')
+
+        self.assertEqual((True, []), self.repo.is_clean())
+        self.assertEqual(1, self.execute_mock.call_count)
+
+    def test_index_versions(self, *mocks):
+        """
+        Ensure tracked paths are read from every supported index version
+        """
+        os.makedirs(os.path.join(self.work_tree, 'src', 'deeply', 'nested'))
+        self.write('src/deeply/nested/module.py', '')
+        self.commit('nested')
+
+        expected = self.git('ls-files').splitlines()
+
+        for version in ('2', '3', '4'):
+            self.git('update-index', '--index-version', version)
+
+            self.assertEqual(expected, self.repo.get_index_paths(), f'index version={version}')
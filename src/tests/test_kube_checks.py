@@ -2,7 +2,7 @@
 from nose.tools import raises
 from unittest import TestCase
 
-from compose_flow.kube.checks import BaseChecker, ManifestChecker, AnswersChecker
+from compose_flow.kube.checks import BaseChecker, ManifestChecker, AnswersChecker, rule
 
 from tests.utils import get_content
 
@@ -25,6 +25,21 @@ class TestCheckerAlwaysError(BaseChecker):
         return 'Fail!'
 
 
+class TestCheckerRules(BaseChecker):
+    def __init__(self):
+        self.seen = []
+
+    @rule('ConfigMap')
+    def check_config_map(self, doc: dict) -> str:
+        self.seen.append(('config_map', doc['metadata']['name']))
+
+        return 'bad config map'
+
+    @rule()
+    def check_any(self, doc: dict) -> None:
+        self.seen.append(('any', doc['metadata']['name']))
+
+
 class TestBaseChecker(TestCase):
     @raises(AttributeError)
     def test_no_checks(self):
@@ -48,6 +63,18 @@ class TestBaseChecker(TestCase):
         assert 'Fail!' in errors
 
 
+    def test_rules_dispatched_by_kind(self):
+        """Ensure rules only see documents of the kinds they are registered for"""
+        checker = TestCheckerRules()
+        errors = checker.check(
+            'kind: ConfigMap\nmetadata: {name: a}\n---\n'
+            'kind: Secret\nmetadata: {name: b}\n---\n'
+        )
+
+        assert errors == ['ConfigMap/a: bad config map']
+        assert sorted(checker.seen) == [('any', 'a'), ('any', 'b'), ('config_map', 'a')]
+
+
 class TestManifestChecker(TestCase):
     def setUp(self):
         self.checker = ManifestChecker()
@@ -99,6 +126,19 @@ class TestManifestChecker(TestCase):
 
         assert len(errors) > 0
 
+    def test_all_violations_reported(self):
+        """
+        Ensure every violation is reported rather than only the first one
+        """
+        content = '\n---\n'.join(
+            [get_content('manifests/no-limits-deployment.yaml'), get_content('manifests/invalid-zalando-ingress.yaml')]
+        )
+
+        errors = self.checker.check(content)
+
+        assert any(x.startswith('Deployment/') for x in errors)
+        assert any(x.startswith('Ingress/') for x in errors)
+
     def test_no_resources_job(self):
         """
         Ensure ManifestChecker returns an error for a Job with no resources
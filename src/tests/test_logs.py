@@ -0,0 +1,119 @@
+import io
+import os
+import stat
+import subprocess
+import tempfile
+
+from unittest import TestCase, mock
+
+from compose_flow import logs, spawns, tracing
+
+
+class GetDockerLogsCommandTestCase(TestCase):
+    def test_grep_filters_remotely(self, *mocks):
+        command = logs.get_docker_logs_command(
+            'stack_app.1.abc', follow=True, tail='10', grep='ERROR|WARN'
+        )
+
+        self.assertIn("docker logs --timestamps --follow --tail 10 stack_app.1.abc 2>&1;", command)
+        self.assertIn("grep --line-buffered -E 'ERROR|WARN' >&3", command)
+
+    def test_grep_exit_status(self, *mocks):
+        """
+        Ensure only grep not matching anything is ignored
+        """
+        def run(command, pattern):
+            remote_command = logs.GREP_PIPELINE.format(
+                command=command, grep=f'grep -E {pattern}'
+            )
+
+            return subprocess.run(
+                ['sh', '-c', remote_command], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+
+        proc = run('printf "one\\ntwo\\n"', 'two')
+        self.assertEqual((0, b'two\n'), (proc.returncode, proc.stdout))
+
+        self.assertEqual(0, run('printf "one\\n"', 'two').returncode)
+        self.assertEqual(3, run('sh -c "exit 3"', 'two').returncode)
+        self.assertEqual(2, run('printf "one\\n"', "'('").returncode)
+
+    def test_sudo(self, *mocks):
+        command = logs.get_docker_logs_command('stack_app.1.abc', sudo=True)
+
+        self.assertEqual('sudo docker logs --timestamps stack_app.1.abc 2>&1', command)
+
+
+class GetSshCommandTestCase(TestCase):
+    def test_private_control_dir(self, *mocks):
+        """
+        Ensure the multiplex sockets are kept in a directory only the user can access
+        """
+        with tempfile.TemporaryDirectory() as tempdir:
+            control_dir = os.path.join(tempdir, 'ssh')
+
+            with mock.patch('compose_flow.logs.SSH_CONTROL_DIR', new=control_dir):
+                command = logs.get_ssh_command('user@node1', 'true')
+
+            self.assertIn(f'ControlPath={control_dir}/%C', command)
+            self.assertEqual(0o700, stat.S_IMODE(os.stat(control_dir).st_mode))
+
+
+class LogMergerTestCase(TestCase):
+    def test_merges_by_timestamp(self, *mocks):
+        fh = io.StringIO()
+
+        merger = logs.LogMerger(fh=fh)
+        merger.add_stream('app.1', ['printf', '2018-01-01T00:00:01Z one\n2018-01-01T00:00:03Z three\n'])
+        merger.add_stream('app.2', ['printf', '2018-01-01T00:00:02Z two\n'])
+
+        self.assertEqual(0, merger.run())
+
+        self.assertEqual('app.1 | one\napp.2 | two\napp.1 | three\n', fh.getvalue())
+
+    def test_reorder_buffer_is_bounded(self, *mocks):
+        """
+        Ensure the oldest line is printed as soon as the buffer is full
+        """
+        fh = io.StringIO()
+
+        merger = logs.LogMerger(buffer_size=2, fh=fh)
+        merger.push('3', 'app.1', 'three')
+        merger.push('1', 'app.2', 'one')
+
+        self.assertEqual('', fh.getvalue())
+
+        merger.push('2', 'app.1', 'two')
+
+        self.assertEqual('app.2 | one\n', fh.getvalue())
+
+    def test_failed_streams(self, *mocks):
+        merger = logs.LogMerger(fh=io.StringIO())
+        merger.add_stream('app.1', ['false'])
+
+        self.assertEqual(1, merger.run())
+
+    def test_streams_recorded(self, *mocks):
+        """
+        Ensure the stream commands are counted as spawns and traced
+        """
+        spawns.reset()
+        tracing.enable()
+
+        try:
+            merger = logs.LogMerger(fh=io.StringIO())
+            merger.add_stream('app.1', ['true'])
+            merger.add_stream('app.2', ['false'])
+
+            merger.run()
+        finally:
+            tracing.disable()
+
+        self.assertEqual([['true'], ['false']], spawns.get_spawns())
+
+        spans = sorted(tracing.get_spans(), key=lambda x: x.name)
+        self.assertEqual(['false', 'true'], [x.name for x in spans])
+        self.assertEqual([1, 0], [x.args['exit_code'] for x in spans])
+
+    def test_lines_without_timestamp(self, *mocks):
+        self.assertEqual(('', 'Error: No such container'), logs.LogMerger.parse_line('Error: No such container'))
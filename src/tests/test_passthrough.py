@@ -1,3 +1,8 @@
+import os
+import shlex
+
+from compose_flow import settings
+from compose_flow.commands import Workflow
 from compose_flow.commands.subcommands.passthrough_base import PassthroughBaseSubcommand
 from tests import BaseTestCase, mock
 
@@ -15,6 +20,68 @@ class BaseSubcommandTestCase(BaseTestCase):
         command = TestPassthroughSubcommand(workflow)
         proc = command.execute('docker ps')
 
-        # make sure that sh was executed with the workflow environment
-        sh_mock = self.sh_mock
-        sh_mock.docker.assert_called_with('ps', _env=workflow.environment.data.copy())
+        # make sure that the command was run with the workflow environment
+        self.run_mock.assert_called_with(['docker', 'ps'], workflow.environment.data.copy())
+
+    @mock.patch('compose_flow.commands.subcommands.passthrough_base.find_executable')
+    @mock.patch('compose_flow.commands.subcommands.passthrough_base.os.execvpe')
+    def test_exec(self, *mocks):
+        """
+        Ensure the command replaces the process with the exact argv when exec is enabled
+        """
+        execvpe_mock = mocks[0]
+        find_executable_mock = mocks[1]
+        find_executable_mock.return_value = '/usr/bin/docker-compose'
+
+        workflow = mock.Mock()
+        workflow.args.dry_run = False
+        workflow.args.exec = True
+        workflow.environment.data = {'FOO': 'bar baz'}
+
+        command = TestPassthroughSubcommand(workflow)
+        workflow.subcommand = command
+
+        command.handle(extra_args=['logs', '-f', "it's quoted"])
+
+        argv = ['/usr/bin/docker-compose', 'logs', '-f', "it's quoted"]
+        execvpe_mock.assert_called_with(argv[0], argv, mock.ANY)
+        self.assertEqual('bar baz', execvpe_mock.call_args[0][2]['FOO'])
+
+        self.run_mock.assert_not_called()
+
+    @mock.patch('compose_flow.commands.subcommands.passthrough_base.find_executable')
+    @mock.patch('compose_flow.commands.subcommands.passthrough_base.os.execvpe')
+    def test_exec_not_top_level(self, *mocks):
+        """
+        Ensure passthroughs run on behalf of another subcommand are not exec'ed
+        """
+        execvpe_mock = mocks[0]
+        find_executable_mock = mocks[1]
+        find_executable_mock.return_value = '/usr/bin/docker-compose'
+
+        workflow = mock.Mock()
+        workflow.args.dry_run = False
+        workflow.args.exec = True
+        workflow.environment.data = {}
+
+        command = TestPassthroughSubcommand(workflow)
+
+        command.handle(extra_args=['build'])
+
+        execvpe_mock.assert_not_called()
+
+    @mock.patch('compose_flow.kube.mixins.KubeMixIn.config', new_callable=mock.PropertyMock)
+    def test_rancher_exec_uses_user_config(self, *mocks):
+        """
+        Ensure exec'ing rancher does not leave a private config copy behind
+        """
+        config_mock = mocks[0]
+        config_mock.return_value = {'rancher': {'project': 'web'}}
+
+        workflow = Workflow(argv=shlex.split('-e dev rancher --exec kubectl get pods'))
+
+        with mock.patch('compose_flow.settings.APP_CONFIG_ROOT', new=self.cache_root.name):
+            config_dir = workflow.subcommand.rancher_config_dir
+
+        self.assertEqual(settings.RANCHER_CONFIG_DIR, config_dir)
+        self.assertFalse(os.path.exists(os.path.join(self.cache_root.name, 'rancher')))
@@ -1,8 +1,17 @@
+import os
+import shlex
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase, mock
 
+from compose_flow import errors
+from compose_flow.commands import Workflow
 from compose_flow.commands.subcommands.profile import Profile
-from compose_flow.utils import yaml_load
+from compose_flow.compose import load_overlay
+from compose_flow.utils import yaml_dump, yaml_load
 
+from tests import BaseTestCase
 from tests.utils import get_content
 
 
@@ -136,6 +145,124 @@ class ProfileTestCase(TestCase):
             ],
         )
 
+    def test_expand_shares_unchanged_data(self, *mocks):
+        """
+        Ensures replicas share the data the increments do not change and the base service is untouched
+        """
+        base_service = {
+            'image': 'worker',
+            'environment': ['PORT=8000'],
+            'labels': {'worker.id': '0'},
+            'volumes': ['data:/data', {'type': 'volume', 'source': 'cache', 'target': '/cache'}],
+            'hostname': 'worker',
+            'deploy': {
+                'replicas': 2,
+                'labels': ['worker.id=10'],
+                'resources': {'limits': {'memory': '1G'}},
+            },
+        }
+        data = {
+            'services': {'worker': base_service},
+            'volumes': {'data': {'driver': 'local'}, 'cache': None},
+            'compose_flow': {
+                'expand': {
+                    'worker': {
+                        'increment': {
+                            'env': ['PORT'],
+                            'hostname': True,
+                            'labels': ['worker.id'],
+                            'volumes': ['data', 'cache'],
+                        }
+                    }
+                }
+            },
+        }
+
+        profile = Profile(self.workflow)
+        services = profile._check_cf_config(data)['services']
+
+        self.assertEqual(['worker1', 'worker2'], list(services))
+
+        worker2 = services['worker2']
+        self.assertEqual(['PORT=8001'], worker2['environment'])
+        self.assertEqual('worker2', worker2['hostname'])
+        self.assertEqual({'worker.id': '1'}, worker2['labels'])
+        self.assertEqual(['worker.id=11'], worker2['deploy']['labels'])
+        self.assertEqual(
+            ['data2:/data', {'type': 'volume', 'source': 'cache2', 'target': '/cache'}], worker2['volumes']
+        )
+
+        self.assertEqual(
+            ['cache1', 'cache2', 'data1', 'data2'], sorted(data['volumes'])
+        )
+
+        # only the incremented values were copied
+        self.assertIs(services['worker1']['deploy']['resources'], worker2['deploy']['resources'])
+        self.assertEqual(2, base_service['deploy']['replicas'])
+        self.assertEqual(['PORT=8000'], base_service['environment'])
+
+    def test_expand_unknown_increment(self, *mocks):
+        data = {
+            'services': {'foo': {'deploy': {'replicas': 2}}},
+            'compose_flow': {'expand': {'foo': {'increment': {'bar': True}}}},
+        }
+
+        profile = Profile(self.workflow)
+
+        with self.assertRaises(errors.ProfileError):
+            profile._check_cf_config(data)
+
+    @mock.patch('compose_flow.commands.subcommands.profile.merge_profile')
+    def test_expand_compiled_without_aliases(self, *mocks):
+        """
+        Ensures the data shared by expanded services is written out in full
+        """
+        merge_profile_mock = mocks[0]
+        merge_profile_mock.return_value = yaml_dump({
+            'services': {
+                'foo': {
+                    'image': 'foo',
+                    'environment': ['PORT=8000'],
+                    'deploy': {'replicas': 2, 'resources': {'limits': {'memory': '1G'}}},
+                }
+            },
+            'compose_flow': {'expand': {'foo': {'increment': {'env': ['PORT']}}}},
+        })
+
+        self.workflow.args.config_name = 'stack'
+
+        content = Profile(self.workflow)._compile({})
+
+        self.assertNotIn('&id', content)
+
+        services = yaml_load(content)['services']
+        self.assertEqual(services['foo1']['deploy'], services['foo2']['deploy'])
+        self.assertEqual({'memory': '1G'}, services['foo2']['deploy']['resources']['reservations'])
+
+    @mock.patch('compose_flow.commands.subcommands.profile.get_config', return_value=None)
+    @mock.patch('compose_flow.commands.subcommands.profile.merge_profile')
+    def test_compile_json(self, *mocks):
+        """
+        Ensures the profile is compiled to JSON and variables are rendered as valid JSON strings
+        """
+        merge_profile_mock = mocks[0]
+        merge_profile_mock.return_value = yaml_dump({
+            'services': {'app': {'image': 'app:${VERSION}', 'environment': ['GREETING=${GREETING}']}},
+        })
+
+        self.workflow.args.compose_format = 'json'
+        self.workflow.args.config_name = 'stack'
+        self.workflow.environment.data = {'GREETING': 'say "hi"\n', 'VERSION': '1.0'}
+
+        profile = Profile(self.workflow)
+
+        self.assertEqual('compose-flow-dev.json', profile.get_filename('dev', profile.compose_format))
+
+        data = profile.data
+
+        self.assertEqual('app:1.0', data['services']['app']['image'])
+        self.assertIn('GREETING=say "hi"\n', data['services']['app']['environment'])
+
     def test_profile_no_compose_dir(self, *mocks):
         """
         when there is no compose directory, do not attempt to render a profile
@@ -233,3 +360,93 @@ class ProfileTestCase(TestCase):
         resources = data['services']['app']['deploy']['resources']
 
         self.assertEqual(resources['limits']['memory'], resources['reservations']['memory'])
+
+
+@mock.patch('compose_flow.commands.subcommands.profile.ProcessPoolExecutor', new=ThreadPoolExecutor)
+@mock.patch('compose_flow.commands.subcommands.profile.get_config')
+class CompileAllTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.cwd = os.getcwd()
+
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tempdir.name)
+
+        for filename, content in (
+            ('docker-compose.yml', {'services': {'app': {'image': 'app', 'environment': ['FOO=1']}}}),
+            ('docker-compose.prod.yml', {'services': {'app': {'deploy': {'replicas': 2}}}}),
+            ('docker-compose.worker.yml', {'services': {'worker': {'image': 'worker'}}}),
+        ):
+            with open(filename, 'w') as fh:
+                fh.write(yaml_dump(content))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+
+        super().tearDown()
+
+    @mock.patch('compose_flow.commands.subcommands.profile.load_overlay', wraps=load_overlay)
+    def test_compile_all(self, *mocks):
+        """
+        Ensures every profile is written and the shared overlays are parsed once
+        """
+        load_overlay_mock = mocks[0]
+
+        get_config_mock = mocks[1]
+        get_config_mock.return_value = {
+            'profiles': {
+                'dev': ['docker-compose.yml'],
+                'prod': ['docker-compose.yml', 'prod', 'worker'],
+                'stage': ['docker-compose.yml', 'worker'],
+            }
+        }
+
+        # a rendered profile written by another command
+        with open('compose-flow-dev.yml', 'w') as fh:
+            fh.write('rendered')
+
+        workflow = Workflow(argv=shlex.split('-n app profile compile --all-profiles'))
+
+        self.assertEqual(None, workflow.run())
+
+        with open('compose-flow-dev.yml', 'r') as fh:
+            self.assertEqual('rendered', fh.read())
+
+        self.assertEqual(
+            [
+                'compose-flow-dev.unrendered.yml',
+                'compose-flow-prod.unrendered.yml',
+                'compose-flow-stage.unrendered.yml',
+            ],
+            sorted(x for x in os.listdir('.') if x.endswith('.unrendered.yml')),
+        )
+        self.assertEqual(3, len(load_overlay_mock.mock_calls))
+
+        with open('compose-flow-prod.unrendered.yml', 'r') as fh:
+            data = yaml_load(fh)
+
+        self.assertEqual(['app', 'worker'], sorted(data['services']))
+        self.assertEqual(2, data['services']['app']['deploy']['replicas'])
+        self.assertIn('DOCKER_STACK=prod-app', data['services']['app']['environment'])
+
+        # variables are not rendered, so no environment is needed
+        self.assertEqual([], self.run_mock.mock_calls)
+
+    def test_failed_profile(self, *mocks):
+        """
+        Ensures the other profiles are compiled when one fails
+        """
+        with open('docker-compose.broken.yml', 'w') as fh:
+            fh.write(yaml_dump({'services': {'app': {'environment': ['CF_COPY_ENV_FROM=missing']}}}))
+
+        get_config_mock = mocks[0]
+        get_config_mock.return_value = {
+            'profiles': {'dev': ['docker-compose.yml'], 'broken': ['docker-compose.yml', 'broken']}
+        }
+
+        workflow = Workflow(argv=shlex.split('profile compile --all-profiles'))
+
+        self.assertRegex(workflow.run(), r'failed to compile profiles: broken')
+        self.assertEqual(True, os.path.exists('compose-flow-dev.unrendered.yml'))
@@ -1,8 +1,9 @@
+import io
 import shlex
 
 from unittest import TestCase, mock
 
-from compose_flow import utils
+from compose_flow import errors, shell, utils
 from compose_flow.commands import Workflow
 
 from tests import BaseTestCase
@@ -24,6 +25,7 @@ class PublishTestCase(BaseTestCase):
         flow = Workflow(argv=command)
 
         flow.subcommand.build = mock.Mock()
+        flow.subcommand.get_built_docker_images = mock.Mock(return_value=[])
         flow.subcommand.push = mock.Mock()
 
         flow.run()
@@ -62,6 +64,7 @@ class PublishTestCase(BaseTestCase):
         Ensures that version in env is updated when the publish command is run
         """
         settings_mock = mocks[2]
+        settings_mock.COMPOSE_FORMAT = 'yml'
         settings_mock.DOCKER_IMAGE_PREFIX = 'test.registry'
         settings_mock.LOGGING = {
             'version': 1,
@@ -92,3 +95,107 @@ class PublishTestCase(BaseTestCase):
 
         self.assertEqual(utils_mock.get_tag_version.return_value, env.data['VERSION'])
         self.assertEqual(f'test.registry/testdirname:{new_version}', env.data['DOCKER_IMAGE'])
+
+    @mock.patch('compose_flow.commands.subcommands.publish.time')
+    @mock.patch('compose_flow.commands.workflow.Workflow.environment', new_callable=mock.PropertyMock)
+    def test_push_concurrent_with_retries(self, *mocks):
+        """
+        Ensure failed pushes are retried and the image that failed is reported
+        """
+        def run(argv, env, **kwargs):
+            docker_image = argv[2]
+
+            if docker_image == 'good:1':
+                return mock.Mock(stdout=b'good:1 pushed\n')
+
+            raise shell.ErrorReturnCode_1(f'docker push {docker_image}', b'denied\n', b'')
+
+        self.run_mock.side_effect = run
+
+        flow = Workflow(argv=shlex.split('publish --push-retries 2'))
+
+        publish = flow.subcommand
+        publish.get_built_docker_images = mock.Mock(return_value=['good:1', 'bad:1'])
+
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            self.assertRaisesRegex(errors.PushError, r'unable to push bad:1$', publish.push)
+
+        self.assertIn('good:1 pushed', stdout.getvalue())
+
+        # the bad image is tried once and then retried twice
+        self.assertEqual(4, self.run_mock.call_count)
+        self.assertEqual(2, mocks[1].sleep.call_count)
+
+    @mock.patch('compose_flow.commands.subcommands.publish.time')
+    @mock.patch('compose_flow.commands.workflow.Workflow.environment', new_callable=mock.PropertyMock)
+    def test_push_single_image_with_retries(self, *mocks):
+        """
+        Ensure a single image is pushed in the foreground and retried
+        """
+        self.run_mock.side_effect = shell.ErrorReturnCode_1('docker push bad:1', b'', b'')
+
+        flow = Workflow(argv=shlex.split('publish --push-retries 2'))
+
+        publish = flow.subcommand
+        publish.get_built_docker_images = mock.Mock(return_value=['bad:1'])
+
+        self.assertRaisesRegex(errors.PushError, r'unable to push bad:1$', publish.push)
+
+        self.assertEqual(3, self.run_mock.call_count)
+        self.assertEqual(True, self.run_mock.call_args[1]['_fg'])
+        self.assertEqual(2, mocks[1].sleep.call_count)
+
+    @mock.patch('compose_flow.commands.subcommands.publish.registry')
+    def test_skips_published_images(self, *mocks):
+        """
+        Ensure only the services whose images are not in the registry are built and pushed
+        """
+        registry_mock = mocks[0]
+        registry_mock.get_existing_images.return_value = {'web:1'}
+
+        flow = Workflow(argv=shlex.split('publish'))
+
+        publish = flow.subcommand
+        publish.build = mock.Mock()
+        publish.push = mock.Mock()
+        publish.get_built_services = mock.Mock(return_value={'web': 'web:1', 'worker': 'worker:1'})
+
+        publish.handle()
+
+        publish.build.assert_called_with(['worker'])
+        publish.push.assert_called_with(['worker:1'])
+
+    @mock.patch('compose_flow.commands.subcommands.publish.registry')
+    def test_force_skips_registry_check(self, *mocks):
+        registry_mock = mocks[0]
+
+        flow = Workflow(argv=shlex.split('publish --force'))
+
+        publish = flow.subcommand
+        publish.build = mock.Mock()
+        publish.push = mock.Mock()
+
+        publish.handle()
+
+        registry_mock.get_existing_images.assert_not_called()
+        publish.build.assert_called_with()
+
+    @mock.patch('compose_flow.commands.subcommands.publish.registry')
+    def test_user_tag_version_always_published(self, *mocks):
+        """
+        Ensure a version that may name different code is not skipped because it's in the registry
+        """
+        registry_mock = mocks[0]
+        registry_mock.get_existing_images.return_value = {'web:dev'}
+
+        flow = Workflow(argv=shlex.split('--tag-version dev publish'))
+
+        publish = flow.subcommand
+        publish.build = mock.Mock()
+        publish.push = mock.Mock()
+
+        publish.handle()
+
+        registry_mock.get_existing_images.assert_not_called()
+        publish.build.assert_called_with()
+        publish.push.assert_called_with()
@@ -0,0 +1,124 @@
+import base64
+import json
+import os
+import tempfile
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+
+from compose_flow import errors
+from compose_flow.kube import rancher
+
+from tests import BaseTestCase
+
+
+class RancherHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for the Rancher v3 API
+    """
+
+    collections = {
+        'clusters': [{'id': 'c-dev', 'name': 'dev'}, {'id': 'c-prod', 'name': 'prod'}],
+        'projects': [
+            {'id': 'c-dev:p-web', 'name': 'web', 'clusterId': 'c-dev'},
+            {'id': 'c-prod:p-web', 'name': 'web', 'clusterId': 'c-prod'},
+        ],
+    }
+
+    token = 'token-abc:secret'
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+
+        expected = f'Basic {base64.b64encode(self.token.encode("utf8")).decode("utf8")}'
+        if self.headers.get('Authorization') != expected:
+            self.send_response(401)
+            self.end_headers()
+
+            return
+
+        name = self.path.split('?', 1)[0][len('/v3/'):]
+
+        body = json.dumps({'data': self.collections.get(name, [])}).encode('utf8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class GetListingTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.server = HTTPServer(('localhost', 0), RancherHandler)
+        self.server.requests = []
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.rancher_server = {
+            'url': f'http://localhost:{self.server.server_port}',
+            'tokenKey': RancherHandler.token,
+        }
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        super().tearDown()
+
+    def test_listing(self, *mocks):
+        listing = rancher.get_listing(self.rancher_server)
+
+        self.assertEqual({'dev': 'c-dev', 'prod': 'c-prod'}, listing['clusters'])
+        self.assertEqual(['c-dev:p-web', 'c-prod:p-web'], [x['id'] for x in listing['projects']])
+
+    def test_cached(self, *mocks):
+        """
+        Ensure the listing is fetched once until it expires or is refreshed
+        """
+        rancher.get_listing(self.rancher_server, ttl=60)
+        rancher.get_listing(self.rancher_server, ttl=60)
+
+        self.assertEqual(2, len(self.server.requests))
+
+        rancher.get_listing(self.rancher_server, ttl=60, refresh=True)
+
+        self.assertEqual(4, len(self.server.requests))
+
+    def test_unauthorized(self, *mocks):
+        self.rancher_server['tokenKey'] = 'token-abc:wrong'
+
+        with self.assertRaises(errors.RancherError):
+            rancher.get_listing(self.rancher_server)
+
+
+class ConfigTestCase(TestCase):
+    def test_api_url(self, *mocks):
+        for url in ('https://rancher.example.com/', 'https://rancher.example.com/v3'):
+            self.assertEqual('https://rancher.example.com/v3', rancher.get_api_url({'url': url}))
+
+    def test_set_project(self, *mocks):
+        """
+        Ensure only the current server's project is changed
+        """
+        config = {
+            'Servers': {'rancherDefault': {'url': 'https://rancher', 'project': 'c-dev:p-web'}},
+            'CurrentServer': 'rancherDefault',
+        }
+
+        with tempfile.TemporaryDirectory() as config_dir:
+            with open(os.path.join(config_dir, 'cli2.json'), 'w') as fh:
+                json.dump(config, fh)
+
+            rancher.set_project(config_dir, 'c-prod:p-web')
+
+            config['Servers']['rancherDefault']['project'] = 'c-prod:p-web'
+            self.assertEqual(config, rancher.load_config(config_dir))
+            self.assertEqual(['cli2.json'], os.listdir(config_dir))
@@ -0,0 +1,123 @@
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+
+from compose_flow import registry
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for a registry with token authentication
+    """
+
+    manifests = ('app/web:1.0.0', 'app/worker:1.0.0')
+
+    token = 'secret-token'
+
+    def do_GET(self):
+        if self.path.startswith('/token?'):
+            self.server.token_requests.append(self.path)
+
+            body = json.dumps({'token': self.token}).encode('utf8')
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def do_HEAD(self):
+        if self.headers.get('Authorization') != f'Bearer {self.token}':
+            realm = f'http://localhost:{self.server.server_port}/token'
+
+            self.send_response(401)
+            self.send_header(
+                'WWW-Authenticate',
+                f'Bearer realm="{realm}",service="registry",scope="repository:app:pull"',
+            )
+            self.end_headers()
+
+            return
+
+        name, _, reference = self.path[len('/v2/'):].partition('/manifests/')
+        if f'{name}:{reference}' in self.manifests:
+            self.send_response(200)
+            self.send_header('Docker-Content-Digest', 'sha256:abc')
+        else:
+            self.send_response(404)
+
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageExistsTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.server = HTTPServer(('localhost', 0), RegistryHandler)
+        self.server.token_requests = []
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.registry = f'localhost:{self.server.server_port}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        super().tearDown()
+
+    def test_existing_image(self, *mocks):
+        self.assertEqual(True, registry.image_exists(f'{self.registry}/app/web:1.0.0'))
+
+        self.assertEqual(1, len(self.server.token_requests))
+        self.assertIn('scope=repository%3Aapp%3Apull', self.server.token_requests[0])
+
+    def test_missing_image(self, *mocks):
+        self.assertEqual(False, registry.image_exists(f'{self.registry}/app/web:2.0.0'))
+
+    def test_get_existing_images(self, *mocks):
+        images = [
+            f'{self.registry}/app/web:1.0.0',
+            f'{self.registry}/app/web:2.0.0',
+            f'{self.registry}/app/worker:1.0.0',
+        ]
+
+        self.assertEqual(
+            {images[0], images[2]}, registry.get_existing_images(images)
+        )
+
+    def test_unreachable_registry_is_missing(self, *mocks):
+        """
+        Ensure an image that cannot be checked is considered missing
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+        self.assertEqual(set(), registry.get_existing_images([f'{self.registry}/app/web:1.0.0']))
+
+
+class ParseImageTestCase(TestCase):
+    def test_docker_hub(self, *mocks):
+        self.assertEqual(
+            ('registry-1.docker.io', 'library/redis', 'latest'), registry.parse_image('redis')
+        )
+
+    def test_private_registry(self, *mocks):
+        self.assertEqual(
+            ('registry.example.com:5000', 'app/web', '1.0.0'),
+            registry.parse_image('registry.example.com:5000/app/web:1.0.0'),
+        )
+
+    def test_digest(self, *mocks):
+        self.assertEqual(
+            ('localhost', 'app', 'sha256:abc'), registry.parse_image('localhost/app@sha256:abc')
+        )
@@ -0,0 +1,133 @@
+import io
+
+from unittest import TestCase, mock
+
+from compose_flow import rollout
+from compose_flow.errors import RolloutError
+
+
+def get_service(name: str, replicas: str) -> dict:
+    return {'ID': f'{name}-id', 'Name': name, 'Replicas': replicas}
+
+
+def get_service_config(
+    state: str = None, started_at: str = '2018-01-01T00:00:00Z', image: str = 'app:1'
+) -> dict:
+    service_config = {'Spec': {'TaskTemplate': {'ContainerSpec': {'Image': image}}}}
+    if state:
+        service_config['UpdateStatus'] = {'State': state, 'StartedAt': started_at}
+
+    return service_config
+
+
+@mock.patch('compose_flow.rollout.time')
+@mock.patch('compose_flow.rollout.docker')
+class StackWatcherTestCase(TestCase):
+    def test_waits_for_convergence(self, *mocks):
+        docker_mock = mocks[0]
+        docker_mock.get_stack_services.side_effect = [
+            [get_service('stack_app', '1/2')],
+            [get_service('stack_app', '2/2')],
+        ]
+        docker_mock.get_service_configs.side_effect = [
+            [get_service_config('updating')],
+            [get_service_config('completed')],
+        ]
+
+        time_mock = mocks[1]
+        time_mock.time.side_effect = [0, 0, 5]
+
+        fh = io.StringIO()
+        watcher = rollout.StackWatcher('stack', 60, fh=fh)
+        watcher.wait()
+
+        self.assertEqual(1, time_mock.sleep.call_count)
+        self.assertEqual(5, watcher.rollouts['stack_app']['duration'])
+        self.assertIn('stack_app: converged, replicas 2/2 in 5.0s', fh.getvalue())
+
+    def test_rollback_completed(self, *mocks):
+        docker_mock = mocks[0]
+        docker_mock.get_stack_services.return_value = [get_service('stack_app', '2/2')]
+        docker_mock.get_service_configs.return_value = [get_service_config('rollback_completed')]
+
+        time_mock = mocks[1]
+        time_mock.time.return_value = 0
+
+        watcher = rollout.StackWatcher('stack', 60, fh=io.StringIO())
+
+        self.assertRaisesRegex(RolloutError, r'rollout failed for stack_app', watcher.wait)
+
+    def test_timeout(self, *mocks):
+        docker_mock = mocks[0]
+        docker_mock.get_stack_services.return_value = [get_service('stack_app', '0/2')]
+        docker_mock.get_service_configs.return_value = [get_service_config()]
+
+        time_mock = mocks[1]
+        time_mock.time.side_effect = [0, 0, 30, 61]
+
+        watcher = rollout.StackWatcher('stack', 60, fh=io.StringIO())
+
+        self.assertRaisesRegex(RolloutError, r'timed out .* stack_app', watcher.wait)
+        self.assertEqual(2, time_mock.sleep.call_count)
+
+    def test_previous_update_ignored(self, *mocks):
+        """
+        Ensure a rollback from a previous deploy does not fail this one
+        """
+        docker_mock = mocks[0]
+        docker_mock.get_stack_services.return_value = [get_service('stack_app', '2/2')]
+        docker_mock.get_service_configs.return_value = [get_service_config('rollback_completed')]
+
+        time_mock = mocks[1]
+        time_mock.time.return_value = 0
+
+        watcher = rollout.StackWatcher('stack', 60, fh=io.StringIO())
+        watcher.snapshot()
+        watcher.wait()
+
+        self.assertEqual(rollout.CONVERGED, watcher.rollouts['stack_app']['state'])
+
+    def test_waits_for_update_to_start(self, *mocks):
+        """
+        Ensure a changed service is not converged before swarm starts updating it
+        """
+        docker_mock = mocks[0]
+        docker_mock.get_stack_services.return_value = [get_service('stack_app', '2/2')]
+        docker_mock.get_service_configs.side_effect = [
+            # the snapshot
+            [get_service_config('completed')],
+            # the deploy changed the image, but the update has not started
+            [get_service_config('completed', image='app:2')],
+            [get_service_config('updating', started_at='2018-01-02T00:00:00Z', image='app:2')],
+            [get_service_config('completed', started_at='2018-01-02T00:00:00Z', image='app:2')],
+        ]
+
+        time_mock = mocks[1]
+        time_mock.time.side_effect = [0, 0, 2, 4]
+
+        fh = io.StringIO()
+        watcher = rollout.StackWatcher('stack', 60, fh=fh)
+        watcher.snapshot()
+        watcher.wait()
+
+        self.assertEqual(2, time_mock.sleep.call_count)
+        self.assertIn('stack_app: pending, replicas 2/2', fh.getvalue())
+        self.assertEqual(4, watcher.rollouts['stack_app']['duration'])
+
+    def test_unchanged_service(self, *mocks):
+        """
+        Ensure a service the deploy did not change converges on its replica counts
+        """
+        docker_mock = mocks[0]
+        docker_mock.get_stack_services.return_value = [get_service('stack_app', '2/2')]
+        docker_mock.get_service_configs.return_value = [get_service_config('completed')]
+
+        time_mock = mocks[1]
+        time_mock.time.return_value = 0
+
+        watcher = rollout.StackWatcher('stack', 60, fh=io.StringIO())
+        watcher.snapshot()
+        watcher.wait()
+
+        self.assertEqual(rollout.CONVERGED, watcher.rollouts['stack_app']['state'])
+        time_mock.sleep.assert_not_called()
@@ -0,0 +1,59 @@
+import threading
+
+from unittest import TestCase
+
+from compose_flow import scheduler
+from compose_flow.errors import ErrorMessage
+
+
+class SchedulerTestCase(TestCase):
+    def test_dependencies_run_first(self, *mocks):
+        order = []
+        lock = threading.Lock()
+
+        def fn(name):
+            with lock:
+                order.append(name)
+
+            return True, ''
+
+        results = scheduler.run({'base': set(), 'app': {'base'}, 'worker': {'base'}, 'docs': set()}, fn)
+
+        self.assertEqual({scheduler.SUCCEEDED}, set(x.status for x in results.values()))
+        self.assertLess(order.index('base'), order.index('app'))
+        self.assertLess(order.index('base'), order.index('worker'))
+
+    def test_independent_tasks_run_concurrently(self, *mocks):
+        """
+        Ensure tasks without dependencies between them do not wait on each other
+        """
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fn(name):
+            barrier.wait()
+
+            return True, ''
+
+        results = scheduler.run({'app': set(), 'worker': set()}, fn, jobs=2)
+
+        self.assertEqual({scheduler.SUCCEEDED}, set(x.status for x in results.values()))
+
+    def test_failure_skips_dependents(self, *mocks):
+        def fn(name):
+            return name != 'base', f'{name} output'
+
+        results = scheduler.run({'base': set(), 'app': {'base'}, 'docs': set()}, fn)
+
+        self.assertEqual(scheduler.FAILED, results['base'].status)
+        self.assertEqual(scheduler.SKIPPED, results['app'].status)
+        self.assertEqual(scheduler.SUCCEEDED, results['docs'].status)
+
+    def test_cycle(self, *mocks):
+        self.assertRaises(
+            ErrorMessage, scheduler.run, {'app': {'worker'}, 'worker': {'app'}}, lambda x: (True, '')
+        )
+
+    def test_get_dependents(self, *mocks):
+        dependencies = {'base': set(), 'app': {'base'}, 'celery': {'app'}, 'docs': set()}
+
+        self.assertEqual({'base', 'app', 'celery'}, scheduler.get_dependents(dependencies, ['base']))
@@ -1,13 +1,37 @@
+import json
 import re
 import shlex
 
 from unittest import mock
 
+from compose_flow import shell
 from compose_flow.commands import Workflow
 
 from tests import BaseTestCase
 
 
+def get_task_line(state: str, node: str = 'node1') -> str:
+    task = {
+        'ID': 'abc',
+        'Name': 'stack_app.1',
+        'Node': node,
+        'DesiredState': 'Running',
+        'CurrentState': f'{state} 1 second ago',
+    }
+
+    return f'{json.dumps(task)}\n'
+
+
+def get_node_inspect(hostname: str, address: str) -> bytes:
+    node = {
+        'ID': f'{hostname}-id',
+        'Description': {'Hostname': hostname},
+        'Status': {'Addr': address},
+    }
+
+    return json.dumps([node]).encode('utf8')
+
+
 class ServiceTestCase(BaseTestCase):
     def test_runs(self, *mocks):
         """
@@ -19,17 +43,164 @@ class ServiceTestCase(BaseTestCase):
         service = workflow.subcommand
 
         service.select_container = mock.MagicMock()
-        service.select_container.return_value = (
-            'container_id service_name something test_hostname'
-        )
+        service.select_container.return_value = {
+            'ID': 'container_id',
+            'Name': 'service_name',
+            'Node': 'test_hostname',
+        }
+        service.get_node_addresses = mock.Mock(return_value={'test_hostname': '10.0.0.1'})
 
         workflow.run()
 
-        ssh_mock = self.sh_mock.ssh
-        ssh_args = ssh_mock.mock_calls[0][1]
-
-        args_s = ' '.join(ssh_args)
+        args_s = ' '.join(self.get_run_calls('ssh')[0])
 
         command_re = re.compile(r'docker exec .* service_name\.container_id /bin/bash')
 
         self.assertEqual(True, command_re.search(args_s) is not None)
+        self.assertIn('@10.0.0.1', args_s)
+
+    @mock.patch('compose_flow.commands.subcommands.service.time')
+    def test_exec_retries_with_fresh_listing(self, *mocks):
+        """
+        Ensure exec waits for a container and does not retry against a cached listing
+        """
+        time_mock = mocks[0]
+        time_mock.time.return_value = 0
+
+        argv = shlex.split('-e test service --service-name stack_app exec app /bin/bash')
+        workflow = Workflow(argv=argv)
+
+        # task listings are streamed line by line, node inspects are read in full
+        self.run_mock.side_effect = [
+            [],
+            [get_task_line('Preparing')],
+            [get_task_line('Running')],
+            mock.Mock(stdout=get_node_inspect('node1', '10.0.0.1')),
+            mock.Mock(),
+        ]
+
+        workflow.run()
+
+        self.assertEqual(4, len(self.get_run_calls('docker')))
+        self.assertEqual(2, time_mock.sleep.call_count)
+
+        ssh_args = ' '.join(self.get_run_calls('ssh')[0])
+        self.assertRegex(ssh_args, r'@10\.0\.0\.1 docker exec .* stack_app\.1\.abc /bin/bash')
+
+    @mock.patch('compose_flow.commands.subcommands.service.time')
+    def test_exec_no_wait_after_last_attempt(self, *mocks):
+        """
+        Ensure exec gives up without waiting once the last attempt fails
+        """
+        time_mock = mocks[0]
+        time_mock.time.return_value = 0
+
+        argv = shlex.split('-e test service --service-name stack_app exec --retries 3 app /bin/bash')
+        workflow = Workflow(argv=argv)
+
+        self.run_mock.return_value = []
+
+        self.assertRaises(SystemExit, workflow.run)
+
+        self.assertEqual(3, len(self.get_run_calls('docker')))
+        self.assertEqual(2, time_mock.sleep.call_count)
+
+    def test_node_addresses_cached(self, *mocks):
+        """
+        Ensure node addresses are looked up once and then served from the cache
+        """
+        workflow = Workflow(argv=shlex.split('-e test service list app'))
+        service = workflow.subcommand
+
+        self.run_mock.return_value = mock.Mock(stdout=get_node_inspect('node1', '10.0.0.1'))
+
+        self.assertEqual('10.0.0.1', service.get_node_addresses(['node1'])['node1'])
+        self.assertEqual('10.0.0.1', service.get_node_addresses(['node1'])['node1'])
+
+        self.assertEqual([['docker', 'node', 'inspect', 'node1']], self.get_run_calls('docker'))
+
+    def test_node_addresses_single_inspect(self, *mocks):
+        """
+        Ensure all the nodes are inspected with a single command
+        """
+        workflow = Workflow(argv=shlex.split('-e test service list app'))
+        service = workflow.subcommand
+
+        nodes = [json.loads(get_node_inspect(f'node{x}', f'10.0.0.{x}'))[0] for x in range(5)]
+        self.run_mock.return_value = mock.Mock(stdout=json.dumps(nodes).encode('utf8'))
+
+        with self.assertMaxSpawns(1):
+            addresses = service.get_node_addresses([f'node{x}' for x in range(5)])
+
+        self.assertEqual('10.0.0.4', addresses['node4'])
+
+    def test_ssh_host_fallback(self, *mocks):
+        """
+        Ensure the AWS-style hostname is used when the node cannot be inspected
+        """
+        workflow = Workflow(argv=shlex.split('-e test service list app'))
+        service = workflow.subcommand
+
+        self.run_mock.side_effect = shell.ErrorReturnCode_1('docker node inspect', b'', b'')
+
+        self.assertEqual('10.0.0.2', service.get_ssh_host({'Node': 'ip-10-0-0-2'}))
+        self.assertEqual('10.0.0.2', service.get_ssh_host({'Node': 'ip-10-0-0-2'}))
+
+        # the failed inspect is not run again for every task
+        self.assertEqual(1, len(self.get_run_calls('docker')))
+
+    @mock.patch('compose_flow.commands.subcommands.service.time')
+    def test_node_addresses_expire_per_entry(self, *mocks):
+        """
+        Ensure looking up a new node does not extend the life of the other cached addresses
+        """
+        time_mock = mocks[0]
+
+        workflow = Workflow(argv=shlex.split('-e test service list app'))
+        service = workflow.subcommand
+
+        self.run_mock.side_effect = lambda argv, env, **kwargs: mock.Mock(
+            stdout=get_node_inspect(argv[-1], '10.0.0.1' if time_mock.time.return_value < 300 else '10.0.0.9')
+        )
+
+        time_mock.time.return_value = 0
+        service.get_node_addresses(['node1'])
+
+        time_mock.time.return_value = 200
+        service.get_node_addresses(['node2'])
+
+        # node1 expired even though node2 was written since
+        time_mock.time.return_value = 400
+        self.assertEqual('10.0.0.9', service.get_node_addresses(['node1', 'node2'])['node1'])
+
+    @mock.patch('compose_flow.commands.subcommands.service.logs.LogMerger')
+    def test_logs_streams_every_task(self, *mocks):
+        """
+        Ensure a stream is opened to each task's node with the filter applied remotely
+        """
+        merger_mock = mocks[0]
+        merger_mock.return_value.run.return_value = 0
+
+        argv = shlex.split('-e test service --service-name stack_app logs --grep ERROR')
+        workflow = Workflow(argv=argv)
+
+        tasks = [
+            {'ID': 'abc', 'Name': 'stack_app.1', 'Node': 'node1'},
+            {'ID': 'def', 'Name': 'stack_app.2', 'Node': 'node2'},
+        ]
+
+        service = workflow.subcommand
+        service.list_containers = mock.Mock(return_value=tasks)
+        service.get_node_addresses = mock.Mock(
+            return_value={'node1': '10.0.0.1', 'node2': '10.0.0.2'}
+        )
+
+        workflow.run()
+
+        add_stream_calls = merger_mock.return_value.add_stream.mock_calls
+        self.assertEqual(2, len(add_stream_calls))
+
+        label, command = add_stream_calls[1][1]
+        self.assertEqual('stack_app.2@node2', label)
+        self.assertTrue(command[-2].endswith('@10.0.0.2'))
+        self.assertRegex(command[-1], r'docker logs --timestamps stack_app\.2\.def .* grep .* ERROR')
@@ -1,9 +1,14 @@
+import sys
+import time
+
 from unittest import TestCase, mock
 
 from compose_flow import shell
 
 from tests import BaseTestCase
 
+PYTHON = sys.executable
+
 
 class ShellTestCase(BaseTestCase):
     @mock.patch('compose_flow.shell.OS_ENV_INCLUDES', new_callable=dict)
@@ -15,4 +20,108 @@ class ShellTestCase(BaseTestCase):
 
         shell.execute('docker ps', env)
 
-        self.sh_mock.docker.assert_called_with('ps', _env=env)
+        self.run_mock.assert_called_with(['docker', 'ps'], env)
+
+    @mock.patch('compose_flow.shell.OS_ENV_INCLUDES', new_callable=dict)
+    def test_execute_argv(self, *mocks):
+        """
+        Ensure an argv list is run as-is rather than split
+        """
+        shell.execute(['docker', 'exec', 'it', 'echo "a b"'], {})
+
+        self.run_mock.assert_called_with(['docker', 'exec', 'it', 'echo "a b"'], {})
+
+
+class RunTestCase(TestCase):
+    """
+    Runs actual commands
+    """
+
+    def test_capture(self, *mocks):
+        proc = shell.run([PYTHON, '-c', 'import sys; print("out"); print("err", file=sys.stderr)'], {})
+
+        self.assertEqual(0, proc.exit_code)
+        self.assertEqual(b'out\n', proc.stdout)
+        self.assertEqual(b'err\n', proc.stderr)
+        self.assertEqual('out\n', str(proc))
+
+    def test_env_and_input(self, *mocks):
+        proc = shell.run(
+            [PYTHON, '-c', 'import os, sys; print(os.environ["FOO"] + sys.stdin.read())'],
+            {'FOO': 'foo'},
+            _in='bar',
+        )
+
+        self.assertEqual(b'foobar\n', proc.stdout)
+
+    def test_err_to_out(self, *mocks):
+        proc = shell.run(
+            [PYTHON, '-c', 'import sys; print("err", file=sys.stderr)'], {}, _err_to_out=True
+        )
+
+        self.assertEqual(b'err\n', proc.stdout)
+
+    def test_error_return_code(self, *mocks):
+        """
+        Ensure the error class is specific to the exit code and carries the output
+        """
+        with self.assertRaises(shell.ErrorReturnCode_1) as context:
+            shell.run([PYTHON, '-c', 'import sys; sys.exit("no such config")'], {})
+
+        self.assertEqual(1, context.exception.exit_code)
+        self.assertEqual(b'no such config\n', context.exception.stderr)
+        self.assertIn('no such config', str(context.exception))
+
+        with self.assertRaises(shell.ErrorReturnCode) as context:
+            shell.run([PYTHON, '-c', 'import sys; sys.exit(3)'], {})
+
+        self.assertEqual('ErrorReturnCode_3', context.exception.__class__.__name__)
+        self.assertIs(shell.get_error_class(3), context.exception.__class__)
+
+    def test_iter(self, *mocks):
+        lines = shell.run([PYTHON, '-c', 'print("a"); print("b")'], {}, _iter=True)
+
+        self.assertEqual(['a\n', 'b\n'], list(lines))
+
+    def test_iter_error(self, *mocks):
+        lines = shell.run(
+            [PYTHON, '-c', 'import sys; print("a"); sys.exit("failed")'], {}, _iter=True
+        )
+
+        self.assertEqual('a\n', next(lines))
+
+        with self.assertRaises(shell.ErrorReturnCode_1) as context:
+            next(lines)
+
+        self.assertEqual(b'failed\n', context.exception.stderr)
+
+    def test_timeout(self, *mocks):
+        start = time.monotonic()
+
+        with self.assertRaises(shell.TimeoutException):
+            shell.run([PYTHON, '-c', 'import time; time.sleep(30)'], {}, _timeout=0.2)
+
+        self.assertLess(time.monotonic() - start, 10)
+
+    def test_execute_many(self, *mocks):
+        commands = [[PYTHON, '-c', f'print({x})'] for x in range(5)]
+
+        results = shell.execute_many(commands, {}, jobs=3)
+
+        self.assertEqual([f'{x}\n'.encode('utf8') for x in range(5)], [x.stdout for x in results])
+
+    def test_execute_many_cancels(self, *mocks):
+        """
+        Ensure a failure kills the commands that are still running
+        """
+        commands = [
+            [PYTHON, '-c', 'import time; time.sleep(30)'],
+            [PYTHON, '-c', 'import sys; sys.exit(2)'],
+        ]
+
+        start = time.monotonic()
+
+        with self.assertRaises(shell.get_error_class(2)):
+            shell.execute_many(commands, {}, jobs=2)
+
+        self.assertLess(time.monotonic() - start, 10)
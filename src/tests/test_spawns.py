@@ -0,0 +1,56 @@
+import io
+import shlex
+
+from unittest import mock
+
+from compose_flow import shell, spawns
+from compose_flow.commands import Workflow
+
+from tests import BaseTestCase
+
+
+class SpawnsTestCase(BaseTestCase):
+    def test_records_executed_commands(self, *mocks):
+        spawns.reset()
+
+        shell.execute('docker service ls', {})
+        shell.execute(['docker', 'service', 'inspect', 'a'], {})
+        shell.execute('ssh -T host docker ps', {})
+
+        self.assertEqual(3, len(spawns.get_spawns()))
+        self.assertEqual([('docker service', 2), ('ssh host', 1)], spawns.get_summary())
+
+    def test_print_report(self, *mocks):
+        spawns.reset()
+
+        shell.execute('pgrep -f ssh', {})
+
+        fh = io.StringIO()
+        spawns.print_report(fh=fh)
+
+        self.assertRegex(fh.getvalue(), r'pgrep ssh\s+1')
+        self.assertRegex(fh.getvalue(), r'total\s+1')
+
+    def test_assert_max_spawns(self, *mocks):
+        """
+        Ensure the test helper fails when too many commands are run
+        """
+        with self.assertRaises(AssertionError):
+            with self.assertMaxSpawns(1):
+                shell.execute('docker node inspect a', {})
+                shell.execute('docker node inspect b', {})
+
+        with self.assertMaxSpawns(0, program='ssh'):
+            shell.execute('docker node inspect a', {})
+
+    @mock.patch('compose_flow.commands.workflow.sys')
+    def test_spawn_report_option(self, *mocks):
+        sys_mock = mocks[0]
+        sys_mock.stderr = io.StringIO()
+
+        self.run_mock.return_value = []
+
+        workflow = Workflow(argv=shlex.split('--spawn-report -e test swarm inspect'))
+        workflow.run()
+
+        self.assertRegex(sys_mock.stderr.getvalue(), r'docker service\s+1')
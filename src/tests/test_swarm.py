@@ -0,0 +1,45 @@
+import json
+import shlex
+
+from unittest import mock
+
+from compose_flow.commands import Workflow
+
+from tests import BaseTestCase
+
+
+def get_service_config(name: str) -> str:
+    config = {
+        'Spec': {
+            'Name': name,
+            'Mode': {'Replicated': {'Replicas': 1}},
+            'TaskTemplate': {'Placement': {}, 'Resources': {}},
+        }
+    }
+
+    return f'{json.dumps(config)}\n'
+
+
+@mock.patch('compose_flow.commands.subcommands.swarm.INSPECT_BATCH_SIZE', new=2)
+class SwarmTestCase(BaseTestCase):
+    def test_inspect_batches(self, *mocks):
+        """
+        Ensure services are inspected in batches rather than one call per service
+        """
+        names = ['stack_a', 'stack_b', 'stack_c']
+
+        def run(argv, env, **kwargs):
+            if argv[:3] == ['docker', 'service', 'ls']:
+                return [f'{json.dumps({"Name": x})}\n' for x in names]
+
+            return [get_service_config(x) for x in argv[3:] if x.startswith('stack_')]
+
+        self.run_mock.side_effect = run
+
+        workflow = Workflow(argv=shlex.split('-e test swarm inspect'))
+
+        # one call to list the services and one per batch
+        with self.assertMaxSpawns(3):
+            service_configs = workflow.subcommand.get_service_configs()
+
+        self.assertEqual(names, [x['Spec']['Name'] for x in service_configs])
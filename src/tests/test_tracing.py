@@ -0,0 +1,132 @@
+import io
+import json
+import os
+import shlex
+import sys
+import tempfile
+
+from unittest import TestCase, mock
+
+from compose_flow import shell, tracing
+from compose_flow.commands import Workflow
+
+from tests import BaseTestCase
+
+
+class TracingTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        tracing.enable()
+
+    def tearDown(self):
+        tracing.disable()
+
+        super().tearDown()
+
+    def test_disabled(self, *mocks):
+        """
+        Ensure nothing is recorded unless tracing is enabled
+        """
+        tracing.disable()
+
+        with tracing.span('setup_remote'):
+            pass
+
+        tracing.enable()
+
+        self.assertEqual([], tracing.get_spans())
+
+    def test_error(self, *mocks):
+        """
+        Ensure a span is recorded along with the error when the block raises
+        """
+        with self.assertRaises(ValueError):
+            with tracing.span('handle'):
+                raise ValueError('nope')
+
+        span = tracing.get_spans()[0]
+
+        self.assertEqual('handle', span.name)
+        self.assertEqual({'error': 'ValueError'}, span.args)
+
+    def test_exec_spans(self, *mocks):
+        """
+        Ensure every command is recorded with its argv and exit code
+        """
+        shell.run([sys.executable, '-c', 'pass'], {})
+
+        with self.assertRaises(shell.ErrorReturnCode):
+            shell.run([sys.executable, '-c', 'import sys; sys.exit(2)'], {})
+
+        list(shell.run([sys.executable, '-c', 'print(1)'], {}, _iter=True))
+
+        spans = tracing.get_spans()
+
+        self.assertEqual(['exec'] * 3, [x.category for x in spans])
+        self.assertEqual([0, 2, 0], [x.args['exit_code'] for x in spans])
+        self.assertEqual([sys.executable, '-c', 'pass'], spans[0].args['argv'])
+
+    def test_summary(self, *mocks):
+        for _ in range(2):
+            with tracing.span('docker', 'exec'):
+                pass
+
+        fh = io.StringIO()
+        tracing.print_summary(fh=fh)
+
+        summary = tracing.get_summary()
+
+        self.assertEqual(1, len(summary))
+        self.assertEqual(2, summary[0]['count'])
+        self.assertIn('docker', fh.getvalue())
+
+    def test_trace_events(self, *mocks):
+        with tracing.span('setup_profile'):
+            pass
+
+        events = tracing.get_trace_events()['traceEvents']
+
+        self.assertEqual(1, len(events))
+        self.assertEqual('X', events[0]['ph'])
+        self.assertEqual('setup_profile', events[0]['name'])
+        self.assertEqual(os.getpid(), events[0]['pid'])
+
+
+class WorkflowTracingTestCase(BaseTestCase):
+    def test_trace_file(self, *mocks):
+        """
+        Ensure --trace writes out every phase of the run
+        """
+        self.run_mock.return_value = []
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'trace.json')
+
+            workflow = Workflow(argv=shlex.split(f'--trace {path} -e test swarm inspect'))
+            workflow.run()
+
+            with open(path, 'r') as fh:
+                trace = json.load(fh)
+
+        self.assertEqual(
+            ['setup_environment', 'setup_remote', 'setup_profile', 'handle'],
+            [x['name'] for x in trace['traceEvents'] if x['cat'] == 'phase'],
+        )
+
+        self.assertEqual(False, tracing.is_enabled())
+
+    @mock.patch('compose_flow.commands.workflow.sys')
+    def test_timings(self, *mocks):
+        """
+        Ensure --timings prints the summary table to stderr
+        """
+        sys_mock = mocks[0]
+        sys_mock.stderr = io.StringIO()
+
+        self.run_mock.return_value = []
+
+        workflow = Workflow(argv=shlex.split('--timings -e test swarm inspect'))
+        workflow.run()
+
+        self.assertIn('setup_remote', sys_mock.stderr.getvalue())
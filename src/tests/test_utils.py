@@ -1,6 +1,7 @@
-from unittest import TestCase
+from unittest import TestCase, mock
 
 from compose_flow import utils
+from compose_flow.errors import TagVersionError
 
 
 class RenderTestCase(TestCase):
@@ -16,3 +17,51 @@ class RenderTestCase(TestCase):
         expected = f'      - /tmp/jenkins/{env["JOB_NAME"]}/{env["BUILD_NUMBER"]}:/usr/local/src/results'
 
         self.assertEqual(expected, rendered)
+
+
+class BackoffDelaysTestCase(TestCase):
+    def test_delays_increase_and_cap(self, *mocks):
+        delays = list(utils.backoff_delays(8, base=1.0, cap=4.0))
+
+        self.assertEqual(8, len(delays))
+
+        for idx, delay in enumerate(delays):
+            expected = min(4.0, 2 ** idx)
+
+            self.assertGreaterEqual(delay, expected / 2)
+            self.assertLessEqual(delay, expected)
+
+
+@mock.patch('compose_flow.utils.git')
+class GetTagVersionTestCase(TestCase):
+    def test_git_version(self, *mocks):
+        git_mock = mocks[0]
+        git_mock.find_repo.return_value.is_clean.return_value = (True, [])
+        git_mock.find_repo.return_value.tag_version.return_value = '1.0.0'
+
+        self.assertEqual('1.0.0', utils.get_tag_version())
+
+    def test_dirty(self, *mocks):
+        git_mock = mocks[0]
+        git_mock.find_repo.return_value.is_clean.return_value = (False, [' M README.md'])
+
+        with self.assertRaises(TagVersionError) as context:
+            utils.get_tag_version(default='dev')
+
+        self.assertEqual('dev-dirty', context.exception.tag_version)
+
+    @mock.patch('compose_flow.utils.shell')
+    def test_falls_back_to_cli(self, *mocks):
+        """
+        Ensure the tag-version cli is used when the repo cannot be read
+        """
+        shell_mock = mocks[0]
+        shell_mock.ErrorReturnCode = OSError
+        shell_mock.execute.return_value.stdout = b'1.0.0\n'
+
+        git_mock = mocks[1]
+        git_mock.find_repo.return_value.is_clean.side_effect = ValueError('unsupported index version=5')
+
+        self.assertEqual('1.0.0', utils.get_tag_version())
+
+        shell_mock.execute.assert_called_with('tag-version', mock.ANY)